@@ -0,0 +1,37 @@
+# products_service/app/admin_router.py
+"""
+Operaciones internas para administradores.
+
+users_service (o un administrador) debe llamar a las de usuarios después de
+desactivar una cuenta o cambiar sus privilegios; sin esa llamada, el cambio
+tarda hasta USER_CACHE_TTL_SECONDS en verse aquí (salvo con el bus
+"changestream" sobre la misma base, que lo detecta solo). La invalidación
+se difunde a los demás workers por el bus configurado.
+"""
+from fastapi import APIRouter, Depends, Response, status
+
+from common.models import UserInDB
+from .cache import cache_stats, invalidate_all_users, invalidate_user
+from .dependencies import get_current_active_superuser
+
+router = APIRouter()
+
+
+@router.post("/cache/users/{user_id}/invalidate", status_code=status.HTTP_204_NO_CONTENT)
+async def invalidate_cached_user(user_id: str, admin: UserInDB = Depends(get_current_active_superuser)):
+    """Descarta el usuario cacheado: la próxima petición con su token lo relee de la base."""
+    invalidate_user(user_id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.post("/cache/users/invalidate", status_code=status.HTTP_204_NO_CONTENT)
+async def invalidate_cached_users(admin: UserInDB = Depends(get_current_active_superuser)):
+    """Descarta todos los usuarios y tokens cacheados (p. ej. tras un cambio masivo de roles)."""
+    invalidate_all_users()
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.get("/cache/stats")
+async def get_cache_stats(admin: UserInDB = Depends(get_current_active_superuser)):
+    """Tamaño y aciertos de las cachés de este worker."""
+    return cache_stats()
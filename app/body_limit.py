@@ -0,0 +1,55 @@
+# products_service/app/body_limit.py
+"""
+Límite de tamaño del cuerpo de la petición, por ruta, antes de leerlo.
+
+Starlette guarda el multipart completo (en memoria o en un temporal) antes de
+llamar al endpoint, así que el control de `image_service` llega tarde para un
+archivo enorme. Este middleware rechaza con 413:
+- de inmediato, si `Content-Length` ya supera el límite;
+- en cuanto lo recibido lo supera (cuerpos sin `Content-Length` o que mienten),
+  lanzando `HTTPException` desde `receive`: FastAPI la propaga tal cual
+  mientras interpreta el formulario y deja de leer.
+"""
+from typing import Dict
+
+from fastapi import HTTPException, status
+from starlette.responses import JSONResponse
+
+# Margen para las cabeceras y delimitadores del multipart alrededor del archivo
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+def _too_large(limit: int) -> str:
+    return f"El cuerpo de la petición supera el máximo de {limit} bytes"
+
+
+class BodySizeLimitMiddleware:
+    """Middleware ASGI: `limits` asocia rutas exactas con su máximo de bytes."""
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            response = JSONResponse({"detail": _too_large(limit)}, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=_too_large(limit))
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,207 @@
+# products_service/app/cache.py
+"""
+Cachés en memoria del proceso (LRU acotado con expiración por entrada).
+
+Cada worker mantiene sus propias instancias; las funciones `invalidate_*`
+son los puntos de entrada para descartar datos que cambiaron. Además de
+aplicarse localmente, se publican en el bus de invalidación (si hay uno
+configurado, ver app/invalidation_bus.py) para que los demás workers también
+las apliquen.
+"""
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Hashable, Optional
+
+from prometheus_client import Counter
+
+from .config import settings
+
+CACHE_REQUESTS = Counter(
+    "app_cache_requests_total",
+    "Consultas a las cachés en memoria, por caché y resultado (hit/miss).",
+    ["cache", "result"],
+)
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Caché LRU acotada en tamaño donde cada entrada expira tras su TTL."""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                CACHE_REQUESTS.labels(self.name, "hit").inc()
+                return entry[1]
+            if entry is not _MISSING:
+                del self._data[key]
+            self.misses += 1
+        CACHE_REQUESTS.labels(self.name, "miss").inc()
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Guarda `value`; `ttl` permite acortar la vida de esta entrada concreta."""
+        if self.maxsize <= 0:
+            return
+        lifetime = self.ttl if ttl is None else min(ttl, self.ttl)
+        if lifetime <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + lifetime, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def pop_prefix(self, prefix: tuple) -> None:
+        """Elimina las entradas cuya clave (tupla) empieza por `prefix`."""
+        n = len(prefix)
+        with self._lock:
+            for key in [k for k in self._data if isinstance(k, tuple) and k[:n] == prefix]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+# --- Autenticación ---
+# Usuarios por `sub`; el TTL acota cuánto tarda en verse una desactivación
+# o un cambio de privilegios hecho por users_service si este no llama a
+# `POST /api/v1/admin/cache/users/{id}/invalidate` (ver app/admin_router.py).
+user_cache = TTLCache("users", settings.USER_CACHE_MAX_SIZE, settings.USER_CACHE_TTL_SECONDS)
+# Payloads de tokens ya verificados; cada entrada vive como máximo hasta su `exp`.
+token_cache = TTLCache("tokens", settings.TOKEN_CACHE_MAX_SIZE, settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+
+def _drop_user(user_id: Optional[str]) -> None:
+    if user_id is None:
+        user_cache.clear()
+        token_cache.clear()
+    else:
+        user_cache.pop(str(user_id))
+
+
+def invalidate_user(user_id: str) -> None:
+    """Descarta el usuario cacheado para que la próxima petición lo relea de la DB."""
+    _drop_user(str(user_id))
+    _publish("user", str(user_id))
+
+
+def invalidate_all_users() -> None:
+    """Descarta todos los usuarios y tokens cacheados."""
+    _drop_user(None)
+    _publish("users")
+
+
+# --- Productos ---
+# Conteos exactos por forma de consulta del listado (ver product_service.count_products).
+count_cache = TTLCache("product_counts", settings.COUNT_CACHE_MAX_SIZE, settings.COUNT_CACHE_TTL_SECONDS)
+def response_cache_ttl() -> float:
+    """
+    RESPONSE_CACHE_TTL_SECONDS, pero sin superar MONGO_MAX_STALENESS_SECONDS si las
+    respuestas se leen de secundarios: una lectura atrasada justo después de una
+    invalidación queda en la caché como mucho ese tiempo.
+    """
+    ttl = settings.RESPONSE_CACHE_TTL_SECONDS
+    from_secondaries = settings.MONGO_READ_PREFERENCE != "primary" and not settings.RESPONSE_CACHE_PRIMARY_READS
+    if from_secondaries and settings.MONGO_MAX_STALENESS_SECONDS > 0:
+        ttl = min(ttl, settings.MONGO_MAX_STALENESS_SECONDS)
+    return ttl
+
+# Respuestas JSON ya serializadas de las lecturas públicas (ver app/http_cache.py).
+# Claves: ("detail", product_id, ...) y ("list", generación, parámetros).
+response_cache = TTLCache("responses", settings.RESPONSE_CACHE_MAX_SIZE, response_cache_ttl())
+
+# Se incrementa con cada escritura; las entradas de listados de generaciones
+# anteriores dejan de consultarse y salen por LRU o TTL.
+_listing_generation = 0
+
+
+def listing_generation() -> int:
+    return _listing_generation
+
+
+def _drop_products(product_id: Optional[str]) -> None:
+    global _listing_generation
+    count_cache.clear()
+    _listing_generation += 1
+    if product_id is None:
+        response_cache.clear()
+    else:
+        response_cache.pop_prefix(("detail", str(product_id)))
+
+
+def invalidate_products(product_id: Optional[str] = None) -> None:
+    """Descarta lo cacheado que depende de los productos tras una escritura."""
+    _drop_products(product_id)
+    _publish("product" if product_id is not None else "products", product_id)
+
+
+# --- Propagación entre workers ---
+_publisher: Optional[Callable[[dict], None]] = None
+
+
+def set_publisher(publisher: Optional[Callable[[dict], None]]) -> None:
+    """Registra (o quita, con None) la función que difunde las invalidaciones."""
+    global _publisher
+    _publisher = publisher
+
+
+def _publish(kind: str, entity_id: Optional[str] = None) -> None:
+    if _publisher is not None:
+        _publisher({"kind": kind, "id": entity_id})
+
+
+def apply_invalidation(message: dict) -> None:
+    """Aplica localmente (sin volver a publicarla) una invalidación recibida de otro worker."""
+    kind = message.get("kind")
+    if kind == "product":
+        _drop_products(message.get("id"))
+    elif kind == "products":
+        _drop_products(None)
+    elif kind == "user":
+        _drop_user(message.get("id"))
+    elif kind == "users":
+        _drop_user(None)
+
+
+def clear_all() -> None:
+    """Vacía todas las cachés locales (p. ej. si se pudieron perder invalidaciones)."""
+    _drop_user(None)
+    _drop_products(None)
+
+
+def cache_stats() -> list:
+    return [user_cache.stats(), token_cache.stats(), count_cache.stats(), response_cache.stats()]
@@ -0,0 +1,218 @@
+# products_service/app/catalog_io.py
+"""
+Importación y exportación masiva del catálogo en NDJSON o CSV.
+
+La importación lee el archivo subido por bloques, valida cada fila contra
+`ProductCreate` y escribe en lotes con `bulk_write` no ordenado; los errores
+(de validación o de escritura) se informan por número de línea sin detener el
+resto. La exportación recorre un cursor de Motor y emite el archivo por
+lotes. En ningún sentido se carga el archivo o la colección completa en memoria.
+"""
+import codecs
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+
+import orjson
+from fastapi import UploadFile
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import ValidationError
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
+
+from common.models import ProductCreate, ProductRead, PyObjectId
+from . import facets
+from .cache import invalidate_products
+from .config import settings
+from .fast_json import product_to_dict
+from .product_service import PRODUCT_COLLECTION, PRODUCT_PROJECTION, build_product_doc
+
+CHUNK_SIZE = 64 * 1024
+MAX_REPORTED_ERRORS = 1000
+# En CSV las listas van separadas por "|" y los diccionarios como JSON
+CSV_LIST_SEPARATOR = "|"
+CSV_COLUMNS = [field.alias or name for name, field in ProductRead.model_fields.items()]
+
+Row = Tuple[int, Union[dict, str]]  # (línea, datos o mensaje de error de formato)
+
+
+class ImportTooLargeError(Exception):
+    """El archivo supera IMPORT_MAX_ROWS filas."""
+
+
+async def _iter_lines(file: UploadFile) -> AsyncIterator[str]:
+    """Líneas del archivo subido (sin el salto de línea), decodificadas por bloques."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    while chunk := await file.read(CHUNK_SIZE):
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def _iter_ndjson_rows(file: UploadFile) -> AsyncIterator[Row]:
+    line_no = 0
+    async for line in _iter_lines(file):
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            data = orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            yield line_no, f"JSON inválido: {e}"
+            continue
+        yield line_no, data if isinstance(data, dict) else "Cada línea debe ser un objeto JSON"
+
+
+def _csv_value(column: str, value: str):
+    if value == "":
+        return None
+    if column == "tags":
+        return [tag.strip() for tag in value.split(CSV_LIST_SEPARATOR) if tag.strip()]
+    if column == "image_variants":
+        return json.loads(value)
+    return value
+
+
+async def _iter_csv_rows(file: UploadFile) -> AsyncIterator[Row]:
+    """Filas del CSV con encabezado; admite campos entre comillas con saltos de línea."""
+    header: Optional[List[str]] = None
+    record, start_line, line_no = "", 0, 0
+    async for line in _iter_lines(file):
+        line_no += 1
+        record = f"{record}\n{line}" if record else line
+        start_line = start_line or line_no
+        if record.count('"') % 2:
+            continue  # comillas abiertas: el registro sigue en la línea siguiente
+        values = next(csv.reader([record]), [])
+        record, row_line, start_line = "", start_line, 0
+        if not any(v.strip() for v in values):
+            continue
+        if header is None:
+            header = [column.strip() for column in values]
+            continue
+        if len(values) != len(header):
+            yield row_line, f"Se esperaban {len(header)} columnas y hay {len(values)}"
+            continue
+        try:
+            yield row_line, {column: _csv_value(column, value) for column, value in zip(header, values)}
+        except ValueError as e:
+            yield row_line, f"Valor inválido: {e}"
+    if record:
+        yield start_line, "Comillas sin cerrar al final del archivo"
+
+
+def iter_rows(file: UploadFile, format: str) -> AsyncIterator[Row]:
+    return _iter_csv_rows(file) if format == "csv" else _iter_ndjson_rows(file)
+
+
+async def import_products(db: AsyncIOMotorDatabase, rows: AsyncIterator[Row], owner_id: PyObjectId) -> dict:
+    """
+    Inserta las filas válidas en lotes de `IMPORT_CHUNK_SIZE` con `bulk_write` no ordenado.
+    Devuelve `{"inserted", "failed", "errors": [{"line", "errors"}]}` (como máximo
+    MAX_REPORTED_ERRORS errores detallados). Lanza `ImportTooLargeError` si el archivo
+    supera IMPORT_MAX_ROWS filas; lo ya escrito se conserva y se informa en el mensaje.
+    """
+    report = {"inserted": 0, "failed": 0, "errors": []}
+    collection = db[PRODUCT_COLLECTION]
+
+    def fail(line: int, errors) -> None:
+        report["failed"] += 1
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            report["errors"].append({"line": line, "errors": errors})
+
+    async def flush(chunk: List[Tuple[int, dict]]) -> None:
+        failed = set()
+        try:
+            result = await collection.bulk_write([InsertOne(doc) for _, doc in chunk], ordered=False)
+            report["inserted"] += result.inserted_count
+        except BulkWriteError as e:
+            report["inserted"] += e.details.get("nInserted", 0)
+            for error in e.details.get("writeErrors", []):
+                failed.add(error["index"])
+                fail(chunk[error["index"]][0], [error.get("errmsg", "Error de escritura")])
+        await facets.record_changes(db, [(None, doc) for i, (_, doc) in enumerate(chunk) if i not in failed])
+
+    chunk: List[Tuple[int, dict]] = []
+    seen = 0
+    try:
+        async for line, data in rows:
+            seen += 1
+            if seen > settings.IMPORT_MAX_ROWS:
+                if chunk:
+                    await flush(chunk)
+                raise ImportTooLargeError(
+                    f"El archivo supera el máximo de {settings.IMPORT_MAX_ROWS} filas "
+                    f"(se importaron {report['inserted']} antes de detenerse)"
+                )
+            if isinstance(data, str):
+                fail(line, [data])
+                continue
+            try:
+                product_in = ProductCreate.model_validate(data)
+            except ValidationError as e:
+                fail(line, [f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()])
+                continue
+            chunk.append((line, build_product_doc(product_in, owner_id)))
+            if len(chunk) >= settings.IMPORT_CHUNK_SIZE:
+                await flush(chunk)
+                chunk = []
+        if chunk:
+            await flush(chunk)
+    finally:
+        if report["inserted"]:
+            invalidate_products()
+    return report
+
+
+async def iter_export_docs(
+    db: AsyncIOMotorDatabase, query: Dict, batch_size: int = 500
+) -> AsyncIterator[List[dict]]:
+    """Productos que cumplen `query`, por `_id`, en lotes de `batch_size` documentos."""
+    cursor = db[PRODUCT_COLLECTION].find(query, PRODUCT_PROJECTION).sort("_id", 1).batch_size(batch_size)
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _csv_cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return CSV_LIST_SEPARATOR.join(map(str, value))
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+async def export_products(db: AsyncIOMotorDatabase, query: Dict, format: str) -> AsyncIterator[bytes]:
+    """Cuerpo del archivo de exportación, lote a lote (con encabezado en CSV)."""
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_COLUMNS)
+        async for batch in iter_export_docs(db, query):
+            for doc in batch:
+                product = product_to_dict(doc)
+                writer.writerow([_csv_cell(product[column]) for column in CSV_COLUMNS])
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+    else:
+        async for batch in iter_export_docs(db, query):
+            yield b"".join(orjson.dumps(product_to_dict(doc)) + b"\n" for doc in batch)
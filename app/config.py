@@ -16,6 +16,7 @@
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from functools import lru_cache
+from typing import Optional
 
 class Settings(BaseSettings):
     PROJECT_NAME: str
@@ -25,6 +26,111 @@ class Settings(BaseSettings):
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
 
+    # Conexión a MongoDB (ver dependencies.create_mongo_client); None = valor por defecto del driver
+    MONGO_MAX_POOL_SIZE: int = 100
+    MONGO_MIN_POOL_SIZE: int = 0
+    MONGO_MAX_IDLE_TIME_MS: Optional[int] = None
+    MONGO_CONNECT_TIMEOUT_MS: int = 10_000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 10_000
+    MONGO_SOCKET_TIMEOUT_MS: Optional[int] = None
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: Optional[int] = None
+    # Compresión del protocolo, en orden de preferencia: p. ej. "zstd,snappy,zlib"
+    MONGO_COMPRESSORS: str = ""
+    # Conexiones que se abren al arrancar para que las primeras peticiones no paguen el handshake
+    MONGO_WARMUP_CONNECTIONS: int = 0
+    # Lecturas públicas (listado, detalle, facetas, top, lote, calificaciones): "primary",
+    # "primaryPreferred", "secondary", "secondaryPreferred" o "nearest".
+    # Escrituras y pedidos van siempre al primario.
+    MONGO_READ_PREFERENCE: str = "primary"
+    # Retraso máximo tolerado de un secundario (>= 90 s; -1 = sin límite). También limita
+    # RESPONSE_CACHE_TTL_SECONDS cuando la caché de respuestas se llena desde secundarios.
+    MONGO_MAX_STALENESS_SECONDS: int = -1
+    # Las lecturas que llenan la caché de respuestas van al primario aunque
+    # MONGO_READ_PREFERENCE apunte a secundarios (sin datos atrasados en la caché)
+    RESPONSE_CACHE_PRIMARY_READS: bool = False
+
+    # Transacciones para los cambios de stock: "auto" (si hay replica set), "always" o "never"
+    USE_TRANSACTIONS: str = "auto"
+    # Tiempo que se conservan las respuestas asociadas a un `Idempotency-Key`
+    IDEMPOTENCY_TTL_SECONDS: int = 24 * 60 * 60
+    # Plazo de una petición en curso con `Idempotency-Key`: si no termina (el proceso cayó),
+    # un reintento toma la clave. Debe superar lo que puede durar una petición (WEB_TIMEOUT_SECONDS)
+    IDEMPOTENCY_LEASE_SECONDS: int = 120
+
+    # Reservas de stock del checkout (ver app/reservation_service.py); intervalo 0 = sin barrido
+    RESERVATION_TTL_SECONDS: float = 10 * 60
+    RESERVATION_SWEEP_INTERVAL_SECONDS: float = 5.0
+    RESERVATION_SWEEP_BATCH_SIZE: int = 500
+    # Una liberación que sigue en "releasing" pasado este plazo (su proceso cayó) la retoma el barrido
+    RESERVATION_RELEASE_TIMEOUT_SECONDS: float = 60.0
+
+    # Cachés de autenticación (ver app/cache.py)
+    USER_CACHE_TTL_SECONDS: float = 60.0
+    USER_CACHE_MAX_SIZE: int = 10_000
+    TOKEN_CACHE_MAX_SIZE: int = 10_000
+
+    # Búsqueda de productos: "keywords" (índice de palabras clave) o "regex" (legado)
+    SEARCH_BACKEND: str = "keywords"
+
+    # Conteo del listado: "exact", "cached", "estimated" o "facet" (ver product_service.count_products)
+    COUNT_STRATEGY: str = "exact"
+    COUNT_CACHE_TTL_SECONDS: float = 30.0
+    COUNT_CACHE_MAX_SIZE: int = 1_000
+
+    # Facetas del listado: límites inferiores de los rangos de precio (cambiarlos exige
+    # `manage.py facets rebuild`)
+    FACET_PRICE_BUCKETS: str = "0,5000,10000,20000,50000,100000"
+
+    # Orden "best": promedio bayesiano con BEST_SORT_PRIOR_WEIGHT calificaciones ficticias de
+    # BEST_SORT_PRIOR_MEAN (cambiarlos exige `manage.py top rebuild --rescore`)
+    BEST_SORT_PRIOR_MEAN: float = 3.0
+    BEST_SORT_PRIOR_WEIGHT: float = 5.0
+    # Productos por categoría en las listas "mejor calificados" (ver app/top_rated.py)
+    TOP_RATED_SIZE: int = 20
+
+    # Caché de respuestas de lectura de productos (detalle y listado)
+    RESPONSE_CACHE_TTL_SECONDS: float = 60.0
+    RESPONSE_CACHE_MAX_SIZE: int = 2_000
+    # Serializa el listado directamente desde los documentos con orjson (ver app/fast_json.py)
+    FAST_JSON_LISTING: bool = False
+
+    # Sincroniza los índices declarados en app/indexes.py al arrancar: una vez en el
+    # master de gunicorn (ver app/server.py) o en el lifespan de un proceso único
+    SYNC_INDEXES_ON_STARTUP: bool = True
+
+    # Subida de imágenes (ver app/image_service.py; el cuerpo se corta antes en app/body_limit.py)
+    MAX_UPLOAD_BYTES: int = 10 * 1024 * 1024
+    IMAGE_PROCESS_WORKERS: int = 2
+
+    # Presupuesto por petición: se registra la que lo supere (0 = sin límite, ver app/db_monitoring.py)
+    DB_ROUND_TRIP_BUDGET: int = 0
+    DB_TIME_BUDGET_MS: float = 0
+
+    # Importación masiva del catálogo (ver app/catalog_io.py)
+    IMPORT_CHUNK_SIZE: int = 500
+    IMPORT_MAX_ROWS: int = 50_000
+
+    # Bus de invalidación entre workers (ver app/invalidation_bus.py):
+    # "none", "memory", "capped" (colección capada) o "changestream". Con varios workers
+    # bajo gunicorn, si no se fija se usa "capped" y "none"/"memory" no arrancan
+    INVALIDATION_BUS_BACKEND: str = "none"
+    # Un mensaje que llega con más retraso vacía todas las cachés locales
+    INVALIDATION_BUS_MAX_LAG_SECONDS: float = 5.0
+    INVALIDATION_BUS_QUEUE_SIZE: int = 10_000
+    INVALIDATION_CAPPED_SIZE_BYTES: int = 16 * 1024 * 1024
+
+    # Modo producción con varios workers (ver gunicorn.conf.py). WEB_WORKERS=0 usa un
+    # worker por CPU; MONGO_MAX_POOL_SIZE y las cachés locales son por worker
+    WEB_WORKERS: int = 0
+    WEB_BIND: str = "0.0.0.0:8001"
+    # Segundos que un worker tiene para terminar sus peticiones al apagarse o recargarse
+    WEB_GRACEFUL_TIMEOUT_SECONDS: int = 30
+    WEB_TIMEOUT_SECONDS: int = 60
+    WEB_KEEPALIVE_SECONDS: int = 5
+    # Recicla cada worker tras N peticiones (0 = nunca), con un margen aleatorio
+    WEB_MAX_REQUESTS: int = 0
+    WEB_MAX_REQUESTS_JITTER: int = 0
+
     # Apunta a: proyecto root/.env
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -0,0 +1,162 @@
+# products_service/app/db_monitoring.py
+"""
+Métricas de los comandos que el servicio envía a MongoDB.
+
+- `DbCommandListener` (command monitoring de PyMongo) mide cada comando por
+  colección y operación (`app_db_command_duration_seconds`).
+- `DbStatsMiddleware` abre un contador por petición HTTP; el listener suma ahí
+  los viajes a la base y el tiempo invertido. Motor ejecuta PyMongo en hilos
+  pero copia el contexto de la corrutina, así que el `ContextVar` llega al listener.
+- `http_db_metrics()` es una instrumentación de prometheus-fastapi-instrumentator
+  que publica esos totales por ruta (`app_http_request_db_round_trips`,
+  `app_http_request_db_seconds`) junto a las métricas HTTP.
+
+Con `DB_ROUND_TRIP_BUDGET` o `DB_TIME_BUDGET_MS` se registra cada petición que
+supera el presupuesto, con la lista de comandos que ejecutó.
+"""
+from contextvars import ContextVar
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Tuple
+
+from prometheus_client import Histogram
+from prometheus_fastapi_instrumentator.metrics import Info
+from pymongo import monitoring
+
+from .config import settings
+
+DB_COMMAND_DURATION = Histogram(
+    "app_db_command_duration_seconds",
+    "Duración de los comandos enviados a MongoDB, por colección, operación y resultado.",
+    ["collection", "operation", "result"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+REQUEST_DB_ROUND_TRIPS = Histogram(
+    "app_http_request_db_round_trips",
+    "Comandos enviados a MongoDB por petición HTTP.",
+    ["method", "handler"],
+    buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 50),
+)
+REQUEST_DB_SECONDS = Histogram(
+    "app_http_request_db_seconds",
+    "Tiempo total en MongoDB por petición HTTP.",
+    ["method", "handler"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+# Comandos de sesión/administración del driver que no son trabajo de la petición
+IGNORED_COMMANDS = {"endSessions", "hello", "isMaster", "ismaster", "ping", "saslStart", "saslContinue"}
+MAX_LOGGED_COMMANDS = 50
+
+
+class RequestDbStats:
+    """Totales de una petición; lo actualizan varios hilos del executor de Motor."""
+
+    def __init__(self):
+        self.round_trips = 0
+        self.seconds = 0.0
+        self.commands: List[Tuple[str, float]] = []
+        self._lock = Lock()
+
+    def record(self, shape: str, seconds: float) -> None:
+        with self._lock:
+            self.round_trips += 1
+            self.seconds += seconds
+            if len(self.commands) < MAX_LOGGED_COMMANDS:
+                self.commands.append((shape, seconds))
+
+
+_current_stats: ContextVar[Optional[RequestDbStats]] = ContextVar("db_request_stats", default=None)
+
+
+def _shape(event: monitoring.CommandStartedEvent, collection: str) -> str:
+    """`colección.operación(claves del filtro)`, sin valores: agrupa consultas iguales."""
+    command = event.command
+    query = command.get("filter") or command.get("query")
+    if query is None and command.get("updates"):
+        query = command["updates"][0].get("q")
+    if query is None and command.get("pipeline"):
+        first = command["pipeline"][0]
+        query = first.get("$match") if isinstance(first, dict) else None
+    keys = ",".join(sorted(query)) if isinstance(query, dict) else ""
+    return f"{collection}.{event.command_name}({keys})"
+
+
+class DbCommandListener(monitoring.CommandListener):
+    def __init__(self):
+        # (connection_id, request_id) -> (colección, forma, stats de la petición)
+        self._pending: Dict[tuple, Tuple[str, str, Optional[RequestDbStats]]] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        target = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            target = event.command.get("collection")
+        collection = target if isinstance(target, str) else "-"
+        stats = _current_stats.get()
+        shape = _shape(event, collection) if stats is not None else ""
+        self._pending[(event.connection_id, event.request_id)] = (collection, shape, stats)
+
+    def _finished(self, event, result: str) -> None:
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending is None:
+            return
+        collection, shape, stats = pending
+        seconds = event.duration_micros / 1_000_000
+        DB_COMMAND_DURATION.labels(collection, event.command_name, result).observe(seconds)
+        if stats is not None:
+            stats.record(shape, seconds)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finished(event, "ok")
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finished(event, "error")
+
+
+listener = DbCommandListener()
+
+
+class DbStatsMiddleware:
+    """Middleware ASGI: un `RequestDbStats` por petición, accesible en `request.state.db_stats`."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestDbStats()
+        scope.setdefault("state", {})["db_stats"] = stats
+        token = _current_stats.set(stats)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_stats.reset(token)
+            _check_budget(scope, stats)
+
+
+def _check_budget(scope, stats: RequestDbStats) -> None:
+    over_trips = settings.DB_ROUND_TRIP_BUDGET and stats.round_trips > settings.DB_ROUND_TRIP_BUDGET
+    over_time = settings.DB_TIME_BUDGET_MS and stats.seconds * 1000 > settings.DB_TIME_BUDGET_MS
+    if not (over_trips or over_time):
+        return
+    commands = "; ".join(f"{shape} {seconds * 1000:.1f}ms" for shape, seconds in stats.commands)
+    print(
+        f"⚠️ {scope.get('method')} {scope.get('path')}: {stats.round_trips} viajes a MongoDB, "
+        f"{stats.seconds * 1000:.1f}ms en la base -> {commands}"
+    )
+
+
+def http_db_metrics() -> Callable[[Info], None]:
+    """Instrumentación para `Instrumentator.add(...)`: viajes y tiempo en la base por ruta."""
+
+    def instrumentation(info: Info) -> None:
+        stats = getattr(info.request.state, "db_stats", None)
+        if stats is None:
+            return
+        REQUEST_DB_ROUND_TRIPS.labels(info.method, info.modified_handler).observe(stats.round_trips)
+        REQUEST_DB_SECONDS.labels(info.method, info.modified_handler).observe(stats.seconds)
+
+    return instrumentation
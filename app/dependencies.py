@@ -4,15 +4,72 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorClient
 from bson import ObjectId
-from typing import Optional
+from pymongo import read_preferences
+from typing import Optional, Sequence
+import asyncio
+import time
 
 from .config import settings
 from common.models import UserInDB  # Importa el modelo de usuario desde common
 from .security import decode_access_token # Importa la función de seguridad local
+from .cache import response_cache, user_cache, token_cache
 
 # Variables globales para la conexión (manejadas por el lifespan en main.py)
 mongo_client: Optional[AsyncIOMotorClient] = None
 database_instance: Optional[AsyncIOMotorDatabase] = None
+# Misma base con MONGO_READ_PREFERENCE, para las lecturas públicas
+read_database_instance: Optional[AsyncIOMotorDatabase] = None
+
+_READ_PREFERENCES = {
+    "primary": read_preferences.Primary,
+    "primaryPreferred": read_preferences.PrimaryPreferred,
+    "secondary": read_preferences.Secondary,
+    "secondaryPreferred": read_preferences.SecondaryPreferred,
+    "nearest": read_preferences.Nearest,
+}
+
+def mongo_client_options() -> dict:
+    """Parámetros del pool, timeouts y compresión a partir de la configuración."""
+    options = {
+        "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": settings.MONGO_MAX_IDLE_TIME_MS,
+        "connectTimeoutMS": settings.MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "socketTimeoutMS": settings.MONGO_SOCKET_TIMEOUT_MS,
+        "waitQueueTimeoutMS": settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    }
+    if settings.MONGO_COMPRESSORS:
+        options["compressors"] = settings.MONGO_COMPRESSORS
+    return options
+
+def read_preference():
+    """Preferencia de lectura para `read_database_instance` (MONGO_READ_PREFERENCE / MAX_STALENESS)."""
+    mode = _READ_PREFERENCES.get(settings.MONGO_READ_PREFERENCE)
+    if mode is None:
+        raise ValueError(f"MONGO_READ_PREFERENCE desconocida: {settings.MONGO_READ_PREFERENCE}")
+    if mode is read_preferences.Primary:
+        return mode()
+    return mode(max_staleness=settings.MONGO_MAX_STALENESS_SECONDS)
+
+def create_mongo_client(event_listeners: Sequence = ()) -> AsyncIOMotorClient:
+    return AsyncIOMotorClient(settings.MONGO_URI, event_listeners=list(event_listeners), **mongo_client_options())
+
+async def warm_up_pool(client: AsyncIOMotorClient, connections: int) -> None:
+    """
+    Abre `connections` conexiones con pings concurrentes (cada ping ocupa una
+    conexión del pool, así que el driver crea las que falten), contra el
+    primario y, si las lecturas van a secundarios, también contra ellos.
+    """
+    if connections <= 0:
+        return
+    admin = client.admin
+    targets = [read_preferences.Primary()]
+    if settings.MONGO_READ_PREFERENCE != "primary":
+        targets.append(read_preference())
+    await asyncio.gather(*(
+        admin.command("ping", read_preference=target) for target in targets for _ in range(connections)
+    ))
 
 async def get_db() -> AsyncIOMotorDatabase:
     """Dependencia para obtener la sesión de la base de datos."""
@@ -20,6 +77,27 @@ async def get_db() -> AsyncIOMotorDatabase:
         raise HTTPException(status_code=503, detail="La base de datos no está disponible.")
     return database_instance
 
+async def get_read_db() -> AsyncIOMotorDatabase:
+    """
+    Base para lecturas que toleran datos ligeramente atrasados (listado, detalle).
+    Según MONGO_READ_PREFERENCE puede leer de un secundario; las escrituras y
+    las lecturas que las preparan deben usar `get_db`.
+    """
+    return read_database_instance if read_database_instance is not None else await get_db()
+
+async def get_cached_read_db() -> AsyncIOMotorDatabase:
+    """
+    Base para las lecturas cuya respuesta se guarda en `response_cache` (listado,
+    detalle, facetas, top). Siguen MONGO_READ_PREFERENCE como las demás lecturas
+    públicas: un secundario atrasado puede volver a cachear un dato viejo justo
+    después de una invalidación, por eso la caché no guarda nada más de
+    MONGO_MAX_STALENESS_SECONDS (ver `cache.response_cache_ttl`). Con
+    RESPONSE_CACHE_PRIMARY_READS y la caché activa van al primario.
+    """
+    if settings.RESPONSE_CACHE_PRIMARY_READS and response_cache.maxsize > 0 and response_cache.ttl > 0:
+        return await get_db()
+    return await get_read_db()
+
 async def get_products_collection(db: AsyncIOMotorDatabase = Depends(get_db)):
     """Dependencia para obtener la colección de productos."""
     return db["products"]
@@ -36,20 +114,37 @@ async def _get_user_by_id_from_db(db: AsyncIOMotorDatabase, user_id: str) -> Opt
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
 
+def _decode_token_cached(token: str) -> Optional[dict]:
+    """Verifica el JWT reutilizando el payload si ya se verificó y aún no expira."""
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+    payload = decode_access_token(token)
+    if payload is None:
+        return None
+    exp = payload.get("exp")
+    if exp is not None:
+        token_cache.set(token, payload, ttl=float(exp) - time.time())
+    return payload
+
 async def get_current_user(db: AsyncIOMotorDatabase = Depends(get_db), token: str = Depends(oauth2_scheme)) -> UserInDB:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudieron validar las credenciales",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    payload = decode_access_token(token)
+    payload = _decode_token_cached(token)
     if payload is None or payload.get("sub") is None:
         raise credentials_exception
     
-    user_id: str = payload.get("sub")
+    user_id: str = str(payload.get("sub"))
     
-    # Usa la función local en lugar de importar user_service
-    user = await _get_user_by_id_from_db(db, user_id=user_id)
+    # Primero la caché; solo se consulta la DB si el usuario no está o ya expiró
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await _get_user_by_id_from_db(db, user_id=user_id)
+        if user is not None:
+            user_cache.set(user_id, user)
     
     if user is None:
         raise credentials_exception
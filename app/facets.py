@@ -0,0 +1,147 @@
+# products_service/app/facets.py
+"""
+Conteos del panel de filtros: por categoría, por rango de precio y con/sin stock.
+
+Se guardan ya calculados en `product_facets`, un documento por valor
+(`{"_id": "category:Frutas", "kind": "category", "value": "Frutas", "count": 12}`),
+y cada escritura de productos los ajusta con `$inc` (ver `apply_deltas`), así
+que leerlos es una consulta pequeña en vez de un `count_documents` por faceta.
+
+La disponibilidad sigue el campo interno `in_stock` de cada producto: quien lo
+cambia (con un update condicionado a su valor anterior) ajusta el conteo, de
+modo que dos escrituras concurrentes no cuentan dos veces la misma transición.
+Si el resumen no existe (p. ej. en un catálogo anterior a las facetas), el
+arranque del servicio lo calcula una vez (`product_service.seed_facets`);
+`manage.py facets rebuild` recalcula todo desde la colección de productos.
+"""
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from .config import settings
+
+FACET_COLLECTION = "product_facets"
+# Campos de producto de los que dependen las facetas
+FACET_FIELDS = ("category", "price", "stock", "in_stock")
+TOTAL_KEY = "total"
+
+
+def price_bounds() -> List[float]:
+    """Límites inferiores de los rangos de precio (FACET_PRICE_BUCKETS), ordenados."""
+    return sorted(float(bound) for bound in settings.FACET_PRICE_BUCKETS.split(",") if bound.strip())
+
+
+def price_bucket(price: Optional[float]) -> Optional[float]:
+    """Límite inferior del rango que contiene `price` (None si queda por debajo del primero)."""
+    bucket = None
+    for bound in price_bounds():
+        if price is None or price < bound:
+            break
+        bucket = bound
+    return bucket
+
+
+def is_in_stock(doc: dict) -> bool:
+    if "in_stock" in doc:
+        return bool(doc["in_stock"])
+    return (doc.get("stock") or 0) > 0
+
+
+def facet_keys(doc: dict) -> List[str]:
+    """Claves de `product_facets` en las que cuenta un producto."""
+    keys = [TOTAL_KEY, f"category:{doc.get('category')}", f"stock:{is_in_stock(doc)}"]
+    bucket = price_bucket(doc.get("price"))
+    if bucket is not None:
+        keys.append(f"price:{bucket:g}")
+    return keys
+
+
+def diff(before: Optional[dict], after: Optional[dict]) -> Counter:
+    """Deltas de conteo al pasar de `before` a `after` (None = el producto no existe)."""
+    deltas: Counter = Counter()
+    for key in facet_keys(after) if after is not None else ():
+        deltas[key] += 1
+    for key in facet_keys(before) if before is not None else ():
+        deltas[key] -= 1
+    return deltas
+
+
+def _facet_doc(key: str) -> dict:
+    if key == TOTAL_KEY:
+        return {"kind": TOTAL_KEY, "value": None}
+    kind, value = key.split(":", 1)
+    if kind == "price":
+        return {"kind": kind, "value": float(value)}
+    if kind == "stock":
+        return {"kind": kind, "value": value == "True"}
+    return {"kind": kind, "value": value}
+
+
+async def apply_deltas(db: AsyncIOMotorDatabase, deltas: Dict[str, int]) -> None:
+    """
+    Aplica los deltas en un solo `bulk_write`. Un fallo solo se registra: la
+    escritura del producto ya ocurrió y `manage.py facets rebuild` corrige la deriva.
+    """
+    ops = [
+        UpdateOne({"_id": key}, {"$inc": {"count": delta}, "$setOnInsert": _facet_doc(key)}, upsert=True)
+        for key, delta in deltas.items() if delta
+    ]
+    if not ops:
+        return
+    try:
+        await db[FACET_COLLECTION].bulk_write(ops, ordered=False)
+    except Exception as e:
+        print(f"⚠️ No se pudieron actualizar las facetas: {e}")
+
+
+async def record_changes(db: AsyncIOMotorDatabase, pairs: Iterable[tuple]) -> None:
+    """Ajusta las facetas para varios pares `(antes, después)` a la vez."""
+    total: Counter = Counter()
+    for before, after in pairs:
+        total.update(diff(before, after))
+    await apply_deltas(db, total)
+
+
+async def get_facets(db: AsyncIOMotorDatabase) -> dict:
+    counts = {doc["_id"]: doc.get("count", 0) async for doc in db[FACET_COLLECTION].find({})}
+    categories = sorted(
+        ((key.split(":", 1)[1], count) for key, count in counts.items() if key.startswith("category:") and count > 0),
+        key=lambda item: (-item[1], item[0]),
+    )
+    bounds = price_bounds()
+    return {
+        "total": counts.get(TOTAL_KEY, 0),
+        "categories": [{"value": value, "count": count} for value, count in categories],
+        "price_ranges": [
+            {"min": bound, "max": bounds[i + 1] if i + 1 < len(bounds) else None,
+             "count": counts.get(f"price:{bound:g}", 0)}
+            for i, bound in enumerate(bounds)
+        ],
+        "availability": {"in_stock": counts.get("stock:True", 0), "out_of_stock": counts.get("stock:False", 0)},
+    }
+
+
+async def claim_seed(db: AsyncIOMotorDatabase) -> bool:
+    """
+    True si el resumen no existía y este proceso queda a cargo de calcularlo: crea
+    el documento del total (así los demás workers que arrancan a la vez no repiten
+    el recorrido). False si ya estaba, aunque sea a medio calcular.
+    """
+    result = await db[FACET_COLLECTION].update_one(
+        {"_id": TOTAL_KEY}, {"$setOnInsert": {"count": 0, **_facet_doc(TOTAL_KEY)}}, upsert=True
+    )
+    return result.upserted_id is not None
+
+
+async def replace_all(db: AsyncIOMotorDatabase, counts: Dict[str, int]) -> None:
+    """Sustituye el resumen completo por `counts` (lo usa la reconstrucción)."""
+    collection = db[FACET_COLLECTION]
+    ops = [
+        UpdateOne({"_id": key}, {"$set": {"count": count, **_facet_doc(key)}}, upsert=True)
+        for key, count in counts.items()
+    ]
+    if ops:
+        await collection.bulk_write(ops, ordered=False)
+    await collection.delete_many({"_id": {"$nin": list(counts)}})
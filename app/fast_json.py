@@ -0,0 +1,83 @@
+# products_service/app/fast_json.py
+"""
+Serialización directa de documentos de Motor a JSON (camino rápido del listado).
+
+El camino normal valida cada documento dos veces (`ProductInDB` en el servicio
+y `ProductRead` al serializar). Aquí los documentos ya vienen de nuestra propia
+colección y con `PRODUCT_PROJECTION`, así que basta con ordenar los campos,
+aplicar los valores por defecto y convertir ObjectId/float como lo hace
+Pydantic, y dejar el resto a orjson. La salida es la misma que la de
+`ProductPage.model_dump_json(by_alias=True)`.
+
+Se activa con `FAST_JSON_LISTING`.
+"""
+from functools import lru_cache
+from typing import Any, Callable, List, Optional, Tuple, get_args
+
+import orjson
+from bson import ObjectId
+
+from common.models import ProductRead, PyObjectId
+
+from .fieldsets import Fieldset, partial_model
+
+
+def _to_str(value: Any) -> Any:
+    return str(value) if isinstance(value, ObjectId) else value
+
+
+def _to_float(value: Any) -> Any:
+    return float(value) if isinstance(value, int) and not isinstance(value, bool) else value
+
+
+def _converter_for(annotation: Any) -> Optional[Callable[[Any], Any]]:
+    types = get_args(annotation) or (annotation,)
+    if PyObjectId in types:
+        return _to_str
+    if float in types:
+        return _to_float
+    return None
+
+
+# (clave de salida, valor por defecto, requerido, conversión) en el orden de ProductRead
+_FieldPlan = Tuple[str, Any, bool, Optional[Callable[[Any], Any]]]
+
+
+def _compile(model) -> List[_FieldPlan]:
+    plan = []
+    for name, field in model.model_fields.items():
+        key = field.alias or name
+        required = field.is_required()
+        default = None if required else field.get_default(call_default_factory=True)
+        plan.append((key, default, required, _converter_for(field.annotation)))
+    return plan
+
+
+@lru_cache(maxsize=256)
+def _plan_for(fields: Optional[Fieldset]) -> List[_FieldPlan]:
+    return _compile(ProductRead if fields is None else partial_model(fields))
+
+
+def product_to_dict(doc: dict, fields: Optional[Fieldset] = None) -> dict:
+    """Documento de la colección -> dict con la forma de `ProductRead` (o de su modelo parcial), by_alias."""
+    out = {}
+    for key, default, required, convert in _plan_for(fields):
+        if key in doc:
+            value = doc[key]
+        elif required:
+            raise KeyError(f"Falta el campo '{key}' en el producto {doc.get('_id')}")
+        else:
+            value = default
+        out[key] = convert(value) if convert is not None and value is not None else value
+    return out
+
+
+def dumps_product_page(
+    total: int, docs: List[dict], next_cursor: Optional[str], fields: Optional[Fieldset] = None
+) -> bytes:
+    """Equivalente a `ProductPage(...).model_dump_json(by_alias=True)` sobre documentos crudos."""
+    return orjson.dumps({
+        "total": total,
+        "products": [product_to_dict(doc, fields) for doc in docs],
+        "next_cursor": next_cursor,
+    })
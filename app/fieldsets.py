@@ -0,0 +1,78 @@
+# products_service/app/fieldsets.py
+"""
+Selección parcial de campos (`fields=name,price,image_url`) en las lecturas de productos.
+
+Los campos pedidos se traducen en una proyección de inclusión para Mongo y en
+un modelo parcial de `ProductRead` con solo esos campos, de modo que se reduce
+tanto lo que llega de la base de datos como lo que se envía al cliente.
+`_id` se incluye siempre.
+"""
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, create_model
+
+from common.models import ProductPage, ProductRead
+
+# Clave en el documento / JSON (alias) -> nombre del campo en ProductRead
+PRODUCT_FIELDS: Dict[str, str] = {
+    (field.alias or name): name for name, field in ProductRead.model_fields.items()
+}
+_FIELD_KEYS = {name: key for key, name in PRODUCT_FIELDS.items()}
+
+Fieldset = Tuple[str, ...]
+
+
+class InvalidFieldsError(ValueError):
+    """`fields` contiene campos que no existen en ProductRead."""
+
+
+def parse_fields(raw: Optional[str]) -> Optional[Fieldset]:
+    """
+    "name, price" -> ("name", "price", "_id"), en el orden de ProductRead.
+    Acepta tanto `id` como `_id`. Devuelve None si no se pidió una selección.
+    """
+    if not raw or not raw.strip():
+        return None
+    requested = {"_id"}
+    unknown = []
+    for item in raw.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        key = _FIELD_KEYS.get(item, item)
+        if key in PRODUCT_FIELDS:
+            requested.add(key)
+        else:
+            unknown.append(item)
+    if unknown:
+        raise InvalidFieldsError(
+            f"Campos desconocidos: {', '.join(unknown)}. Disponibles: {', '.join(PRODUCT_FIELDS)}"
+        )
+    return tuple(key for key in PRODUCT_FIELDS if key in requested)
+
+
+def projection(fields: Fieldset, extra: Iterable[str] = ()) -> dict:
+    """Proyección de inclusión; `extra` añade campos que necesita el servidor (p. ej. claves del cursor)."""
+    return {key: 1 for key in (*fields, *extra)}
+
+
+@lru_cache(maxsize=256)
+def partial_model(fields: Fieldset) -> Type[BaseModel]:
+    """Subconjunto de `ProductRead` con los mismos tipos, validaciones y alias."""
+    definitions = {}
+    for key in fields:
+        name = PRODUCT_FIELDS[key]
+        field = ProductRead.model_fields[name]
+        definitions[name] = (field.annotation, field)
+    return create_model("ProductPartialRead", __config__=ProductRead.model_config, **definitions)
+
+
+@lru_cache(maxsize=256)
+def partial_page_model(fields: Fieldset) -> Type[BaseModel]:
+    return create_model(
+        "ProductPartialPage",
+        total=(int, ...),
+        products=(List[partial_model(fields)], ...),
+        next_cursor=(Optional[str], ProductPage.model_fields["next_cursor"]),
+    )
@@ -0,0 +1,54 @@
+# products_service/app/http_cache.py
+"""
+GET condicional (`ETag` / `If-None-Match`) sobre respuestas JSON ya serializadas.
+
+Las rutas de lectura guardan en `response_cache` el par (etag, cuerpo); en un
+acierto no se consulta Mongo ni se vuelve a validar con Pydantic, y si el
+cliente ya tiene esa versión se responde 304 sin cuerpo.
+"""
+import hashlib
+from typing import Hashable, Optional, Tuple
+
+from fastapi import Request, Response, status
+
+from .cache import response_cache
+
+CACHE_CONTROL = "no-cache"  # se puede guardar, pero siempre revalidando con el ETag
+
+CachedBody = Tuple[str, bytes]  # (etag, cuerpo JSON)
+
+
+def body_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Comparación débil (RFC 9110): se ignora el prefijo W/
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+def json_response(request: Request, etag: str, body: bytes) -> Response:
+    """200 con el cuerpo, o 304 si el cliente ya tiene la versión `etag`."""
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def get_cached(key: Hashable) -> Optional[CachedBody]:
+    return response_cache.get(key)
+
+
+def store(key: Hashable, etag: str, body: bytes) -> None:
+    response_cache.set(key, (etag, body))
+
+
+def query_key(request: Request) -> tuple:
+    """Parámetros de la petición en un orden estable, para usarlos como clave."""
+    return tuple(sorted(request.query_params.multi_items()))
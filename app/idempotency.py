@@ -0,0 +1,90 @@
+# products_service/app/idempotency.py
+"""
+Claves de idempotencia (`Idempotency-Key`) para endpoints de escritura.
+
+La primera petición con una clave la reserva (documento "pending"); al terminar
+se guarda la respuesta y los reintentos con la misma clave y el mismo cuerpo la
+reciben tal cual, sin volver a aplicar la operación. Las claves caducan con un
+índice TTL sobre `created_at` (ver `IDEMPOTENCY_TTL_SECONDS` y app/indexes.py).
+
+Una reserva "pending" tiene un plazo (`lease_expires_at`, IDEMPOTENCY_LEASE_SECONDS):
+si la petición original cae sin completar ni liberar la clave, el primer
+reintento después de ese plazo la toma en lugar de recibir 409 hasta el TTL.
+"""
+import hashlib
+from datetime import datetime, timedelta
+from typing import Optional
+
+import orjson
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+
+from .config import settings
+
+IDEMPOTENCY_COLLECTION = "idempotency_keys"
+
+
+class IdempotencyConflictError(Exception):
+    """La clave ya se usó con otro cuerpo, o la petición original sigue en curso."""
+
+    def __init__(self, reason: str):
+        self.reason = reason  # "payload_mismatch" | "in_progress"
+        super().__init__(reason)
+
+
+def _record_id(scope: str, key: str) -> str:
+    return f"{scope}:{key}"
+
+
+def payload_hash(payload) -> str:
+    return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+async def begin(db: AsyncIOMotorDatabase, scope: str, key: str, payload) -> Optional[dict]:
+    """
+    Reserva la clave para esta petición. Devuelve None si es la primera vez, o
+    `{"status_code", "body"}` con la respuesta guardada si es un reintento.
+    Lanza `IdempotencyConflictError`. `scope` separa las claves (p. ej. por usuario y ruta).
+    """
+    collection = db[IDEMPOTENCY_COLLECTION]
+    record_id = _record_id(scope, key)
+    digest = payload_hash(payload)
+    now = datetime.utcnow()
+    lease_expires_at = now + timedelta(seconds=settings.IDEMPOTENCY_LEASE_SECONDS)
+    try:
+        await collection.insert_one({
+            "_id": record_id, "request_hash": digest, "state": "pending",
+            "created_at": now, "lease_expires_at": lease_expires_at,
+        })
+        return None
+    except DuplicateKeyError:
+        pass
+    # La petición original no terminó dentro de su plazo: la toma este reintento (solo uno lo consigue)
+    taken = await collection.find_one_and_update(
+        {"_id": record_id, "state": "pending", "request_hash": digest, "lease_expires_at": {"$not": {"$gt": now}}},
+        {"$set": {"lease_expires_at": lease_expires_at}},
+    )
+    if taken is not None:
+        return None
+    record = await collection.find_one({"_id": record_id})
+    if record is None:
+        # Caducó entre el insert y la lectura: se trata como nueva
+        return await begin(db, scope, key, payload)
+    if record["request_hash"] != digest:
+        raise IdempotencyConflictError("payload_mismatch")
+    if record["state"] != "done":
+        raise IdempotencyConflictError("in_progress")
+    return {"status_code": record["status_code"], "body": record["body"]}
+
+
+async def complete(db: AsyncIOMotorDatabase, scope: str, key: str, status_code: int, body) -> None:
+    """Guarda la respuesta final (éxito o error de negocio) para los reintentos."""
+    await db[IDEMPOTENCY_COLLECTION].update_one(
+        {"_id": _record_id(scope, key)},
+        {"$set": {"state": "done", "status_code": status_code, "body": body, "completed_at": datetime.utcnow()}},
+    )
+
+
+async def release(db: AsyncIOMotorDatabase, scope: str, key: str) -> None:
+    """Libera la clave tras un error inesperado, para que el cliente pueda reintentar."""
+    await db[IDEMPOTENCY_COLLECTION].delete_one({"_id": _record_id(scope, key), "state": "pending"})
@@ -0,0 +1,163 @@
+# products_service/app/image_service.py
+"""
+Subida de imágenes de productos.
+
+El archivo se recibe por bloques y se escribe fuera del event loop; se nombra
+por su hash SHA-256, así que subir dos veces la misma imagen reutiliza el mismo
+archivo. Las variantes redimensionadas (webp) se generan en un pool de procesos.
+"""
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from fastapi import UploadFile
+
+from .config import settings
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # llega a product_service/
+UPLOAD_DIRECTORY = os.path.join(BASE_DIR, "static", "images")
+UPLOAD_URL_PREFIX = "/static/images"
+
+# Asegurar que el directorio de carga existe
+os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
+print(f"UPLOAD_DIRECTORY configurado en: {UPLOAD_DIRECTORY}")
+
+ALLOWED_EXTENSIONS = {"jpg", "jpeg", "png", "webp", "avif", "gif"}
+CHUNK_SIZE = 1024 * 1024
+# Nombre de la variante -> ancho máximo en píxeles
+IMAGE_VARIANTS = {"thumb": 320, "medium": 800}
+VARIANT_QUALITY = 80
+
+
+class ImageTooLargeError(Exception):
+    """El archivo supera MAX_UPLOAD_BYTES."""
+
+
+class InvalidImageError(Exception):
+    """El archivo no es una imagen que se pueda procesar."""
+
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """
+    Pool de procesos con "spawn": el worker ya tiene hilos (los de Motor), y un
+    fork de un proceso con hilos puede dejar a los hijos bloqueados en un lock
+    que tenía tomado otro hilo.
+    """
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(
+            max_workers=settings.IMAGE_PROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _process_pool
+
+
+def shutdown_process_pool() -> None:
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+def _variant_filename(digest: str, variant: str) -> str:
+    return f"{digest}_{variant}.webp"
+
+
+def _render_variants(source_path: str, targets: Dict[str, str]) -> None:
+    """Se ejecuta en el pool de procesos: redimensiona y recodifica a webp."""
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+        for variant, target_path in targets.items():
+            width = IMAGE_VARIANTS[variant]
+            resized = image.copy()
+            resized.thumbnail((width, width * 4))
+            tmp_path = f"{target_path}.{uuid.uuid4().hex}.tmp"
+            resized.save(tmp_path, format="WEBP", quality=VARIANT_QUALITY, method=4)
+            os.replace(tmp_path, target_path)
+
+
+async def _write_chunks(file: UploadFile, tmp_path: str) -> str:
+    """Copia el archivo subido por bloques, sin bloquear el loop; devuelve su SHA-256."""
+    hasher = hashlib.sha256()
+    size = 0
+    handle = await asyncio.to_thread(open, tmp_path, "wb")
+    try:
+        while chunk := await file.read(CHUNK_SIZE):
+            size += len(chunk)
+            if size > settings.MAX_UPLOAD_BYTES:
+                raise ImageTooLargeError(f"La imagen supera el máximo de {settings.MAX_UPLOAD_BYTES} bytes")
+            hasher.update(chunk)
+            await asyncio.to_thread(handle.write, chunk)
+    finally:
+        await asyncio.to_thread(handle.close)
+    return hasher.hexdigest()
+
+
+def _store_original(tmp_path: str, file_path: str, targets: Dict[str, str]) -> Tuple[bool, Dict[str, str]]:
+    """
+    Se ejecuta en un hilo: mueve el archivo subido a su nombre definitivo (o lo
+    descarta si ya existía) y devuelve si estaba duplicado y las variantes que faltan.
+    """
+    deduplicated = os.path.exists(file_path)
+    if deduplicated:
+        _remove_quietly(tmp_path)
+    else:
+        os.replace(tmp_path, file_path)
+    missing = {variant: path for variant, path in targets.items() if not os.path.exists(path)}
+    return deduplicated, missing
+
+
+async def save_image(file: UploadFile) -> dict:
+    """
+    Guarda la imagen subida y sus variantes; devuelve las URLs.
+    Lanza `ImageTooLargeError` o `InvalidImageError`.
+    """
+    extension = (file.filename or "").rsplit(".", 1)[-1].lower()
+    if extension not in ALLOWED_EXTENSIONS:
+        raise InvalidImageError(f"Extensión no permitida: {extension}")
+
+    tmp_path = os.path.join(UPLOAD_DIRECTORY, f".upload-{uuid.uuid4().hex}.tmp")
+    try:
+        digest = await _write_chunks(file, tmp_path)
+    except BaseException:
+        await asyncio.to_thread(_remove_quietly, tmp_path)
+        raise
+
+    filename = f"{digest}.{extension}"
+    file_path = os.path.join(UPLOAD_DIRECTORY, filename)
+    targets = {
+        variant: os.path.join(UPLOAD_DIRECTORY, _variant_filename(digest, variant)) for variant in IMAGE_VARIANTS
+    }
+    deduplicated, missing = await asyncio.to_thread(_store_original, tmp_path, file_path, targets)
+    if missing:
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(get_process_pool(), _render_variants, file_path, missing)
+        except Exception as e:
+            if not deduplicated:
+                await asyncio.to_thread(_remove_quietly, file_path)
+            raise InvalidImageError(f"No se pudo procesar la imagen: {e}") from e
+
+    return {
+        "image_url": f"{UPLOAD_URL_PREFIX}/{filename}",
+        "variants": {
+            variant: f"{UPLOAD_URL_PREFIX}/{_variant_filename(digest, variant)}" for variant in IMAGE_VARIANTS
+        },
+        "deduplicated": deduplicated,
+    }
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,171 @@
+# products_service/app/indexes.py
+"""
+Índices declarativos por colección.
+
+`INDEX_SPECS` es la fuente de verdad: `sync_indexes` crea lo que falta y
+reconstruye lo que cambió (idempotente, desde `manage.py indexes sync`, una vez
+en el master de gunicorn antes del fork o al arrancar un proceso único). Solo
+declara colecciones de este servicio: `users` es de users_service. `explain_query_shapes` ejecuta `explain()` sobre las
+consultas que hace el servicio y marca las que todavía recorren la colección.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from .config import settings
+from .idempotency import IDEMPOTENCY_COLLECTION
+from .order_service import ORDER_COLLECTION, ORDER_HISTORY_SORT
+from .reservation_service import RESERVATION_COLLECTION
+from .product_service import LISTING_SORTS, PRODUCT_COLLECTION, RATING_COLLECTION, RATING_SORTS
+
+INDEX_SPECS: Dict[str, List[IndexModel]] = {
+    PRODUCT_COLLECTION: [
+        # Listado: por categoría (orden por defecto o por precio) y sin filtro ordenado por precio
+        IndexModel([("category", ASCENDING), ("_id", ASCENDING)], name="category__id"),
+        IndexModel([("category", ASCENDING), ("price", ASCENDING), ("_id", ASCENDING)], name="category_price__id"),
+        IndexModel([("price", ASCENDING), ("_id", ASCENDING)], name="price__id"),
+        # Órdenes por calificación, con y sin categoría; (category, rating_score) sirve además
+        # para recalcular las listas "mejor calificados"
+        IndexModel([("category", ASCENDING), ("average_rating", DESCENDING), ("_id", DESCENDING)],
+                   name="category_average_rating__id"),
+        IndexModel([("average_rating", DESCENDING), ("_id", DESCENDING)], name="average_rating__id"),
+        IndexModel([("category", ASCENDING), ("total_ratings", DESCENDING), ("_id", DESCENDING)],
+                   name="category_total_ratings__id"),
+        IndexModel([("total_ratings", DESCENDING), ("_id", DESCENDING)], name="total_ratings__id"),
+        IndexModel([("category", ASCENDING), ("rating_score", DESCENDING), ("_id", DESCENDING)],
+                   name="category_rating_score__id"),
+        IndexModel([("rating_score", DESCENDING), ("_id", DESCENDING)], name="rating_score__id"),
+        IndexModel([("owner_id", ASCENDING)], name="owner_id"),
+        IndexModel([("search_keywords", ASCENDING)], name="search_keywords"),
+    ],
+    RATING_COLLECTION: [
+        # Una calificación por usuario y producto (upsert de create_rating)
+        IndexModel([("product_id", ASCENDING), ("user_id", ASCENDING)], name="product_id_user_id", unique=True),
+        IndexModel([("product_id", ASCENDING), ("_id", DESCENDING)], name="product_id__id"),
+        IndexModel(
+            [("product_id", ASCENDING), ("rating", DESCENDING), ("_id", DESCENDING)], name="product_id_rating__id"
+        ),
+    ],
+    ORDER_COLLECTION: [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="user_id_created_at"),
+    ],
+    RESERVATION_COLLECTION: [
+        # Barrido de reservas vencidas
+        IndexModel([("status", ASCENDING), ("expires_at", ASCENDING)], name="status_expires_at"),
+    ],
+    IDEMPOTENCY_COLLECTION: [
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=settings.IDEMPOTENCY_TTL_SECONDS),
+    ],
+}
+
+# Opciones que, si cambian, obligan a reconstruir el índice
+_COMPARED_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds")
+
+
+def _same_index(spec: dict, existing: dict) -> bool:
+    if [tuple(k) for k in existing["key"]] != [tuple(k) for k in spec["key"].items()]:
+        return False
+    return all(spec.get(opt) == existing.get(opt) for opt in _COMPARED_OPTIONS)
+
+
+async def sync_indexes(
+    db: AsyncIOMotorDatabase, collections: Optional[List[str]] = None, drop_unknown: bool = False
+) -> List[dict]:
+    """
+    Lleva los índices de cada colección a lo declarado en `INDEX_SPECS`.
+    Un índice que no se puede crear (p. ej. `unique` con duplicados) se informa
+    con estado "error" sin detener el resto. Devuelve una fila por índice.
+    """
+    report = []
+    for collection_name, models in INDEX_SPECS.items():
+        if collections and collection_name not in collections:
+            continue
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        declared = set()
+        for model in models:
+            spec = model.document
+            name = spec["name"]
+            declared.add(name)
+            state = "ok"
+            try:
+                if name in existing and not _same_index(spec, existing[name]):
+                    await collection.drop_index(name)
+                    await collection.create_indexes([model])
+                    state = "rebuilt"
+                elif name not in existing:
+                    await collection.create_indexes([model])
+                    state = "created"
+            except Exception as e:
+                state = f"error: {e}"
+            report.append({"collection": collection_name, "index": name, "state": state})
+        if drop_unknown:
+            for name in existing:
+                if name != "_id_" and name not in declared:
+                    await collection.drop_index(name)
+                    report.append({"collection": collection_name, "index": name, "state": "dropped"})
+    return report
+
+
+def _query_shapes() -> List[dict]:
+    """Formas de consulta de product_service/order_service/reservation_service con valores de ejemplo."""
+    oid = ObjectId("000000000000000000000000")
+    return [
+        {"label": "listado", "collection": PRODUCT_COLLECTION, "filter": {}, "sort": LISTING_SORTS[None]},
+        {"label": "listado por categoría", "collection": PRODUCT_COLLECTION,
+         "filter": {"category": "Frutas"}, "sort": LISTING_SORTS[None]},
+        {"label": "listado price_asc", "collection": PRODUCT_COLLECTION, "filter": {}, "sort": LISTING_SORTS["price_asc"]},
+        {"label": "listado por categoría price_desc", "collection": PRODUCT_COLLECTION,
+         "filter": {"category": "Frutas"}, "sort": LISTING_SORTS["price_desc"]},
+        {"label": "listado por categoría rating_desc", "collection": PRODUCT_COLLECTION,
+         "filter": {"category": "Frutas"}, "sort": LISTING_SORTS["rating_desc"]},
+        {"label": "listado most_rated", "collection": PRODUCT_COLLECTION, "filter": {}, "sort": LISTING_SORTS["most_rated"]},
+        {"label": "listado por categoría best", "collection": PRODUCT_COLLECTION,
+         "filter": {"category": "Frutas"}, "sort": LISTING_SORTS["best"]},
+        {"label": "mejor calificados de una categoría", "collection": PRODUCT_COLLECTION,
+         "filter": {"category": "Frutas", "total_ratings": {"$gt": 0}}, "sort": LISTING_SORTS["best"]},
+        {"label": "búsqueda", "collection": PRODUCT_COLLECTION,
+         "filter": {"search_keywords": {"$all": ["man"]}}, "sort": None},
+        {"label": "productos de un vendedor", "collection": PRODUCT_COLLECTION, "filter": {"owner_id": oid}, "sort": None},
+        {"label": "calificación de un usuario", "collection": RATING_COLLECTION,
+         "filter": {"product_id": oid, "user_id": oid}, "sort": None},
+        {"label": "calificaciones recientes", "collection": RATING_COLLECTION,
+         "filter": {"product_id": oid}, "sort": RATING_SORTS["newest"]},
+        {"label": "calificaciones por puntaje", "collection": RATING_COLLECTION,
+         "filter": {"product_id": oid}, "sort": RATING_SORTS["rating"]},
+        {"label": "historial de pedidos", "collection": ORDER_COLLECTION,
+         "filter": {"user_id": oid}, "sort": ORDER_HISTORY_SORT},
+        {"label": "reservas vencidas", "collection": RESERVATION_COLLECTION,
+         "filter": {"status": "active", "expires_at": {"$lte": datetime(2000, 1, 1)}}, "sort": [("expires_at", 1)]},
+    ]
+
+
+def _plan_stages(plan: dict) -> List[str]:
+    stages = [plan.get("stage")] if plan.get("stage") else []
+    for child_key in ("inputStage", "queryPlan"):
+        if child_key in plan:
+            stages += _plan_stages(plan[child_key])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return stages
+
+
+async def explain_query_shapes(db: AsyncIOMotorDatabase, limit: int = 20) -> List[dict]:
+    """Ejecuta `explain()` sobre cada forma de consulta y marca las que hacen COLLSCAN."""
+    report = []
+    for shape in _query_shapes():
+        cursor = db[shape["collection"]].find(shape["filter"]).limit(limit)
+        if shape["sort"]:
+            cursor = cursor.sort(shape["sort"])
+        explain = await cursor.explain()
+        stages = _plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+        report.append({
+            "label": shape["label"],
+            "collection": shape["collection"],
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+        })
+    return report
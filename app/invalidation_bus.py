@@ -0,0 +1,280 @@
+# products_service/app/invalidation_bus.py
+"""
+Bus de invalidación entre workers.
+
+Cada worker tiene sus propias cachés (app/cache.py); cuando uno modifica un
+producto o un usuario, el bus difunde la invalidación para que el resto la
+aplique. Los mensajes son pequeños: `{"kind": "product"|"products"|"user"|"users",
+"id": ..., "origin": ..., "ts": ...}`; invalidar un producto también avanza la
+generación del listado en quien lo recibe.
+
+Backends (`INVALIDATION_BUS_BACKEND`):
+- "memory": entre instancias del mismo proceso; para pruebas.
+- "capped": una colección capada en Mongo que todos los workers leen con un
+  cursor tailable. Funciona con un mongod standalone.
+- "changestream": los workers observan los cambios de `products` y `users`
+  directamente (requiere replica set); no hace falta publicar nada.
+
+El retraso de entrega está acotado: un mensaje que llega después de
+`INVALIDATION_BUS_MAX_LAG_SECONDS`, una cola llena o un error del cursor
+(mensajes que se pudieron perder) vacían todas las cachés locales.
+"""
+import asyncio
+import time
+import uuid
+from typing import List, Optional, Set
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from prometheus_client import Counter, Histogram
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+from . import cache
+from .config import settings
+
+INVALIDATION_COLLECTION = "cache_invalidations"
+RETRY_DELAY_SECONDS = 1.0
+
+INVALIDATION_MESSAGES = Counter(
+    "app_invalidation_messages_total",
+    "Mensajes del bus de invalidación, por backend y dirección (published/received).",
+    ["backend", "direction"],
+)
+INVALIDATION_DROPPED = Counter(
+    "app_invalidation_dropped_total",
+    "Mensajes de invalidación perdidos o entregados tarde (se vacían las cachés locales).",
+    ["backend", "reason"],
+)
+INVALIDATION_LAG = Histogram(
+    "app_invalidation_lag_seconds",
+    "Tiempo entre la publicación de una invalidación y su aplicación en otro worker.",
+    ["backend"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+
+
+class InvalidationBus:
+    """Base: encola lo que publica este worker y aplica lo que llega de los demás."""
+
+    backend = "base"
+
+    def __init__(self):
+        self.origin = uuid.uuid4().hex
+        self.max_lag = settings.INVALIDATION_BUS_MAX_LAG_SECONDS
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=settings.INVALIDATION_BUS_QUEUE_SIZE)
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        self._tasks.append(asyncio.create_task(self._send_loop()))
+        cache.set_publisher(self.publish)
+
+    async def stop(self) -> None:
+        cache.set_publisher(None)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def publish(self, message: dict) -> None:
+        """Lo llama app/cache.py tras cada invalidación local; no bloquea."""
+        try:
+            self._queue.put_nowait({**message, "origin": self.origin, "ts": time.time()})
+        except asyncio.QueueFull:
+            # Los demás workers se quedan sin este mensaje; solo los acota el TTL
+            INVALIDATION_DROPPED.labels(self.backend, "queue_full").inc()
+
+    def deliver(self, message: dict) -> None:
+        """Aplica un mensaje recibido; los propios se ignoran (ya se aplicaron)."""
+        if message.get("origin") == self.origin:
+            return
+        INVALIDATION_MESSAGES.labels(self.backend, "received").inc()
+        lag = max(time.time() - message.get("ts", time.time()), 0.0)
+        INVALIDATION_LAG.labels(self.backend).observe(lag)
+        if lag > self.max_lag:
+            INVALIDATION_DROPPED.labels(self.backend, "late").inc()
+            cache.clear_all()
+        else:
+            cache.apply_invalidation(message)
+
+    def resync(self, reason: str) -> None:
+        """Se pudieron perder mensajes: se descarta todo lo cacheado."""
+        INVALIDATION_DROPPED.labels(self.backend, reason).inc()
+        cache.clear_all()
+
+    async def _send_loop(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while not self._queue.empty() and len(batch) < 500:
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._send(batch)
+                INVALIDATION_MESSAGES.labels(self.backend, "published").inc(len(batch))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ No se pudieron publicar {len(batch)} invalidaciones: {e}")
+                INVALIDATION_DROPPED.labels(self.backend, "send_error").inc(len(batch))
+
+    async def _send(self, messages: List[dict]) -> None:
+        raise NotImplementedError
+
+
+class InMemoryBus(InvalidationBus):
+    """Entrega a las demás instancias del mismo proceso (simula varios workers en pruebas)."""
+
+    backend = "memory"
+    _instances: Set["InMemoryBus"] = set()
+
+    async def start(self) -> None:
+        InMemoryBus._instances.add(self)
+        await super().start()
+
+    async def stop(self) -> None:
+        InMemoryBus._instances.discard(self)
+        await super().stop()
+
+    async def _send(self, messages: List[dict]) -> None:
+        for bus in list(InMemoryBus._instances):
+            for message in messages:
+                bus.deliver(message)
+
+
+class CappedCollectionBus(InvalidationBus):
+    """Publica en una colección capada y la lee con un cursor tailable-await."""
+
+    backend = "capped"
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        super().__init__()
+        self.db = db
+        self.collection = db[INVALIDATION_COLLECTION]
+
+    async def start(self) -> None:
+        try:
+            await self.db.create_collection(
+                INVALIDATION_COLLECTION, capped=True, size=settings.INVALIDATION_CAPPED_SIZE_BYTES
+            )
+        except CollectionInvalid:
+            pass  # ya existe
+        await super().start()
+        self._tasks.append(asyncio.create_task(self._tail_loop()))
+
+    async def _send(self, messages: List[dict]) -> None:
+        await self.collection.insert_many(messages, ordered=False)
+
+    async def _last_id(self):
+        last = await self.collection.find_one({}, {"_id": 1}, sort=[("$natural", -1)])
+        return last["_id"] if last else None
+
+    async def _tail_loop(self) -> None:
+        # La posición es el último mensaje leído (`anchor`). Los `_id` los generan los
+        # clientes de cada worker y no siguen el orden de inserción, así que no se filtra
+        # por `_id > anchor`: se recorre la colección en orden natural (el de inserción) y
+        # se descarta lo anterior al ancla, comparando por igualdad.
+        # Solo interesa lo publicado desde que arrancó este worker.
+        anchor = await self._last_id()
+        while True:
+            if anchor is not None and await self.collection.find_one({"_id": anchor}, {"_id": 1}) is None:
+                # La colección dio la vuelta desde el último mensaje leído: pudo perderse alguno
+                anchor = await self._last_id()
+                self.resync("capped_wrapped")
+            skipping = anchor is not None
+            cursor = self.collection.find({}, cursor_type=CursorType.TAILABLE_AWAIT)
+            try:
+                while cursor.alive:
+                    async for message in cursor:
+                        if skipping:
+                            skipping = message["_id"] != anchor
+                            continue
+                        anchor = message["_id"]
+                        self.deliver(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Cursor invalidado (p. ej. la colección dio la vuelta antes de leer): se resincroniza.
+                # El ancla se toma antes de vaciar las cachés para no saltar nada publicado entre ambos.
+                print(f"⚠️ Bus de invalidación: se reinicia la lectura ({e})")
+                anchor = await self._last_id()
+                self.resync("stream_error")
+                await asyncio.sleep(RETRY_DELAY_SECONDS)
+            finally:
+                await cursor.close()
+            if anchor is None:
+                await asyncio.sleep(RETRY_DELAY_SECONDS)  # colección vacía: el cursor muere enseguida
+
+
+class ChangeStreamBus(InvalidationBus):
+    """
+    Traduce los change streams de `products` y `users` en invalidaciones.
+    Cada escritura llega a todos los workers (incluido el que la hizo), así que
+    `publish` no envía nada.
+    """
+
+    backend = "changestream"
+    WATCHED = {"products": "product", "users": "user"}
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        super().__init__()
+        self.db = db
+
+    async def start(self) -> None:
+        self._tasks.append(asyncio.create_task(self._watch_loop()))
+
+    def publish(self, message: dict) -> None:
+        pass
+
+    async def _watch_loop(self) -> None:
+        pipeline = [{"$match": {
+            "ns.coll": {"$in": list(self.WATCHED)},
+            "operationType": {"$in": ["insert", "update", "replace", "delete"]},
+        }}]
+        resume_token = None
+        while True:
+            try:
+                async with self.db.watch(pipeline, resume_after=resume_token) as stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        wall_time = change.get("wallTime")
+                        self.deliver({
+                            "kind": self.WATCHED[change["ns"]["coll"]],
+                            "id": str(change["documentKey"]["_id"]),
+                            "ts": wall_time.timestamp() if wall_time else time.time(),
+                        })
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Bus de invalidación: change stream interrumpido ({e})")
+                self.resync("stream_error")
+                resume_token = None
+                await asyncio.sleep(RETRY_DELAY_SECONDS)
+
+
+_bus: Optional[InvalidationBus] = None
+
+
+def create_bus(db: AsyncIOMotorDatabase, backend: Optional[str] = None) -> Optional[InvalidationBus]:
+    backend = backend or settings.INVALIDATION_BUS_BACKEND
+    if backend == "none":
+        return None
+    if backend == "memory":
+        return InMemoryBus()
+    if backend == "capped":
+        return CappedCollectionBus(db)
+    if backend == "changestream":
+        return ChangeStreamBus(db)
+    raise ValueError(f"INVALIDATION_BUS_BACKEND desconocido: {backend}")
+
+
+async def start_bus(db: AsyncIOMotorDatabase) -> Optional[InvalidationBus]:
+    global _bus
+    _bus = create_bus(db)
+    if _bus is not None:
+        await _bus.start()
+    return _bus
+
+
+async def stop_bus() -> None:
+    global _bus
+    if _bus is not None:
+        await _bus.stop()
+        _bus = None
@@ -1,33 +1,70 @@
+import os
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from motor.motor_asyncio import AsyncIOMotorClient
-from . import dependencies as global_deps, config
+from . import dependencies as global_deps, config, indexes, image_service, invalidation_bus, db_monitoring, reservation_service, product_service
+from .body_limit import MULTIPART_OVERHEAD_BYTES, BodySizeLimitMiddleware
 from .product_router import router as product_router
 from .order_router import router as order_router
-from prometheus_fastapi_instrumentator import Instrumentator
+from .admin_router import router as admin_router
+from prometheus_fastapi_instrumentator import Instrumentator, metrics
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global_deps.mongo_client = AsyncIOMotorClient(config.settings.MONGO_URI)
+    global_deps.mongo_client = global_deps.create_mongo_client(event_listeners=[db_monitoring.listener])
     global_deps.database_instance = global_deps.mongo_client[config.settings.MONGO_DB_NAME]
-    print(f"Servicio '{config.settings.PROJECT_NAME}' conectado a MongoDB.")
+    global_deps.read_database_instance = global_deps.mongo_client.get_database(
+        config.settings.MONGO_DB_NAME, read_preference=global_deps.read_preference()
+    )
+    print(f"Servicio '{config.settings.PROJECT_NAME}' conectado a MongoDB (pid {os.getpid()}).")
+    try:
+        await global_deps.warm_up_pool(global_deps.mongo_client, config.settings.MONGO_WARMUP_CONNECTIONS)
+    except Exception as e:
+        print(f"⚠️ No se pudo precalentar el pool de conexiones: {e}")
+    if config.settings.SYNC_INDEXES_ON_STARTUP:
+        try:
+            for row in await indexes.sync_indexes(global_deps.database_instance):
+                if row["state"] != "ok":
+                    print(f"Índice {row['collection']}.{row['index']}: {row['state']}")
+        except Exception as e:
+            print(f"⚠️ No se pudieron sincronizar los índices: {e}")
+    try:
+        if await product_service.seed_facets(global_deps.database_instance):
+            print("Resumen de facetas calculado desde la colección de productos.")
+    except Exception as e:
+        print(f"⚠️ No se pudo calcular el resumen de facetas: {e}")
+    await invalidation_bus.start_bus(global_deps.database_instance)
+    reservation_service.start_sweeper(global_deps.database_instance)
     yield
+    await reservation_service.stop_sweeper()
+    await invalidation_bus.stop_bus()
+    image_service.shutdown_process_pool()
     global_deps.mongo_client.close()
-    print(f"Servicio '{config.settings.PROJECT_NAME}' desconectado.")
+    print(f"Servicio '{config.settings.PROJECT_NAME}' desconectado (pid {os.getpid()}).")
 
 app = FastAPI(title=config.settings.PROJECT_NAME, lifespan=lifespan)
 # app.mount("/static", StaticFiles(directory="products_service/static"), name="static")
 
-Instrumentator().instrument(app).expose(app)
+# Viajes a MongoDB y tiempo en la base por petición, junto a las métricas HTTP
+app.add_middleware(db_monitoring.DbStatsMiddleware)
+# Las subidas de imágenes demasiado grandes se cortan antes de guardar el cuerpo completo
+app.add_middleware(BodySizeLimitMiddleware, limits={
+    "/api/v1/products/upload-image": config.settings.MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+})
+Instrumentator().add(metrics.default()).add(db_monitoring.http_db_metrics()).instrument(app).expose(app)
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-app.add_middleware(CORSMiddleware, allow_origins=["http://localhost:5173", "http://127.0.0.1:5173"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+# Cabeceras de respuesta que el frontend necesita leer (cursor de calificaciones, ETag, reintentos)
+app.add_middleware(
+    CORSMiddleware, allow_origins=["http://localhost:5173", "http://127.0.0.1:5173"], allow_credentials=True,
+    allow_methods=["*"], allow_headers=["*"], expose_headers=["X-Next-Cursor", "ETag", "Idempotent-Replayed"],
+)
 app.include_router(product_router, prefix="/api/v1/products", tags=["Products"])
 app.include_router(order_router, prefix="/api/v1/orders", tags=["Orders"])
+app.include_router(admin_router, prefix="/api/v1/admin", tags=["Admin"])
 
 @app.get("/")
 def read_root(): return {"service": config.settings.PROJECT_NAME, "status": "ok"}
\ No newline at end of file
@@ -0,0 +1,5 @@
+# products_service/app/migrations/__init__.py
+from .products import MIGRATIONS
+from .runner import MIGRATIONS_COLLECTION, Migration, get_status, run_migration, run_pending
+
+__all__ = ["MIGRATIONS", "MIGRATIONS_COLLECTION", "Migration", "get_status", "run_migration", "run_pending"]
@@ -0,0 +1,114 @@
+# products_service/app/migrations/products.py
+"""Migraciones de datos de la colección de productos, en orden de versión."""
+from typing import Optional
+
+from ..product_service import PRODUCT_COLLECTION, rating_score
+from ..search import KEYWORD_FIELDS, SEARCH_FIELDS, build_search_keywords
+from .runner import Migration
+
+RATING_DEFAULTS = {"average_rating": 0.0, "total_ratings": 0}
+
+
+class RatingFields(Migration):
+    """Campos de calificación en los productos creados antes del sistema de calificaciones."""
+
+    version = 1
+    name = "rating_fields"
+    collection = PRODUCT_COLLECTION
+    projection = {field: 1 for field in RATING_DEFAULTS}
+
+    def _missing(self, doc: dict) -> list:
+        return [field for field in RATING_DEFAULTS if field not in doc]
+
+    def plan(self, doc: dict) -> Optional[dict]:
+        missing = self._missing(doc)
+        return {"$set": {field: RATING_DEFAULTS[field] for field in missing}} if missing else None
+
+    def guard(self, doc: dict) -> dict:
+        # No pisar un valor que otra escritura haya puesto mientras tanto
+        return {field: {"$exists": False} for field in self._missing(doc)}
+
+
+class SearchKeywords(Migration):
+    """Palabras clave de búsqueda (ver app/search.py) de los productos que no las tienen."""
+
+    version = 2
+    name = "search_keywords"
+    collection = PRODUCT_COLLECTION
+    # Solo hace falta saber si existen, no traer el arreglo completo
+    projection = {**{field: 1 for field in SEARCH_FIELDS}, "search_keywords": {"$slice": 1}}
+
+    def plan(self, doc: dict) -> Optional[dict]:
+        if "search_keywords" in doc:
+            return None
+        return {"$set": build_search_keywords(doc.get("name"), doc.get("description"), doc.get("tags"))}
+
+    def guard(self, doc: dict) -> dict:
+        return {"search_keywords": {"$exists": False}}
+
+
+class RatingSum(Migration):
+    """`rating_sum` para los agregados incrementales, a partir del promedio y el total."""
+
+    version = 3
+    name = "rating_sum"
+    collection = PRODUCT_COLLECTION
+    projection = {"rating_sum": 1, "average_rating": 1, "total_ratings": 1}
+
+    def plan(self, doc: dict) -> Optional[dict]:
+        if "rating_sum" in doc:
+            return None
+        return {"$set": {"rating_sum": (doc.get("average_rating") or 0.0) * (doc.get("total_ratings") or 0)}}
+
+    def guard(self, doc: dict) -> dict:
+        return {
+            "rating_sum": {"$exists": False},
+            "average_rating": doc.get("average_rating"),
+            "total_ratings": doc.get("total_ratings"),
+        }
+
+
+class RatingScore(Migration):
+    """`rating_score` (promedio bayesiano del orden "best") a partir de `rating_sum` y `total_ratings`."""
+
+    version = 4
+    name = "rating_score"
+    collection = PRODUCT_COLLECTION
+    projection = {"rating_score": 1, "rating_sum": 1, "total_ratings": 1}
+
+    def plan(self, doc: dict) -> Optional[dict]:
+        if "rating_score" in doc:
+            return None
+        return {"$set": {"rating_score": rating_score(doc.get("rating_sum") or 0.0, doc.get("total_ratings") or 0)}}
+
+    def guard(self, doc: dict) -> dict:
+        return {
+            "rating_score": {"$exists": False},
+            "rating_sum": doc.get("rating_sum"),
+            "total_ratings": doc.get("total_ratings"),
+        }
+
+
+class SearchKeywordsV2(Migration):
+    """
+    Recalcula las palabras clave con las reglas actuales de app/search.py
+    (prefijos de al menos MIN_PREFIX_LENGTH y marca de inicio del nombre).
+    """
+
+    version = 5
+    name = "search_keywords_v2"
+    collection = PRODUCT_COLLECTION
+    projection = {**{field: 1 for field in SEARCH_FIELDS}, **{field: 1 for field in KEYWORD_FIELDS}}
+
+    def plan(self, doc: dict) -> Optional[dict]:
+        keywords = build_search_keywords(doc.get("name"), doc.get("description"), doc.get("tags"))
+        if all(doc.get(field) == keywords[field] for field in KEYWORD_FIELDS):
+            return None
+        return {"$set": keywords}
+
+    def guard(self, doc: dict) -> dict:
+        # Si el producto se editó mientras tanto, ya tiene las palabras clave nuevas
+        return {field: doc.get(field) for field in SEARCH_FIELDS}
+
+
+MIGRATIONS = [RatingFields(), SearchKeywords(), RatingSum(), RatingScore(), SearchKeywordsV2()]
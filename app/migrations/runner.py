@@ -0,0 +1,173 @@
+# products_service/app/migrations/runner.py
+"""
+Ejecución de migraciones de datos versionadas, por lotes y reanudables.
+
+Cada migración recorre su colección en orden de `_id` con lotes de
+`batch_size` documentos (`{"_id": {"$gt": último}}`), decide documento a
+documento qué actualizar y escribe con un `bulk_write` no ordenado por lote.
+Tras cada lote se guarda el último `_id` en `schema_migrations`, así que una
+ejecución interrumpida continúa donde se quedó; las terminadas no se repiten.
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Callable, Iterable, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+MIGRATIONS_COLLECTION = "schema_migrations"
+
+
+class Migration:
+    """
+    Migración de datos. Las subclases definen `version`, `name`, `collection`,
+    la `projection` que necesitan y `plan(doc)`, que devuelve el update para
+    ese documento o None si ya está migrado. Los updates deben ser idempotentes.
+    """
+
+    version: int
+    name: str
+    collection: str
+    projection: Optional[dict] = None
+
+    def plan(self, doc: dict) -> Optional[dict]:
+        raise NotImplementedError
+
+    def guard(self, doc: dict) -> dict:
+        """Condiciones extra del filtro de cada update (por defecto, ninguna)."""
+        return {}
+
+    @property
+    def label(self) -> str:
+        return f"{self.version:04d}_{self.name}"
+
+
+class Progress:
+    def __init__(self, total: int, done: int = 0):
+        self.total = total
+        self.done_at_start = done
+        self.done = done
+        self.modified = 0
+        self.started = time.monotonic()
+
+    @property
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return (self.done - self.done_at_start) / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        rate = self.rate
+        return max(self.total - self.done, 0) / rate if rate > 0 else None
+
+    def line(self, label: str) -> str:
+        percent = 100 * self.done / self.total if self.total else 100.0
+        eta = self.eta_seconds
+        eta_text = f"{eta:,.0f}s" if eta is not None else "?"
+        return (f"[{label}] {self.done:,}/{self.total:,} ({percent:.1f}%) "
+                f"modificados={self.modified:,} {self.rate:,.0f} docs/s ETA {eta_text}")
+
+
+async def get_status(db: AsyncIOMotorDatabase, migrations: Iterable[Migration]) -> List[dict]:
+    records = {doc["_id"]: doc async for doc in db[MIGRATIONS_COLLECTION].find({})}
+    return [
+        {"version": m.version, "name": m.name, **{k: v for k, v in records.get(m.version, {}).items() if k != "_id"}}
+        for m in migrations
+    ]
+
+
+async def run_migration(
+    db: AsyncIOMotorDatabase,
+    migration: Migration,
+    batch_size: int = 500,
+    max_rate: float = 0,
+    dry_run: bool = False,
+    report: Callable[[str], None] = print,
+) -> dict:
+    """
+    Ejecuta (o reanuda) una migración. `max_rate` limita los documentos leídos
+    por segundo (0 = sin límite). Con `dry_run` recorre todo y cuenta lo que
+    cambiaría sin escribir ni registrar nada. Devuelve el registro final.
+    """
+    records = db[MIGRATIONS_COLLECTION]
+    collection = db[migration.collection]
+    record = await records.find_one({"_id": migration.version}) or {}
+    if record.get("state") == "done":
+        report(f"[{migration.label}] ya aplicada el {record.get('finished_at')}")
+        return record
+
+    checkpoint = None if dry_run else record.get("checkpoint")
+    progress = Progress(
+        total=await collection.estimated_document_count(),
+        done=0 if dry_run else record.get("scanned", 0),
+    )
+    if not dry_run:
+        progress.modified = record.get("modified", 0)
+        await records.update_one(
+            {"_id": migration.version},
+            {"$set": {"name": migration.name, "state": "running", "updated_at": datetime.utcnow()},
+             "$setOnInsert": {"started_at": datetime.utcnow(), "scanned": 0, "modified": 0}},
+            upsert=True,
+        )
+        if checkpoint is not None:
+            report(f"[{migration.label}] reanudando después de _id={checkpoint}")
+
+    last_report = 0.0
+    while True:
+        query = {"_id": {"$gt": checkpoint}} if checkpoint is not None else {}
+        batch = await collection.find(query, migration.projection).sort("_id", 1) \
+            .limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            break
+        updates = []
+        for doc in batch:
+            update = migration.plan(doc)
+            if update is not None:
+                updates.append(UpdateOne({"_id": doc["_id"], **migration.guard(doc)}, update))
+        if dry_run:
+            progress.modified += len(updates)
+        elif updates:
+            progress.modified += (await collection.bulk_write(updates, ordered=False)).modified_count
+        checkpoint = batch[-1]["_id"]
+        progress.done += len(batch)
+        if not dry_run:
+            await records.update_one(
+                {"_id": migration.version},
+                {"$set": {"checkpoint": checkpoint, "scanned": progress.done, "modified": progress.modified,
+                          "updated_at": datetime.utcnow()}},
+            )
+        if time.monotonic() - last_report >= 1:
+            report(progress.line(migration.label))
+            last_report = time.monotonic()
+        if max_rate > 0:
+            # Ritmo objetivo: no más de `max_rate` documentos por segundo en esta ejecución
+            ahead = (progress.done - progress.done_at_start) / max_rate - (time.monotonic() - progress.started)
+            if ahead > 0:
+                await asyncio.sleep(ahead)
+
+    report(progress.line(migration.label))
+    if dry_run:
+        report(f"[{migration.label}] simulación: se modificarían {progress.modified:,} documentos")
+        return {"version": migration.version, "name": migration.name, "state": "dry_run",
+                "scanned": progress.done, "modified": progress.modified}
+    await records.update_one(
+        {"_id": migration.version},
+        {"$set": {"state": "done", "finished_at": datetime.utcnow(), "updated_at": datetime.utcnow()}},
+    )
+    return await records.find_one({"_id": migration.version})
+
+
+async def run_pending(
+    db: AsyncIOMotorDatabase,
+    migrations: Iterable[Migration],
+    target: Optional[int] = None,
+    **options,
+) -> List[dict]:
+    """Aplica en orden de versión las migraciones pendientes (hasta `target`, inclusive)."""
+    results = []
+    for migration in sorted(migrations, key=lambda m: m.version):
+        if target is not None and migration.version > target:
+            break
+        results.append(await run_migration(db, migration, **options))
+    return results
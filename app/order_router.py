@@ -1,12 +1,17 @@
 # products_service/app/order_router.py
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
-from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
 
-from .dependencies import get_current_user, get_products_collection
-from .product_service import get_product_by_id
+from common.models import OrderCreate, OrderItem, OrderPage, ReservationCreate, ReservationRead, UserInDB
+from .dependencies import get_current_user, get_db
+from .pagination import InvalidCursorError
+from .product_service import StockChangeError
+from .reservation_service import ReservationError
+from . import order_service, reservation_service
 
 router = APIRouter(tags=["orders"])
 
@@ -16,15 +21,6 @@ async def test_endpoint():
     """Endpoint de prueba para verificar que el router funciona"""
     return {"message": "Orders router working!", "status": "ok"}
 
-class OrderItem(BaseModel):
-    product_id: str
-    quantity: int
-    price: float
-    product_name: str
-
-class OrderCreate(BaseModel):
-    items: List[OrderItem]
-
 class OrderResponse(BaseModel):
     id: str
     user_id: str
@@ -36,93 +32,137 @@ class OrderResponse(BaseModel):
 @router.post("/create", response_model=dict)
 async def create_order(
     order_data: OrderCreate,
-    current_user: dict = Depends(get_current_user),
-    products_collection = Depends(get_products_collection)
+    current_user: UserInDB = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """
     Crear un nuevo pedido y actualizar el stock de los productos.
     Cualquier usuario autenticado puede realizar pedidos.
+    El stock de todos los items se descuenta de forma atómica: o se aplica
+    completo o no se aplica ninguno. Con `reservation_id` se usa el stock
+    retenido por `POST /reservations`.
     """
     try:
-        total_amount = 0
-        validated_items = []
-        
-        # Validar cada item del pedido
-        for item in order_data.items:
-            # Obtener el producto actual
-            try:
-                product = await get_product_by_id(item.product_id)
-            except Exception:
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"Producto {item.product_name} no encontrado"
-                )
-            
-            # Validar stock disponible
-            if product["stock"] < item.quantity:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Stock insuficiente para {item.product_name}. "
-                           f"Stock disponible: {product['stock']}, solicitado: {item.quantity}"
-                )
-            
-            # Calcular total
-            total_amount += item.price * item.quantity
-            validated_items.append(item)
-        
-        # Actualizar stock de todos los productos
-        for item in validated_items:
-            product = await get_product_by_id(item.product_id)
-            new_stock = product["stock"] - item.quantity
-            
-            # Actualizar stock en la base de datos
-            result = await products_collection.update_one(
-                {"_id": ObjectId(item.product_id)},
-                {"$set": {"stock": new_stock}}
+        order_doc = await order_service.place_order(
+            db, user_id=current_user.id, items=order_data.items, reservation_id=order_data.reservation_id
+        )
+    except ReservationError as e:
+        raise _reservation_http_error(e)
+    except StockChangeError as e:
+        item = order_data.items[e.index]
+        if e.reason == "not_found":
+            raise HTTPException(
+                status_code=404,
+                detail=f"Producto {item.product_name} no encontrado"
             )
-            
-            if result.modified_count == 0:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Error al actualizar stock del producto {item.product_name}"
-                )
-        
-        # Crear el registro del pedido (opcional, para historial)
-        order_doc = {
-            "user_id": current_user["user_id"] if isinstance(current_user, dict) else str(current_user.id),
-            "items": [item.dict() for item in validated_items],
-            "total_amount": total_amount,
-            "status": "completed",
-            "created_at": datetime.utcnow()
-        }
-        
-        # Aquí podrías guardar el pedido en una colección de orders si quieres
-        # orders_collection = get_orders_collection()
-        # order_result = await orders_collection.insert_one(order_doc)
-        
-        return {
-            "message": "Pedido procesado exitosamente",
-            "total_amount": total_amount,
-            "items_count": len(validated_items),
-            "order_id": str(ObjectId())  # Generar un ID temporal
-        }
-        
-    except HTTPException:
-        raise
+        detail = f"Stock insuficiente para {item.product_name}."
+        if e.available is not None:
+            detail += f" Stock disponible: {e.available}, solicitado: {item.quantity}"
+        raise HTTPException(status_code=400, detail=detail)
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error interno del servidor: {str(e)}"
         )
 
-@router.get("/my-orders")
-async def get_user_orders(current_user: dict = Depends(get_current_user)):
-    """
-    Obtener los pedidos del usuario actual.
-    Nota: Esto requeriría una colección separada de orders.
-    """
-    # Por ahora retornamos un mensaje informativo
     return {
-        "message": "Funcionalidad de historial de pedidos no implementada aún",
-        "user_id": current_user["user_id"]
+        "message": "Pedido procesado exitosamente",
+        "total_amount": order_doc["total_amount"],
+        "items_count": len(order_doc["items"]),
+        "order_id": str(order_doc["_id"])
     }
+
+def _reservation_http_error(e: ReservationError) -> HTTPException:
+    if e.reason == "not_found":
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Reserva no encontrada")
+    if e.reason == "expired":
+        return HTTPException(status_code=status.HTTP_409_CONFLICT, detail="La reserva expiró; vuelve a reservar")
+    return HTTPException(status_code=status.HTTP_409_CONFLICT, detail="La reserva ya no está activa")
+
+def _reservation_read(reservation: dict) -> ReservationRead:
+    return ReservationRead(
+        id=str(reservation["_id"]),
+        items=[{"product_id": str(line["product_id"]), "quantity": line["quantity"]} for line in reservation["items"]],
+        status=reservation["status"],
+        expires_at=reservation["expires_at"],
+    )
+
+@router.post("/reservations", response_model=ReservationRead, status_code=status.HTTP_201_CREATED)
+async def create_reservation(
+    reservation_in: ReservationCreate,
+    current_user: UserInDB = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """
+    Retener el stock del carrito durante RESERVATION_TTL_SECONDS.
+    Se reservan todos los items o ninguno; el pedido se crea después con `reservation_id`.
+    """
+    try:
+        reservation = await reservation_service.create_reservation(
+            db, current_user.id, [item.model_dump() for item in reservation_in.items]
+        )
+    except StockChangeError as e:
+        item = reservation_in.items[e.index]
+        if e.reason == "not_found":
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Producto {item.product_id} no encontrado")
+        detail = f"Stock insuficiente para el producto {item.product_id}"
+        if e.available is not None:
+            detail += f". Stock disponible: {e.available}, solicitado: {item.quantity}"
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=detail)
+    return _reservation_read(reservation)
+
+@router.delete("/reservations/{reservation_id}", response_model=ReservationRead)
+async def release_reservation(
+    reservation_id: str,
+    current_user: UserInDB = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Cancelar una reserva activa y devolver su stock."""
+    try:
+        reservation = await reservation_service.release_reservation(db, reservation_id, current_user.id)
+    except ReservationError as e:
+        raise _reservation_http_error(e)
+    return _reservation_read(reservation)
+
+@router.get("/my-orders", response_model=OrderPage)
+async def get_user_orders(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None, # `next_cursor` de la página anterior
+    current_user: UserInDB = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """
+    Obtener los pedidos del usuario actual, del más reciente al más antiguo.
+    Devuelve filas de resumen paginadas con `next_cursor`.
+    """
+    try:
+        return await order_service.get_user_orders(db, user_id=current_user.id, limit=limit, cursor=cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@router.get("/my-orders/export")
+async def export_user_orders(
+    current_user: UserInDB = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """
+    Exportar todo el historial de pedidos del usuario como NDJSON (un pedido por línea).
+    Se transmite por lotes desde la base de datos, sin cargar el historial completo.
+    """
+    async def lines():
+        async for doc in order_service.iter_user_orders(db, user_id=current_user.id):
+            order = OrderResponse(
+                id=str(doc["_id"]),
+                user_id=str(doc["user_id"]),
+                items=doc["items"],
+                total_amount=doc["total_amount"],
+                status=doc["status"],
+                created_at=doc["created_at"]
+            )
+            yield order.model_dump_json() + "\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="orders.ndjson"'}
+    )
@@ -0,0 +1,108 @@
+# products_service/app/order_service.py
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from bson import ObjectId
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
+
+from common.models import OrderItem, PyObjectId
+from .pagination import apply_cursor, encode_cursor
+from .product_service import StockChangeError, apply_stock_changes
+from .reservation_service import RESERVATION_EVENTS, consume_reservation, reactivate_reservation
+
+ORDER_COLLECTION = "orders"
+
+# Historial del usuario: más recientes primero, `_id` desempata
+ORDER_HISTORY_SORT = [("created_at", -1), ("_id", -1)]
+ORDER_SUMMARY_PROJECTION = {"total_amount": 1, "status": 1, "created_at": 1, "items_count": 1}
+
+
+async def place_order(
+    db: AsyncIOMotorDatabase, user_id: PyObjectId, items: List[OrderItem], reservation_id: Optional[str] = None
+) -> dict:
+    """
+    Valida el pedido y descuenta el stock de todos los productos.
+
+    El stock se descuenta con `$inc` condicionados (`apply_stock_changes`: un
+    solo `bulk_write` en transacción, o un `update_one` por producto en paralelo
+    sin ellas), más la inserción del pedido; solo si algo falla se hace una
+    lectura para saber qué producto y cuánto stock quedaba.
+    Con `reservation_id` el stock ya está retenido: la reserva se marca como
+    vendida y solo se ajusta la diferencia entre lo reservado y lo pedido.
+    Lanza `StockChangeError` (con el índice del item) si algo no se puede cumplir
+    y `ReservationError` si la reserva no está activa.
+    """
+    requested = {}
+    for index, item in enumerate(items):
+        if not ObjectId.is_valid(item.product_id):
+            raise StockChangeError(index, item.product_id, "not_found")
+        product_id = ObjectId(item.product_id)
+        requested[product_id] = requested.get(product_id, 0) + item.quantity
+
+    reservation = None
+    if reservation_id is not None:
+        reservation = await consume_reservation(db, reservation_id, user_id)
+        reserved = {}
+        for line in reservation["items"]:
+            reserved[line["product_id"]] = reserved.get(line["product_id"], 0) + line["quantity"]
+        # Solo lo pedido de más se descuenta ahora; lo reservado de sobra se devuelve
+        changes = [(product_id, reserved.get(product_id, 0) - quantity) for product_id, quantity in requested.items()]
+        changes += [(product_id, quantity) for product_id, quantity in reserved.items() if product_id not in requested]
+        changes = [change for change in changes if change[1]]
+        try:
+            await apply_stock_changes(db, changes)
+        except StockChangeError as e:
+            await reactivate_reservation(db, reservation["_id"])
+            product_id = changes[e.index][0]
+            index = next((i for i, item in enumerate(items) if ObjectId(item.product_id) == product_id), 0)
+            raise StockChangeError(index, product_id, e.reason, available=e.available)
+    else:
+        changes = [(ObjectId(item.product_id), -item.quantity) for item in items]
+        await apply_stock_changes(db, changes)
+
+    total_amount = sum(item.price * item.quantity for item in items)
+    order_doc = {
+        "_id": ObjectId(),
+        "user_id": user_id,
+        "items": [item.model_dump() for item in items],
+        "items_count": len(items),
+        "total_amount": total_amount,
+        "status": "completed",
+        "created_at": datetime.utcnow()
+    }
+    if reservation is not None:
+        order_doc["reservation_id"] = reservation["_id"]
+    try:
+        await db[ORDER_COLLECTION].insert_one(order_doc)
+    except Exception:
+        # Sin registro del pedido no debe quedar stock descontado
+        if changes:
+            await apply_stock_changes(db, [(product_id, -delta) for product_id, delta in changes])
+        if reservation is not None:
+            await reactivate_reservation(db, reservation["_id"])
+        raise
+    if reservation is not None:
+        RESERVATION_EVENTS.labels("consumed").inc()
+    return order_doc
+
+async def get_user_orders(
+    db: AsyncIOMotorDatabase, user_id: PyObjectId, limit: int = 20, cursor: Optional[str] = None
+) -> dict:
+    """
+    Página del historial de pedidos del usuario (solo campos de resumen).
+    Usa el índice (user_id, created_at, _id) y pagina por keyset.
+    Lanza `InvalidCursorError` si el cursor no es válido.
+    """
+    query = apply_cursor({"user_id": user_id}, ORDER_HISTORY_SORT, cursor)
+    docs = await db[ORDER_COLLECTION].find(query, ORDER_SUMMARY_PROJECTION) \
+        .sort(ORDER_HISTORY_SORT).limit(limit + 1).to_list(length=limit + 1)
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1], ORDER_HISTORY_SORT)
+    return {"orders": docs, "next_cursor": next_cursor}
+
+async def iter_user_orders(db: AsyncIOMotorDatabase, user_id: PyObjectId, batch_size: int = 500) -> AsyncIterator[dict]:
+    """Recorre todos los pedidos del usuario por lotes, sin cargarlos en memoria."""
+    cursor = db[ORDER_COLLECTION].find({"user_id": user_id}).sort(ORDER_HISTORY_SORT).batch_size(batch_size)
+    async for doc in cursor:
+        yield doc
@@ -0,0 +1,60 @@
+# products_service/app/pagination.py
+"""
+Utilidades para paginación por keyset (cursor).
+
+El cursor es opaco para el cliente: contiene los valores de la clave de orden
+del último documento de la página, serializados con `bson.json_util` (para
+conservar ObjectId y fechas) y codificados en base64 url-safe.
+"""
+import base64
+from typing import List, Optional, Tuple
+
+from bson import json_util
+
+SortSpec = List[Tuple[str, int]]
+
+
+class InvalidCursorError(ValueError):
+    """El cursor recibido no se pudo decodificar o no corresponde al orden pedido."""
+
+
+def encode_cursor(doc: dict, sort: SortSpec) -> str:
+    """Construye el cursor que apunta justo después de `doc` según `sort`."""
+    values = [doc.get(field) for field, _ in sort]
+    raw = json_util.dumps(values).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: SortSpec) -> list:
+    """Devuelve los valores de la clave de orden guardados en `cursor`."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json_util.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception as e:
+        raise InvalidCursorError(f"Cursor inválido: {e}") from e
+    if not isinstance(values, list) or len(values) != len(sort):
+        raise InvalidCursorError("Cursor inválido para este orden")
+    return values
+
+
+def keyset_filter(sort: SortSpec, values: list) -> dict:
+    """
+    Filtro que selecciona los documentos posteriores a `values` según `sort`.
+
+    Para [(a, 1), (_id, 1)] genera {"$or": [{a: {$gt: va}}, {a: va, _id: {$gt: vid}}]},
+    que Mongo resuelve con un recorrido acotado sobre el índice compuesto.
+    """
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {prev_field: values[j] for j, (prev_field, _) in enumerate(sort[:i])}
+        clause[field] = {"$gt" if direction == 1 else "$lt": values[i]}
+        clauses.append(clause)
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+def apply_cursor(query: dict, sort: SortSpec, cursor: Optional[str]) -> dict:
+    """Combina la consulta base con el filtro de keyset del cursor (si hay)."""
+    if not cursor:
+        return query
+    seek = keyset_filter(sort, decode_cursor(cursor, sort))
+    return {"$and": [query, seek]} if query else seek
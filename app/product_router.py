@@ -1,46 +1,79 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, Header, HTTPException, status, UploadFile, File, Query, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, StreamingResponse
 from typing import List
 from motor.motor_asyncio import AsyncIOMotorDatabase
-import shutil
-import uuid 
-from .dependencies import get_db, get_current_active_user, get_current_user # Importa el dependency de usuario
-from common.models import ProductCreate, ProductRead, ProductUpdate, UserInDB, RatingCreate, RatingRead, RatingInput, ProductPage # Importa UserInDB
-from . import product_service
-from typing import List, Optional
-import os
+from .dependencies import get_db, get_read_db, get_cached_read_db, get_current_active_user, get_current_user # Importa el dependency de usuario
+from common.models import ProductCreate, ProductRead, ProductUpdate, UserInDB, RatingCreate, RatingRead, RatingInput, ProductPage, ProductBatch, ProductBatchRequest, ProductFacets # Importa UserInDB
+from . import product_service, image_service, http_cache, fast_json, fieldsets, catalog_io, idempotency, facets, top_rated
+from .config import settings
+from .cache import listing_generation
+from .pagination import InvalidCursorError
+from .search import MIN_PREFIX_LENGTH
+from typing import List, Literal, Optional
 from bson import ObjectId
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, ValidationError, model_validator
 
 router = APIRouter()
 
 
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # llega a product_service/
-UPLOAD_DIRECTORY = os.path.join(BASE_DIR, "static", "images")
-
-# Asegurar que el directorio de carga existe
-os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
-print(f"UPLOAD_DIRECTORY configurado en: {UPLOAD_DIRECTORY}")
-
-# UPLOAD_DIRECTORY = os.path.join(os.getcwd(), "products_service", "static", "images")
-
-# UPLOAD_DIRECTORY = "products_service/static/images"
-
 @router.post("/upload-image", status_code=status.HTTP_201_CREATED)
 async def upload_image(file: UploadFile = File(...), user: UserInDB = Depends(get_current_active_user)):
-    # Genera un nombre de archivo único para evitar sobreescribir imágenes
-    file_extension = file.filename.split(".")[-1]
-    unique_filename = f"{uuid.uuid4()}.{file_extension}"
-    file_path = os.path.join(UPLOAD_DIRECTORY, unique_filename)
-    
+    """
+    Sube una imagen de producto. Devuelve la URL del original y de sus variantes
+    webp redimensionadas (`thumb` para el grid, `medium` para el detalle).
+    Una imagen idéntica a otra ya subida reutiliza los mismos archivos.
+    """
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        return await image_service.save_image(file)
+    except image_service.ImageTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except image_service.InvalidImageError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"No se pudo guardar la imagen: {e}")
     finally:
-        file.file.close()
-    image_url = f"/static/images/{unique_filename}"
-    return {"image_url": image_url}
+        await file.close()
+
+@router.post("/import", status_code=status.HTTP_200_OK)
+async def import_products(
+    file: UploadFile = File(...),
+    format: Literal["ndjson", "csv"] = "ndjson",
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """
+    Carga masiva de productos del usuario desde NDJSON (un objeto por línea) o CSV
+    con encabezado (`tags` separados por `|`). Cada fila se valida como
+    `ProductCreate`; las inválidas se informan por número de línea y el resto se importa.
+    """
+    try:
+        return await catalog_io.import_products(db, catalog_io.iter_rows(file, format), owner_id=current_user.id)
+    except catalog_io.ImportTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    finally:
+        await file.close()
+
+@router.get("/export")
+async def export_products(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    category: Optional[str] = None,
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """
+    Exporta los productos del usuario (todos, si es superusuario) en NDJSON o CSV.
+    Se transmite por lotes desde la base de datos; el CSV se puede volver a importar.
+    """
+    query = {} if current_user.is_superuser else {"owner_id": current_user.id}
+    if category:
+        query["category"] = category
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        catalog_io.export_products(db, query, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="products.{format}"'}
+    )
 
 @router.post("/", response_model=ProductRead, status_code=status.HTTP_201_CREATED)
 async def create_new_product(
@@ -52,23 +85,141 @@ async def create_new_product(
 
 @router.get("/", response_model=ProductPage) # Antes era List[ProductRead]
 async def read_all_products(
-    db: AsyncIOMotorDatabase = Depends(get_db),
-    search: Optional[str] = None,
+    request: Request,
+    db: AsyncIOMotorDatabase = Depends(get_cached_read_db),
+    search: Optional[str] = Query(None, description=(
+        "Palabras que deben aparecer (como prefijo) en nombre, etiquetas o descripción. "
+        f"Las de menos de {MIN_PREFIX_LENGTH} caracteres filtran pero no cuentan para la relevancia"
+    )),
     category: Optional[str] = None,
     sort_by: Optional[str] = None,
     skip: int = 0,
-    limit: int = 3 # Recomendado para grids
+    limit: int = Query(3, ge=1, le=100), # Recomendado para grids
+    cursor: Optional[str] = None, # `next_cursor` de la página anterior (paginación por keyset)
+    count: Optional[Literal["exact", "cached", "estimated", "facet"]] = None, # Estrategia para `total`
+    fields: Optional[str] = Query(None, description="Campos a devolver, p. ej. `name,price,image_url` (`_id` siempre)")
 ):
-    # La llamada al servicio ya está bien, no necesita cambios
-    return await product_service.get_all_products(
-        db, search=search, category=category, sort_by=sort_by, skip=skip, limit=limit
-    )
+    # Respuesta cacheada por parámetros; cualquier escritura de productos cambia la generación
+    key = ("list", listing_generation(), http_cache.query_key(request))
+    cached = http_cache.get_cached(key)
+    if cached is None:
+        fast = settings.FAST_JSON_LISTING
+        try:
+            selected = fieldsets.parse_fields(fields)
+            page = await product_service.get_all_products(
+                db, search=search, category=category, sort_by=sort_by, skip=skip, limit=limit, cursor=cursor,
+                count_strategy=count, raw=fast, fields=selected
+            )
+        except (InvalidCursorError, fieldsets.InvalidFieldsError) as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        if fast:
+            body = fast_json.dumps_product_page(page["total"], page["products"], page["next_cursor"], selected)
+        else:
+            page_model = ProductPage if selected is None else fieldsets.partial_page_model(selected)
+            body = page_model(
+                total=page["total"],
+                products=[p.model_dump(by_alias=True) for p in page["products"]],
+                next_cursor=page["next_cursor"]
+            ).model_dump_json(by_alias=True).encode()
+        cached = (http_cache.body_etag(body), body)
+        http_cache.store(key, *cached)
+    return http_cache.json_response(request, *cached)
+
+async def _read_batch(db: AsyncIOMotorDatabase, batch: ProductBatchRequest) -> JSONResponse:
+    try:
+        selected = fieldsets.parse_fields(batch.fields)
+    except fieldsets.InvalidFieldsError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    result = await product_service.get_products_by_ids(db, batch.ids, fields=selected)
+    model = ProductRead if selected is None else fieldsets.partial_model(selected)
+    products = [
+        model.model_validate(p.model_dump(by_alias=True)).model_dump(mode="json", by_alias=True)
+        for p in result["products"]
+    ]
+    return JSONResponse({"products": products, "missing": result["missing"]})
+
+# Declaradas antes de /{product_id} para que "batch" no se tome como un id
+@router.get("/batch", response_model=ProductBatch)
+async def read_products_batch(
+    db: AsyncIOMotorDatabase = Depends(get_read_db),
+    ids: str = Query(..., description="Ids separados por comas (máximo 100), p. ej. carrito o vistos recientemente"),
+    fields: Optional[str] = Query(None, description="Campos a devolver, p. ej. `name,price,image_url` (`_id` siempre)")
+):
+    """Varios productos en una sola consulta, en el orden pedido; `missing` lista los ids que no existen."""
+    try:
+        batch = ProductBatchRequest(ids=[i.strip() for i in ids.split(",") if i.strip()], fields=fields)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+    return await _read_batch(db, batch)
+
+@router.post("/batch", response_model=ProductBatch)
+async def read_products_batch_post(batch: ProductBatchRequest, db: AsyncIOMotorDatabase = Depends(get_read_db)):
+    """Igual que `GET /batch`, con los ids en el cuerpo (para listas largas)."""
+    return await _read_batch(db, batch)
+
+@router.get("/facets", response_model=ProductFacets)
+async def read_product_facets(request: Request, db: AsyncIOMotorDatabase = Depends(get_cached_read_db)):
+    """
+    Conteos del panel de filtros (categorías, rangos de precio, disponibilidad),
+    leídos del resumen que mantienen las escrituras (ver app/facets.py).
+    """
+    key = ("facets", listing_generation())
+    cached = http_cache.get_cached(key)
+    if cached is None:
+        body = ProductFacets(**await facets.get_facets(db)).model_dump_json().encode()
+        cached = (http_cache.body_etag(body), body)
+        http_cache.store(key, *cached)
+    return http_cache.json_response(request, *cached)
+
+@router.get("/top", response_model=top_rated.TopRatedPage)
+async def read_top_rated(
+    request: Request,
+    category: str,
+    limit: int = Query(10, ge=1, le=settings.TOP_RATED_SIZE),
+    db: AsyncIOMotorDatabase = Depends(get_cached_read_db)
+):
+    """
+    Mejor calificados de una categoría (orden "best"), para carruseles.
+    Sale de la lista precalculada de la categoría, sin ordenar la colección.
+    """
+    key = ("top", listing_generation(), category, limit)
+    cached = http_cache.get_cached(key)
+    if cached is None:
+        products = await product_service.get_top_rated(db, category, limit)
+        body = top_rated.TopRatedPage(category=category, products=products).model_dump_json(by_alias=True).encode()
+        cached = (http_cache.body_etag(body), body)
+        http_cache.store(key, *cached)
+    return http_cache.json_response(request, *cached)
 
 @router.get("/{product_id}", response_model=ProductRead)
-async def read_product_by_id(product_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
-    product = await product_service.get_product_by_id(db, product_id=product_id)
-    if not product: raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Producto no encontrado")
-    return product
+async def read_product_by_id(
+    product_id: str,
+    request: Request,
+    db: AsyncIOMotorDatabase = Depends(get_cached_read_db),
+    fields: Optional[str] = Query(None, description="Campos a devolver, p. ej. `name,price,image_url` (`_id` siempre)")
+):
+    try:
+        selected = fieldsets.parse_fields(fields)
+    except fieldsets.InvalidFieldsError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if not ObjectId.is_valid(product_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Producto no encontrado")
+    # Misma forma que la clave que borra `invalidate_products` (hex en minúsculas)
+    product_id = str(ObjectId(product_id))
+    key = ("detail", product_id) if selected is None else ("detail", product_id, selected)
+    cached = http_cache.get_cached(key)
+    if cached is None:
+        product = await product_service.get_product_by_id(db, product_id=product_id, fields=selected)
+        if not product: raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Producto no encontrado")
+        if selected is None:
+            body = ProductRead.model_validate(product.model_dump(by_alias=True)).model_dump_json(by_alias=True).encode()
+            # ETag fuerte a partir de la versión que mantiene product_service
+            cached = (f'"{product.id}-{product.version}"', body)
+        else:
+            body = product.model_dump_json(by_alias=True).encode()
+            cached = (http_cache.body_etag(body), body)
+        http_cache.store(key, *cached)
+    return http_cache.json_response(request, *cached)
 @router.put("/{product_id}", response_model=ProductRead)
 async def update_existing_product(
     product_id: str, 
@@ -122,10 +273,32 @@ async def create_product_rating(
 @router.get("/{product_id}/ratings", response_model=List[RatingRead])
 async def get_product_ratings(
     product_id: str,
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    response: Response,
+    db: AsyncIOMotorDatabase = Depends(get_read_db),
+    sort: Literal["newest", "rating"] = "newest",
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None, # Valor de `X-Next-Cursor` de la página anterior
+    format: Literal["json", "ndjson"] = "json"
 ):
-    """Obtener todas las calificaciones de un producto."""
-    return await product_service.get_product_ratings(db, product_id)
+    """
+    Obtener las calificaciones de un producto.
+    En modo `json` devuelve una página; si hay más, el cursor de la siguiente viene
+    en la cabecera `X-Next-Cursor` (expuesta por CORS al frontend). En modo `ndjson` transmite todas las
+    calificaciones (una por línea) directamente desde la base de datos.
+    """
+    if format == "ndjson":
+        async def lines():
+            async for batch in product_service.iter_product_ratings(db, product_id, sort=sort):
+                yield "".join(RatingRead(**doc).model_dump_json() + "\n" for doc in batch)
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    try:
+        page = await product_service.get_product_ratings(db, product_id, sort=sort, limit=limit, cursor=cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
+    return page["ratings"]
 
 @router.get("/{product_id}/ratings/me", response_model=RatingRead)
 async def get_my_rating_for_product(
@@ -140,59 +313,97 @@ async def get_my_rating_for_product(
     return rating
 
 # Modelo para actualización de stock desde carrito
+MAX_CART_STOCK_LINES = 100
+
 class CartStockUpdate(BaseModel):
     product_id: str
-    new_stock: int
+    new_stock: Optional[int] = Field(None, ge=0)  # valor absoluto
+    delta: Optional[int] = None  # cambio relativo (negativo para descontar)
+
+    @model_validator(mode="after")
+    def _one_of(self):
+        if (self.new_stock is None) == (self.delta is None):
+            raise ValueError("Indica exactamente uno de 'new_stock' o 'delta'")
+        return self
+
+_STOCK_ERROR_STATUS = {
+    "not_found": status.HTTP_404_NOT_FOUND,
+    "insufficient_stock": status.HTTP_409_CONFLICT,
+    "conflict": status.HTTP_409_CONFLICT,
+}
+_STOCK_ERROR_DETAIL = {
+    "not_found": "Producto {} no encontrado",
+    "insufficient_stock": "Stock insuficiente para el producto {}",
+    "conflict": "El stock del producto {} cambió durante la actualización; vuelve a intentarlo",
+}
+
+async def _apply_cart_stock_updates(db: AsyncIOMotorDatabase, updates: List[CartStockUpdate]):
+    """(status_code, cuerpo) de aplicar el carrito; los errores de negocio también se devuelven."""
+    try:
+        results = await product_service.update_stock_levels(
+            db, [(update.product_id, update.delta, update.new_stock) for update in updates]
+        )
+    except product_service.StockChangeError as e:
+        product_id = updates[e.index].product_id
+        failed = {"product_id": product_id, "status": e.reason}
+        if e.available is not None:
+            failed["available"] = e.available
+        return _STOCK_ERROR_STATUS[e.reason], {
+            "detail": _STOCK_ERROR_DETAIL[e.reason].format(product_id),
+            "results": [
+                failed if index == e.index else {"product_id": update.product_id, "status": "not_applied"}
+                for index, update in enumerate(updates)
+            ],
+        }
+    return status.HTTP_200_OK, {
+        "message": "Stock actualizado exitosamente",
+        "updated_products": results,
+        "total_updated": len(results),
+    }
 
 @router.post("/cart/update-stock", status_code=status.HTTP_200_OK)
 async def update_stock_from_cart(
     updates: List[CartStockUpdate],
     db: AsyncIOMotorDatabase = Depends(get_db),
-    current_user: UserInDB = Depends(get_current_user)
+    current_user: UserInDB = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=200),
 ):
     """
     Endpoint especial para actualizar stock desde el carrito.
     Permite a cualquier usuario autenticado actualizar el stock de productos.
+
+    Cada línea lleva `new_stock` (valor absoluto) o `delta` (relativo). Se aplican
+    todas o ninguna; la respuesta trae un resultado por línea. Con la cabecera
+    `Idempotency-Key`, un reintento con la misma clave y el mismo cuerpo devuelve
+    la respuesta original sin volver a aplicar los cambios.
     """
-    try:
-        updated_products = []
-        
-        for update in updates:
-            # Validar que el producto existe
-            product = await product_service.get_product_by_id(update.product_id)
-            if not product:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND, 
-                    detail=f"Producto {update.product_id} no encontrado"
-                )
-            
-            # Actualizar stock directamente en la base de datos
-            result = await db["products"].update_one(
-                {"_id": ObjectId(update.product_id)},
-                {"$set": {"stock": update.new_stock}}
-            )
-            
-            if result.modified_count == 0:
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"No se pudo actualizar el stock del producto {update.product_id}"
-                )
-            
-            updated_products.append({
-                "product_id": update.product_id,
-                "previous_stock": product["stock"],
-                "new_stock": update.new_stock,
-                "status": "updated"
-            })
-        
-        return {
-            "message": "Stock actualizado exitosamente",
-            "updated_products": updated_products,
-            "total_updated": len(updated_products)
-        }
-        
-    except Exception as e:
+    if not updates or len(updates) > MAX_CART_STOCK_LINES:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error actualizando stock: {str(e)}"
-        )
\ No newline at end of file
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"El carrito debe tener entre 1 y {MAX_CART_STOCK_LINES} líneas",
+        )
+    product_ids = [update.product_id for update in updates]
+    if len(set(product_ids)) != len(product_ids):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Hay productos repetidos en el carrito")
+
+    if idempotency_key is None:
+        status_code, body = await _apply_cart_stock_updates(db, updates)
+        return JSONResponse(status_code=status_code, content=body)
+
+    scope = f"{current_user.id}:cart-stock"
+    payload = [update.model_dump() for update in updates]
+    try:
+        stored = await idempotency.begin(db, scope, idempotency_key, payload)
+    except idempotency.IdempotencyConflictError as e:
+        if e.reason == "in_progress":
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="La petición original con esta Idempotency-Key sigue en curso")
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="La Idempotency-Key ya se usó con otro contenido")
+    if stored is not None:
+        return JSONResponse(status_code=stored["status_code"], content=stored["body"], headers={"Idempotent-Replayed": "true"})
+    try:
+        status_code, body = await _apply_cart_stock_updates(db, updates)
+    except Exception:
+        await idempotency.release(db, scope, idempotency_key)
+        raise
+    await idempotency.complete(db, scope, idempotency_key, status_code, body)
+    return JSONResponse(status_code=status_code, content=body)
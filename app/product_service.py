@@ -1,119 +1,642 @@
+import asyncio
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from bson import ObjectId
-from typing import List, Optional
+from bson import ObjectId, json_util
+from pymongo import ReturnDocument, UpdateOne
+from typing import AsyncIterator, List, Optional, Tuple, Union
+from datetime import datetime
 from common.models import ProductCreate, ProductUpdate, ProductInDB, PyObjectId, RatingCreate, RatingInDB, RatingRead
+from .config import settings
+from . import facets, top_rated
+from .cache import count_cache, invalidate_products
+from .fieldsets import Fieldset, partial_model, projection
+from .pagination import SortSpec, apply_cursor, decode_cursor, encode_cursor, keyset_filter
+from .search import KEYWORD_FIELDS, SEARCH_FIELDS, build_search_keywords, parse_search, ranked_terms, relevance_stage, search_filter
 
 
 PRODUCT_COLLECTION = "products"
 RATING_COLLECTION = "ratings"
 
+# Reservas cuyo stock ya se devolvió a este producto y aún no terminan de liberarse (ver reservation_service)
+RELEASED_HOLDS_FIELD = "released_holds"
+# Campos internos que no se devuelven en las lecturas
+INTERNAL_FIELDS = KEYWORD_FIELDS + ("rating_sum", "in_stock", RELEASED_HOLDS_FIELD)
+PRODUCT_PROJECTION = {field: 0 for field in INTERNAL_FIELDS}
+
+# Orden de cada `sort_by`; `_id` desempata para que el keyset sea estable
+LISTING_SORTS = {
+    None: [("_id", 1)],
+    "price_asc": [("price", 1), ("_id", 1)],
+    "price_desc": [("price", -1), ("_id", -1)],
+    "rating_desc": [("average_rating", -1), ("_id", -1)],
+    "most_rated": [("total_ratings", -1), ("_id", -1)],
+    # Promedio bayesiano guardado en `rating_score` (ver `rating_score`)
+    "best": [("rating_score", -1), ("_id", -1)],
+    "relevance": [("_score", -1), ("_id", 1)],
+}
+
+def rating_score(rating_sum: float, total_ratings: int) -> float:
+    """
+    Promedio bayesiano: las calificaciones del producto más BEST_SORT_PRIOR_WEIGHT
+    calificaciones ficticias de BEST_SORT_PRIOR_MEAN. Un 5 con una sola
+    calificación no supera a un 4.8 con cien.
+    """
+    weight, mean = settings.BEST_SORT_PRIOR_WEIGHT, settings.BEST_SORT_PRIOR_MEAN
+    return (weight * mean + rating_sum) / (weight + total_ratings) if weight + total_ratings else 0.0
+
+def _rating_score_expr() -> dict:
+    """`rating_score` como expresión de agregación sobre `rating_sum` y `total_ratings`."""
+    weight, mean = settings.BEST_SORT_PRIOR_WEIGHT, settings.BEST_SORT_PRIOR_MEAN
+    denominator = {"$add": [weight, {"$ifNull": ["$total_ratings", 0]}]}
+    numerator = {"$add": [weight * mean, {"$ifNull": ["$rating_sum", 0]}]}
+    return {"$cond": [{"$gt": [denominator, 0]}, {"$divide": [numerator, denominator]}, 0.0]}
+
+def get_listing_sort(sort_by: Optional[str]) -> SortSpec:
+    return LISTING_SORTS.get(sort_by, LISTING_SORTS[None])
+
+def build_listing_query(search: Optional[str], category: Optional[str]) -> Tuple[dict, List[str]]:
+    """Filtro de Mongo para el listado y los términos que cuentan para la relevancia."""
+    query = {}
+    terms = []
+    if search:
+        if settings.SEARCH_BACKEND == "regex":
+            query["name"] = {"$regex": search, "$options": "i"}
+        else:
+            parsed = parse_search(search)
+            if parsed:
+                query.update(search_filter(parsed))
+            terms = ranked_terms(parsed)
+    if category:
+        query["category"] = category
+    return query, terms
+
+async def count_products(db: AsyncIOMotorDatabase, query: dict, strategy: Optional[str] = None) -> int:
+    """
+    Cuenta los productos que cumplen `query` según la estrategia:
+    - "exact": `count_documents` en cada llamada.
+    - "cached": conteo exacto cacheado por forma de consulta; se invalida con
+      cada escritura de productos (y expira por TTL como red de seguridad).
+    - "estimated": metadatos de la colección si no hay filtro; con filtro, como "cached".
+    """
+    strategy = strategy or settings.COUNT_STRATEGY
+    collection = db[PRODUCT_COLLECTION]
+    if strategy == "estimated" and not query:
+        return await collection.estimated_document_count()
+    if strategy in ("cached", "estimated"):
+        key = json_util.dumps(query, sort_keys=True)
+        total = count_cache.get(key)
+        if total is None:
+            total = await collection.count_documents(query)
+            count_cache.set(key, total)
+        return total
+    return await collection.count_documents(query)
+
 async def get_all_products(
     db: AsyncIOMotorDatabase,
     search: Optional[str] = None,
     category: Optional[str] = None,
     sort_by: Optional[str] = None,
     skip: int = 0,
-    limit: int = 20
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    count_strategy: Optional[str] = None,
+    raw: bool = False,
+    fields: Optional[Fieldset] = None
 ) -> dict:  # El tipo de retorno ahora es un diccionario
     """
     Obtiene una lista paginada y filtrada de productos, junto con el conteo total.
+
+    Con `cursor` (el `next_cursor` de la página anterior) se pagina por keyset y
+    `skip` se ignora: cada página cuesta lo mismo sin importar su profundidad.
+    Si hay búsqueda y no se pide otro orden, se ordena por relevancia.
+    `count_strategy` elige cómo se obtiene `total` (ver `count_products`); con
+    "facet" la página y el total salen de una sola agregación.
+    Con `raw` los productos se devuelven como documentos de Motor, sin validar
+    (para `fast_json`).
+    Con `fields` (ver `fieldsets.parse_fields`) solo se leen esos campos y los
+    productos son instancias del modelo parcial correspondiente.
+    Lanza `InvalidCursorError` si el cursor no es válido para `sort_by`.
     """
-    query = {}
-    if search:
-        query["name"] = {"$regex": search, "$options": "i"}
-    if category:
-        query["category"] = category
-        
-    # Primero, contamos el total de documentos que coinciden con la consulta
-    total_count = await db[PRODUCT_COLLECTION].count_documents(query)
-    
-    # Luego, aplicamos paginación y ordenamiento para obtener solo la página actual
-    products_cursor = db[PRODUCT_COLLECTION].find(query).skip(skip).limit(limit)
-    
-    if sort_by:
-        if sort_by == "price_asc":
-            products_cursor = products_cursor.sort("price", 1)
-        elif sort_by == "price_desc":
-            products_cursor = products_cursor.sort("price", -1)
+    query, terms = build_listing_query(search, category)
+    if terms and sort_by is None:
+        sort_by = "relevance"
+    if sort_by == "relevance" and not terms:
+        sort_by = None
+    sort = get_listing_sort(sort_by)
+    strategy = count_strategy or settings.COUNT_STRATEGY
+    collection = db[PRODUCT_COLLECTION]
+    # Las claves del orden se leen siempre: hacen falta para `next_cursor`
+    product_projection = PRODUCT_PROJECTION if fields is None else projection(fields, (k for k, _ in sort))
 
-    product_docs = await products_cursor.to_list(length=limit)
+    # Etapas de la página actual. Se pide un documento extra para saber si
+    # existe una página siguiente.
+    page_stages = []
+    if sort_by == "relevance":
+        # La puntuación se calcula solo sobre los documentos que devuelve el índice
+        page_stages.append(relevance_stage(terms))
+    if cursor:
+        page_stages.append({"$match": keyset_filter(sort, decode_cursor(cursor, sort))})
+    page_stages.append({"$sort": dict(sort)})
+    if not cursor and skip:
+        page_stages.append({"$skip": skip})
+    page_stages += [{"$limit": limit + 1}, {"$project": product_projection}]
+
+    if strategy == "facet":
+        # Página y total en un solo viaje a la base de datos
+        pipeline = [{"$match": query}, {"$facet": {"products": page_stages, "total": [{"$count": "n"}]}}]
+        result = (await collection.aggregate(pipeline).to_list(length=1))[0]
+        product_docs = result["products"]
+        total_count = result["total"][0]["n"] if result["total"] else 0
+    else:
+        total_count = await count_products(db, query, strategy)
+        if sort_by == "relevance":
+            product_docs = await collection.aggregate([{"$match": query}] + page_stages).to_list(length=limit + 1)
+        else:
+            products_cursor = collection.find(apply_cursor(query, sort, cursor), product_projection).sort(sort)
+            if not cursor and skip:
+                products_cursor = products_cursor.skip(skip)
+            product_docs = await products_cursor.limit(limit + 1).to_list(length=limit + 1)
+
+    next_cursor = None
+    if len(product_docs) > limit:
+        product_docs = product_docs[:limit]
+        next_cursor = encode_cursor(product_docs[-1], sort)
     
     # Devolvemos un diccionario con el total y los productos
+    if raw:
+        products = product_docs
+    else:
+        model = ProductInDB if fields is None else partial_model(fields)
+        products = [model(**doc) for doc in product_docs]
     return {
         "total": total_count,
-        "products": [ProductInDB(**doc) for doc in product_docs]
+        "products": products,
+        "next_cursor": next_cursor
     }
-async def get_product_by_id(db: AsyncIOMotorDatabase, product_id: str) -> Optional[ProductInDB]:
+async def get_product_by_id(
+    db: AsyncIOMotorDatabase, product_id: str, fields: Optional[Fieldset] = None
+) -> Optional[ProductInDB]:
+    """Con `fields` devuelve una instancia de `fieldsets.partial_model(fields)`."""
     if not ObjectId.is_valid(product_id): return None
-    doc = await db[PRODUCT_COLLECTION].find_one({"_id": ObjectId(product_id)})
-    return ProductInDB(**doc) if doc else None
-async def create_product(db: AsyncIOMotorDatabase, product_in: ProductCreate, owner_id: PyObjectId) -> ProductInDB:
-    """Crea un nuevo producto en la base de datos, asignando un propietario."""
+    product_projection = PRODUCT_PROJECTION if fields is None else projection(fields)
+    doc = await db[PRODUCT_COLLECTION].find_one({"_id": ObjectId(product_id)}, product_projection)
+    if not doc: return None
+    return ProductInDB(**doc) if fields is None else partial_model(fields)(**doc)
+async def get_products_by_ids(
+    db: AsyncIOMotorDatabase, product_ids: List[str], fields: Optional[Fieldset] = None, raw: bool = False
+) -> dict:
+    """
+    Resuelve varios productos con una sola consulta `$in`.
+    Devuelve `{"products": [...], "missing": [...]}`: los productos en el orden
+    pedido (los repetidos una sola vez) y los ids inválidos o inexistentes.
+    `fields` y `raw` funcionan como en `get_all_products`.
+    """
+    ordered_ids = list(dict.fromkeys(str(product_id) for product_id in product_ids))
+    valid_ids = [ObjectId(product_id) for product_id in ordered_ids if ObjectId.is_valid(product_id)]
+    product_projection = PRODUCT_PROJECTION if fields is None else projection(fields)
+    docs_by_id = {}
+    if valid_ids:
+        cursor = db[PRODUCT_COLLECTION].find({"_id": {"$in": valid_ids}}, product_projection)
+        docs_by_id = {str(doc["_id"]): doc async for doc in cursor}
+    docs = [docs_by_id[product_id] for product_id in ordered_ids if product_id in docs_by_id]
+    if raw:
+        products = docs
+    else:
+        model = ProductInDB if fields is None else partial_model(fields)
+        products = [model(**doc) for doc in docs]
+    return {"products": products, "missing": [product_id for product_id in ordered_ids if product_id not in docs_by_id]}
+def build_product_doc(product_in: ProductCreate, owner_id: PyObjectId) -> dict:
+    """Documento listo para insertar, con los campos internos (búsqueda, agregados, versión)."""
     product_data = product_in.model_dump()
     product_data["owner_id"] = owner_id # Asigna el propietario
     db_product = ProductInDB(**product_data)
     doc = db_product.model_dump(by_alias=True)
+    doc.update(build_search_keywords(doc.get("name"), doc.get("description"), doc.get("tags")))
+    doc["rating_sum"] = (doc.get("average_rating") or 0.0) * (doc.get("total_ratings") or 0)
+    doc["rating_score"] = rating_score(doc["rating_sum"], doc.get("total_ratings") or 0)
+    doc["in_stock"] = (doc.get("stock") or 0) > 0
+    doc["version"] = 1
+    doc["updated_at"] = datetime.utcnow()
+    return doc
+async def create_product(db: AsyncIOMotorDatabase, product_in: ProductCreate, owner_id: PyObjectId) -> ProductInDB:
+    """Crea un nuevo producto en la base de datos, asignando un propietario."""
+    doc = build_product_doc(product_in, owner_id)
     result = await db[PRODUCT_COLLECTION].insert_one(doc)
-    created_doc = await db[PRODUCT_COLLECTION].find_one({"_id": result.inserted_id})
+    invalidate_products(str(result.inserted_id))
+    await facets.record_changes(db, [(None, doc)])
+    created_doc = await db[PRODUCT_COLLECTION].find_one({"_id": result.inserted_id}, PRODUCT_PROJECTION)
     return ProductInDB(**created_doc)
 async def update_product(db: AsyncIOMotorDatabase, product_id: str, product_in: ProductUpdate) -> Optional[ProductInDB]:
     update_data = product_in.model_dump(exclude_unset=True)
     if not update_data: return await get_product_by_id(db, product_id)
-    doc = await db[PRODUCT_COLLECTION].find_one_and_update({"_id": ObjectId(product_id)}, {"$set": update_data}, return_document=True)
-    return ProductInDB(**doc) if doc else None
+    if any(field in update_data for field in SEARCH_FIELDS):
+        # Recalcula las palabras clave con los campos de texto resultantes
+        current = await db[PRODUCT_COLLECTION].find_one({"_id": ObjectId(product_id)}, {f: 1 for f in SEARCH_FIELDS})
+        if current is None: return None
+        merged = {**current, **update_data}
+        update_data.update(build_search_keywords(merged.get("name"), merged.get("description"), merged.get("tags")))
+    if "stock" in update_data:
+        update_data["in_stock"] = update_data["stock"] > 0
+    # Mongo guarda milisegundos: así el documento devuelto coincide con el guardado
+    now = datetime.utcnow()
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    # Se pide el documento anterior (con `in_stock`) para ajustar las facetas sin otra lectura
+    before = await db[PRODUCT_COLLECTION].find_one_and_update(
+        {"_id": ObjectId(product_id)},
+        {"$set": {**update_data, "updated_at": now}, "$inc": {"version": 1}},
+        projection={field: 0 for field in INTERNAL_FIELDS if field != "in_stock"},
+        return_document=ReturnDocument.BEFORE
+    )
+    if not before: return None
+    doc = {**before, **update_data, "updated_at": now, "version": before.get("version", 0) + 1}
+    invalidate_products(str(before["_id"]))
+    if any(field in update_data for field in facets.FACET_FIELDS):
+        await facets.record_changes(db, [(before, doc)])
+    if top_rated.qualifies(before) and any(field in update_data for field in top_rated.TOP_FIELDS):
+        for category in {before.get("category"), doc.get("category")}:
+            await _update_top_rated(db, category, doc)
+    return ProductInDB(**doc)
 async def delete_product(db: AsyncIOMotorDatabase, product_id: str) -> bool:
-    result = await db[PRODUCT_COLLECTION].delete_one({"_id": ObjectId(product_id)})
-    return result.deleted_count > 0
+    doc = await db[PRODUCT_COLLECTION].find_one_and_delete(
+        {"_id": ObjectId(product_id)}, projection={**{field: 1 for field in facets.FACET_FIELDS}, "total_ratings": 1}
+    )
+    if doc:
+        invalidate_products(str(doc["_id"]))
+        await facets.record_changes(db, [(doc, None)])
+        if top_rated.qualifies(doc):
+            await _update_top_rated(db, doc.get("category"), doc, removed=True)
+    return doc is not None
+
+async def ensure_search_index(db: AsyncIOMotorDatabase):
+    """Índice multikey que respalda la búsqueda por palabras clave (el mismo que declara app/indexes.py)."""
+    await db[PRODUCT_COLLECTION].create_index("search_keywords", name="search_keywords")
+
+async def backfill_search_keywords(db: AsyncIOMotorDatabase, batch_size: int = 500) -> int:
+    """
+    Calcula las palabras clave de los productos creados antes de existir la búsqueda.
+    Para catálogos grandes conviene la migración reanudable (`manage.py migrate run`).
+    """
+    updated = 0
+    batch = []
+    cursor = db[PRODUCT_COLLECTION].find({"search_keywords": {"$exists": False}}, {f: 1 for f in SEARCH_FIELDS})
+    async for doc in cursor:
+        keywords = build_search_keywords(doc.get("name"), doc.get("description"), doc.get("tags"))
+        batch.append(UpdateOne({"_id": doc["_id"], "search_keywords": {"$exists": False}}, {"$set": keywords}))
+        if len(batch) >= batch_size:
+            updated += (await db[PRODUCT_COLLECTION].bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        updated += (await db[PRODUCT_COLLECTION].bulk_write(batch, ordered=False)).modified_count
+    return updated
+
+# Cambios de stock (pedidos, carrito)
+# (product_id, delta) o (product_id, delta, stock esperado): con el stock esperado
+# el cambio solo se aplica si el producto sigue teniendo exactamente ese valor.
+StockChange = Union[Tuple[ObjectId, int], Tuple[ObjectId, int, Optional[int]]]
+
+class StockChangeError(Exception):
+    """Un cambio de stock no se pudo aplicar; los demás del mismo lote se revirtieron."""
+    def __init__(self, index: int, product_id: ObjectId, reason: str, available: Optional[int] = None):
+        self.index = index
+        self.product_id = product_id
+        self.reason = reason  # "not_found" | "insufficient_stock" | "conflict"
+        self.available = available
+        super().__init__(f"{reason}: {product_id}")
+
+def _stock_op(change: StockChange) -> Tuple[dict, dict]:
+    """
+    Update condicionado de un cambio, sin upsert: el filtro exige `stock >= cantidad`
+    (o `stock == esperado`) y el `$inc` solo se aplica si el producto coincide.
+    """
+    product_id, delta = change[0], change[1]
+    expected = change[2] if len(change) > 2 else None
+    query = {"_id": product_id}
+    if expected is not None:
+        query["stock"] = expected
+    elif delta < 0:
+        query["stock"] = {"$gte": -delta}
+    return query, _stock_update(delta)
+
+async def _stock_failure(collection, changes: List[StockChange], failed_index: Optional[int] = None) -> StockChangeError:
+    """
+    Explica un lote que no se aplicó completo: lee el stock de sus productos
+    (ya sin el lote, tras el abort o la compensación) y repite los cambios en
+    orden hasta el primero que no se cumple. Solo ocurre cuando algo falló.
+    """
+    ids = list({change[0] for change in changes})
+    stock_by_id = {doc["_id"]: doc.get("stock", 0) async for doc in collection.find({"_id": {"$in": ids}}, {"stock": 1})}
+    for index, change in enumerate(changes):
+        product_id, delta = change[0], change[1]
+        expected = change[2] if len(change) > 2 else None
+        if product_id not in stock_by_id:
+            return StockChangeError(index, product_id, "not_found")
+        available = stock_by_id[product_id]
+        if expected is not None and available != expected:
+            return StockChangeError(index, product_id, "conflict")
+        if expected is None and available + delta < 0:
+            return StockChangeError(index, product_id, "insufficient_stock", available=available)
+        stock_by_id[product_id] = available + delta
+    # Con el stock actual todo se cumpliría: cambió entre el intento y la lectura, que el cliente reintente
+    index = failed_index or 0
+    return StockChangeError(index, changes[index][0], "conflict")
+
+async def apply_stock_changes(
+    db: AsyncIOMotorDatabase, changes: List[StockChange], use_transaction: Optional[bool] = None
+) -> None:
+    """
+    Aplica todos los cambios de stock, todo o nada. Cada uno es un `$inc` con su
+    condición en el filtro (ver `_stock_op`); un producto inexistente o una
+    condición incumplida simplemente no coinciden, y nunca se crean documentos.
+
+    Con `use_transaction` (por defecto, si el despliegue las admite: ver
+    `USE_TRANSACTIONS`) los cambios van en un solo `bulk_write` dentro de una
+    transacción: si `matched_count` no llega al número de cambios, se aborta.
+    Sin transacciones, `bulk_write` no dice qué operación coincidió, así que cada
+    cambio es un `update_one` (en paralelo entre productos distintos, en orden
+    dentro del mismo) y los que se aplicaron se compensan con el `$inc` inverso.
+    Lanza `StockChangeError` con el índice del primer cambio que no se pudo aplicar
+    (y el stock disponible si el motivo es "insufficient_stock").
+    """
+    if not changes:
+        return
+    if use_transaction is None:
+        use_transaction = supports_transactions(db)
+    if use_transaction:
+        await _apply_stock_changes_in_transaction(db, changes)
+    else:
+        await _apply_stock_changes_compensated(db, changes)
+    for change in changes:
+        invalidate_products(str(change[0]))
+    await sync_in_stock(db, [(change[0], change[1]) for change in changes])
+
+async def _apply_stock_changes_compensated(db: AsyncIOMotorDatabase, changes: List[StockChange]) -> None:
+    collection = db[PRODUCT_COLLECTION]
+    by_product = {}
+    for index, change in enumerate(changes):
+        by_product.setdefault(change[0], []).append(index)
+    applied: List[int] = []
+    failed: List[int] = []
+
+    async def run(indices: List[int]) -> None:
+        # Los cambios del mismo producto van en orden: un valor esperado depende del anterior
+        for index in indices:
+            result = await collection.update_one(*_stock_op(changes[index]))
+            if not result.matched_count:
+                failed.append(index)
+                return
+            applied.append(index)
+
+    results = await asyncio.gather(*(run(indices) for indices in by_product.values()), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if not errors and not failed:
+        return
+    await _revert_stock_changes(collection, changes, applied)
+    if errors:
+        raise errors[0]
+    raise await _stock_failure(collection, changes, min(failed))
+
+class _IncompleteStockBatch(Exception):
+    """Aborta la transacción de `_apply_stock_changes_in_transaction` para diagnosticar fuera de ella."""
+
+async def _apply_stock_changes_in_transaction(db: AsyncIOMotorDatabase, changes: List[StockChange]) -> None:
+    collection = db[PRODUCT_COLLECTION]
+
+    async def run(session):
+        result = await collection.bulk_write(
+            [UpdateOne(*_stock_op(change)) for change in changes], ordered=True, session=session
+        )
+        if result.matched_count < len(changes):
+            raise _IncompleteStockBatch()
+
+    # Una excepción dentro de `with_transaction` aborta la transacción
+    try:
+        async with await db.client.start_session() as session:
+            await session.with_transaction(run)
+    except _IncompleteStockBatch:
+        raise await _stock_failure(collection, changes)
+
+def supports_transactions(db: AsyncIOMotorDatabase) -> bool:
+    """Según USE_TRANSACTIONS: "always", "never" o "auto" (replica set o clúster fragmentado)."""
+    if settings.USE_TRANSACTIONS in ("always", "never"):
+        return settings.USE_TRANSACTIONS == "always"
+    topology = getattr(db.client, "topology_description", None)
+    return getattr(topology, "topology_type_name", None) in ("ReplicaSetWithPrimary", "Sharded")
+
+async def sync_in_stock(db: AsyncIOMotorDatabase, changes: List[Tuple[ObjectId, int]]) -> None:
+    """
+    Tras aplicar deltas de stock, actualiza `in_stock` de los productos que
+    cruzaron el cero y ajusta la faceta de disponibilidad. Cada `update_many` está
+    condicionado al valor anterior de `in_stock`, así que cada transición se cuenta
+    una sola vez aunque haya escrituras concurrentes. Un decremento solo puede
+    agotar un producto y un incremento solo reponerlo: basta una consulta por sentido.
+    """
+    collection = db[PRODUCT_COLLECTION]
+    lowered = list({product_id for product_id, delta in changes if delta < 0})
+    raised = list({product_id for product_id, delta in changes if delta > 0})
+    sold_out = restocked = 0
+    if lowered:
+        sold_out = (await collection.update_many(
+            {"_id": {"$in": lowered}, "stock": {"$lte": 0}, "in_stock": {"$ne": False}}, {"$set": {"in_stock": False}}
+        )).modified_count
+    if raised:
+        restocked = (await collection.update_many(
+            {"_id": {"$in": raised}, "stock": {"$gt": 0}, "in_stock": {"$ne": True}}, {"$set": {"in_stock": True}}
+        )).modified_count
+    if sold_out != restocked:
+        await facets.apply_deltas(db, {"stock:True": restocked - sold_out, "stock:False": sold_out - restocked})
+
+async def rebuild_facets(db: AsyncIOMotorDatabase, batch_size: int = 1000) -> dict:
+    """
+    Recalcula `product_facets` desde cero recorriendo los productos (y corrige
+    `in_stock` donde no coincide con `stock`). Las escrituras que ocurran durante
+    la reconstrucción pueden quedar contadas dos veces o ninguna; conviene
+    ejecutarla con poco tráfico o repetirla.
+    """
+    collection = db[PRODUCT_COLLECTION]
+    await collection.update_many({"stock": {"$gt": 0}, "in_stock": {"$ne": True}}, {"$set": {"in_stock": True}})
+    await collection.update_many({"stock": {"$not": {"$gt": 0}}, "in_stock": {"$ne": False}}, {"$set": {"in_stock": False}})
+    counts = {}
+    cursor = collection.find({}, {field: 1 for field in facets.FACET_FIELDS}).batch_size(batch_size)
+    async for doc in cursor:
+        for key in facets.facet_keys(doc):
+            counts[key] = counts.get(key, 0) + 1
+    await facets.replace_all(db, counts)
+    invalidate_products()
+    return counts
+
+async def seed_facets(db: AsyncIOMotorDatabase) -> bool:
+    """Calcula el resumen de facetas si todavía no existe (lo llama el arranque). True si lo calculó."""
+    if not await facets.claim_seed(db):
+        return False
+    await rebuild_facets(db)
+    return True
+
+def _stock_update(delta: int) -> dict:
+    return {"$inc": {"stock": delta, "version": 1}, "$currentDate": {"updated_at": True}}
+
+async def _revert_stock_changes(collection, changes: List[StockChange], applied: List[int]) -> None:
+    """Deshace los `$inc` de los cambios ya aplicados."""
+    compensations = [UpdateOne({"_id": changes[i][0]}, _stock_update(-changes[i][1])) for i in applied]
+    if compensations:
+        await collection.bulk_write(compensations, ordered=False)
+
+async def update_stock_levels(
+    db: AsyncIOMotorDatabase, updates: List[Tuple[str, Optional[int], Optional[int]]]
+) -> List[dict]:
+    """
+    Actualiza el stock de varios productos a la vez, todo o nada.
+    Cada elemento es `(product_id, delta, new_stock)` con uno de los dos definido:
+    un delta relativo (`$inc` que no deja el stock en negativo) o un valor absoluto.
+
+    Son dos viajes a la base: una lectura `$in` del stock actual (que rechaza pronto
+    los productos inexistentes y da el punto de partida de los valores absolutos) y
+    `apply_stock_changes`. Un valor absoluto se aplica como delta condicionado a que
+    el stock no haya cambiado desde la lectura; si cambió, falla con "conflict".
+    Devuelve un resultado por elemento; lanza `StockChangeError` con el índice del que falló.
+    """
+    found = await get_products_by_ids(db, [product_id for product_id, _, _ in updates], fields=("stock", "_id"), raw=True)
+    stock_by_id = {str(doc["_id"]): doc.get("stock", 0) for doc in found["products"]}
+    changes: List[StockChange] = []
+    results = []
+    for index, (product_id, delta, new_stock) in enumerate(updates):
+        if product_id not in stock_by_id:
+            raise StockChangeError(index, product_id, "not_found")
+        previous = stock_by_id[product_id]
+        if new_stock is not None:
+            delta = new_stock - previous
+            changes.append((ObjectId(product_id), delta, previous))
+        else:
+            if previous + delta < 0:
+                raise StockChangeError(index, product_id, "insufficient_stock", available=previous)
+            changes.append((ObjectId(product_id), delta))
+        stock_by_id[product_id] = previous + delta
+        results.append({"product_id": product_id, "previous_stock": previous, "new_stock": previous + delta,
+                        "delta": delta, "status": "updated"})
+    await apply_stock_changes(db, changes)
+    return results
 
 # Funciones para el sistema de calificaciones
 async def create_rating(db: AsyncIOMotorDatabase, rating_in: RatingCreate, user_id: PyObjectId) -> RatingInDB:
-    """Crea una nueva calificación para un producto."""
-    # Verificar si el usuario ya calificó este producto
-    existing_rating = await db[RATING_COLLECTION].find_one({
-        "product_id": rating_in.product_id,
-        "user_id": user_id
-    })
+    """
+    Crea o actualiza la calificación del usuario para un producto.
+
+    Un solo upsert sobre (product_id, user_id) devuelve la calificación previa,
+    con la que se calcula el delta que se aplica al agregado del producto.
+    """
+    new_id = ObjectId()
+    update_data = rating_in.model_dump(exclude={"product_id"})
+    previous = await db[RATING_COLLECTION].find_one_and_update(
+        {"product_id": rating_in.product_id, "user_id": user_id},
+        {"$set": update_data, "$setOnInsert": {"_id": new_id}},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE
+    )
     
-    if existing_rating:
-        # Actualizar calificación existente
-        update_data = rating_in.model_dump(exclude={"product_id"})
-        doc = await db[RATING_COLLECTION].find_one_and_update(
-            {"_id": existing_rating["_id"]},
-            {"$set": update_data},
-            return_document=True
-        )
-        updated_rating = RatingInDB(**doc)
+    if previous:
+        # Actualización: cambia la suma pero no el número de calificaciones
+        rating_id = previous["_id"]
+        await apply_rating_delta(db, rating_in.product_id, rating_in.rating - previous["rating"], 0)
     else:
-        # Crear nueva calificación
-        rating_data = rating_in.model_dump()
-        rating_data["user_id"] = user_id
-        db_rating = RatingInDB(**rating_data)
-        doc = db_rating.model_dump(by_alias=True)
-        result = await db[RATING_COLLECTION].insert_one(doc)
-        created_doc = await db[RATING_COLLECTION].find_one({"_id": result.inserted_id})
-        updated_rating = RatingInDB(**created_doc)
-    
-    # Actualizar el promedio de calificaciones del producto
-    await update_product_rating_average(db, rating_in.product_id)
+        rating_id = new_id
+        await apply_rating_delta(db, rating_in.product_id, rating_in.rating, 1)
     
-    return updated_rating
+    return RatingInDB(_id=rating_id, product_id=rating_in.product_id, user_id=user_id, **update_data)
+
+async def apply_rating_delta(db: AsyncIOMotorDatabase, product_id: PyObjectId, sum_delta: float, count_delta: int):
+    """
+    Actualiza `rating_sum`, `total_ratings` y `average_rating` con `$inc` atómico
+    (un update con pipeline), sin recorrer las calificaciones del producto.
+    Los productos anteriores a `rating_sum` parten de promedio × total.
+    """
+    if not sum_delta and not count_delta:
+        return
+    doc = await db[PRODUCT_COLLECTION].find_one_and_update(
+        {"_id": product_id},
+        [
+            {"$set": {
+                "rating_sum": {"$add": [
+                    {"$ifNull": ["$rating_sum", {"$multiply": [
+                        {"$ifNull": ["$average_rating", 0]}, {"$ifNull": ["$total_ratings", 0]}
+                    ]}]},
+                    sum_delta
+                ]},
+                "total_ratings": {"$add": [{"$ifNull": ["$total_ratings", 0]}, count_delta]},
+                "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]},
+                "updated_at": "$$NOW"
+            }},
+            {"$set": {
+                "average_rating": {"$cond": [
+                    {"$gt": ["$total_ratings", 0]},
+                    {"$round": [{"$divide": ["$rating_sum", "$total_ratings"]}, 2]},
+                    0.0
+                ]},
+                "rating_score": _rating_score_expr()
+            }}
+        ],
+        projection=top_rated.TOP_PROJECTION, return_document=ReturnDocument.AFTER
+    )
+    invalidate_products(str(product_id))
+    if doc:
+        await _update_top_rated(db, doc.get("category"), doc)
 
-async def get_product_ratings(db: AsyncIOMotorDatabase, product_id: str) -> List[RatingRead]:
-    """Obtiene todas las calificaciones de un producto."""
+# Orden de las calificaciones de un producto; `_id` desempata (y equivale a "más recientes")
+RATING_SORTS = {
+    "newest": [("_id", -1)],
+    "rating": [("rating", -1), ("_id", -1)],
+}
+
+async def get_product_ratings(
+    db: AsyncIOMotorDatabase,
+    product_id: str,
+    sort: str = "newest",
+    limit: int = 50,
+    cursor: Optional[str] = None
+) -> dict:
+    """
+    Obtiene una página de calificaciones de un producto y el cursor de la siguiente.
+    Pagina por keyset sobre el índice (product_id, ...): la memoria no depende del
+    total de calificaciones. Lanza `InvalidCursorError` si el cursor no es válido.
+    """
     if not ObjectId.is_valid(product_id):
-        return []
+        return {"ratings": [], "next_cursor": None}
     
-    ratings_cursor = db[RATING_COLLECTION].find({"product_id": ObjectId(product_id)})
-    rating_docs = await ratings_cursor.to_list(length=None)
-    return [RatingRead(**doc) for doc in rating_docs]
+    sort_spec = RATING_SORTS.get(sort, RATING_SORTS["newest"])
+    query = apply_cursor({"product_id": ObjectId(product_id)}, sort_spec, cursor)
+    ratings_cursor = db[RATING_COLLECTION].find(query).sort(sort_spec).limit(limit + 1)
+    rating_docs = await ratings_cursor.to_list(length=limit + 1)
+    next_cursor = None
+    if len(rating_docs) > limit:
+        rating_docs = rating_docs[:limit]
+        next_cursor = encode_cursor(rating_docs[-1], sort_spec)
+    return {"ratings": [RatingRead(**doc) for doc in rating_docs], "next_cursor": next_cursor}
+
+async def iter_product_ratings(
+    db: AsyncIOMotorDatabase, product_id: str, sort: str = "newest", batch_size: int = 500
+) -> AsyncIterator[List[dict]]:
+    """Recorre todas las calificaciones de un producto en lotes de `batch_size` documentos."""
+    if not ObjectId.is_valid(product_id):
+        return
+    sort_spec = RATING_SORTS.get(sort, RATING_SORTS["newest"])
+    ratings_cursor = db[RATING_COLLECTION].find({"product_id": ObjectId(product_id)}) \
+        .sort(sort_spec).batch_size(batch_size)
+    batch = []
+    async for doc in ratings_cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 async def update_product_rating_average(db: AsyncIOMotorDatabase, product_id: PyObjectId):
-    """Actualiza el promedio de calificaciones de un producto."""
+    """
+    Recalcula desde cero el agregado de calificaciones de un producto.
+    Ya no se usa al calificar (ver `apply_rating_delta`); sirve para reparar un producto.
+    """
     pipeline = [
         {"$match": {"product_id": product_id}},
         {"$group": {
             "_id": "$product_id",
-            "average_rating": {"$avg": "$rating"},
+            "rating_sum": {"$sum": "$rating"},
             "total_ratings": {"$sum": 1}
         }}
     ]
@@ -121,20 +644,118 @@ async def update_product_rating_average(db: AsyncIOMotorDatabase, product_id: Py
     result = await db[RATING_COLLECTION].aggregate(pipeline).to_list(length=1)
     
     if result:
-        avg_rating = round(result[0]["average_rating"], 2)
+        rating_sum = result[0]["rating_sum"]
         total_ratings = result[0]["total_ratings"]
     else:
-        avg_rating = 0.0
+        rating_sum = 0
         total_ratings = 0
     
     # Actualizar el producto con el nuevo promedio
-    await db[PRODUCT_COLLECTION].update_one(
-        {"_id": product_id},
-        {"$set": {
-            "average_rating": avg_rating,
-            "total_ratings": total_ratings
-        }}
+    condition, update = _rating_repair(product_id, rating_sum, total_ratings)
+    doc = await db[PRODUCT_COLLECTION].find_one_and_update(
+        condition, update, projection=top_rated.TOP_PROJECTION, return_document=ReturnDocument.AFTER
+    )
+    invalidate_products(str(product_id))
+    if doc:
+        await _update_top_rated(db, doc.get("category"), doc)
+
+def _rating_repair(product_id: PyObjectId, rating_sum: float, total_ratings: int) -> Tuple[dict, dict]:
+    """(filtro, update) que corrige el agregado solo si difiere del valor real."""
+    fields = {
+        "rating_sum": rating_sum,
+        "total_ratings": total_ratings,
+        "average_rating": round(rating_sum / total_ratings, 2) if total_ratings else 0.0,
+        "rating_score": rating_score(rating_sum, total_ratings)
+    }
+    condition = {"_id": product_id, "$or": [{field: {"$ne": value}} for field, value in fields.items()]}
+    return condition, {"$set": fields, "$inc": {"version": 1}, "$currentDate": {"updated_at": True}}
+
+async def reconcile_rating_aggregates(db: AsyncIOMotorDatabase, batch_size: int = 500) -> int:
+    """
+    Recalcula en bloque el agregado de todos los productos a partir de las
+    calificaciones y corrige los que se desviaron. Devuelve cuántos se modificaron.
+    """
+    repaired = 0
+    rated = set()
+    batch = []
+
+    async def flush():
+        nonlocal repaired, batch
+        if batch:
+            repaired += (await db[PRODUCT_COLLECTION].bulk_write(batch, ordered=False)).modified_count
+            batch = []
+
+    groups = db[RATING_COLLECTION].aggregate([
+        {"$group": {"_id": "$product_id", "rating_sum": {"$sum": "$rating"}, "total_ratings": {"$sum": 1}}}
+    ], allowDiskUse=True)
+    async for group in groups:
+        rated.add(group["_id"])
+        batch.append(UpdateOne(*_rating_repair(group["_id"], group["rating_sum"], group["total_ratings"])))
+        if len(batch) >= batch_size:
+            await flush()
+
+    # Productos que figuran con calificaciones pero ya no tienen ninguna
+    async for doc in db[PRODUCT_COLLECTION].find({"total_ratings": {"$gt": 0}}, {"_id": 1}):
+        if doc["_id"] not in rated:
+            batch.append(UpdateOne(*_rating_repair(doc["_id"], 0, 0)))
+            if len(batch) >= batch_size:
+                await flush()
+    await flush()
+    if repaired:
+        invalidate_products()
+        await rebuild_top_rated(db)
+    return repaired
+
+# Listas "mejor calificados" por categoría (ver app/top_rated.py)
+def _top_query(category: Optional[str]) -> dict:
+    return {"category": category, "total_ratings": {"$gt": 0}}
+
+async def refresh_top_rated(db: AsyncIOMotorDatabase, category: Optional[str]) -> List[dict]:
+    """Recalcula la lista de una categoría con una consulta por índice (category, rating_score, _id)."""
+    docs = await db[PRODUCT_COLLECTION].find(_top_query(category), top_rated.TOP_PROJECTION) \
+        .sort(LISTING_SORTS["best"]).limit(settings.TOP_RATED_SIZE).to_list(length=settings.TOP_RATED_SIZE)
+    entries = [top_rated.entry(doc) for doc in docs]
+    await top_rated.replace(db, category, entries)
+    return entries
+
+async def _update_top_rated(db: AsyncIOMotorDatabase, category: Optional[str], doc: dict, removed: bool = False) -> None:
+    """Ajusta la lista de `category` al nuevo estado de un producto (o a su eliminación)."""
+    belongs = not removed and doc.get("category") == category and top_rated.qualifies(doc)
+    current = await top_rated.read(db, category)
+    if current is None and not belongs:
+        return
+    entries, complete = top_rated.merge(
+        current["products"] if current else [], doc["_id"], top_rated.entry(doc) if belongs else None,
+        settings.TOP_RATED_SIZE
     )
+    if entries is None:
+        return
+    if not complete or not await top_rated.store(db, category, entries, current.get("version") if current else None):
+        await refresh_top_rated(db, category)
+    # La lista cacheada de /top depende de la generación del listado
+    invalidate_products(str(doc["_id"]))
+
+async def get_top_rated(db: AsyncIOMotorDatabase, category: Optional[str], limit: Optional[int] = None) -> List[dict]:
+    """Productos mejor calificados de la categoría (documentos con `TOP_FIELDS`), ya ordenados."""
+    current = await top_rated.read(db, category)
+    entries = current["products"] if current is not None else await refresh_top_rated(db, category)
+    entries = entries[:limit] if limit else entries
+    return [{field: item.get(field) for field in top_rated.TOP_FIELDS} for item in entries]
+
+async def rebuild_top_rated(db: AsyncIOMotorDatabase, rescore: bool = False) -> int:
+    """
+    Recalcula las listas de todas las categorías. Con `rescore` recalcula antes
+    `rating_score` en todos los productos (tras cambiar BEST_SORT_PRIOR_*).
+    Devuelve cuántas listas se guardaron.
+    """
+    if rescore:
+        await db[PRODUCT_COLLECTION].update_many({}, [{"$set": {"rating_score": _rating_score_expr()}}])
+    categories = await db[PRODUCT_COLLECTION].distinct("category")
+    for category in categories:
+        await refresh_top_rated(db, category)
+    await db[top_rated.TOP_COLLECTION].delete_many({"_id": {"$nin": categories}})
+    invalidate_products()
+    return len(categories)
 
 async def get_user_rating_for_product(db: AsyncIOMotorDatabase, product_id: str, user_id: PyObjectId) -> Optional[RatingRead]:
     """Obtiene la calificación de un usuario específico para un producto."""
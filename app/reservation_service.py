@@ -0,0 +1,275 @@
+# products_service/app/reservation_service.py
+"""
+Reservas temporales de stock para el checkout.
+
+Una reserva descuenta del `stock` del producto las unidades del carrito con
+los mismos `$inc` condicionados que un pedido (`apply_stock_changes`, todo o
+nada), y las guarda en `stock_reservations` con un vencimiento. Mientras está
+activa, nadie más puede comprar esas unidades: `stock` pasa a ser el stock
+disponible, sin contar lo reservado.
+
+Estados: "active" -> "consumed" (el pedido la convierte en venta),
+"released" (el usuario la cancela) o "expired" (la libera el barrido).
+Cada transición es un update condicionado al estado anterior, así que dos
+workers (o el barrido y un pedido) nunca devuelven ni venden dos veces las
+mismas unidades. Una liberación (cancelación o barrido) pasa por "releasing";
+si el proceso cae a mitad, el barrido la retoma pasado un plazo y la
+devolución de stock, idempotente, no se repite (ver `_finish_release`).
+"""
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from prometheus_client import Counter
+from pymongo import ReturnDocument, UpdateOne
+
+from common.models import PyObjectId
+from .cache import invalidate_products
+from .config import settings
+from .product_service import (
+    PRODUCT_COLLECTION, RELEASED_HOLDS_FIELD, StockChangeError, _stock_update, apply_stock_changes, sync_in_stock,
+)
+
+RESERVATION_COLLECTION = "stock_reservations"
+
+RESERVATION_EVENTS = Counter(
+    "app_stock_reservations_total",
+    "Reservas de stock por evento (created, rejected, consumed, released, expired).",
+    ["event"],
+)
+
+
+class ReservationError(Exception):
+    """La reserva no existe, no es del usuario o ya no está activa."""
+
+    def __init__(self, reason: str):
+        self.reason = reason  # "not_found" | "expired" | "not_active"
+        super().__init__(reason)
+
+
+def _quantities(items: List[dict]) -> Dict[ObjectId, int]:
+    """Unidades por producto (suma las líneas repetidas)."""
+    quantities: Dict[ObjectId, int] = {}
+    for item in items:
+        product_id = ObjectId(item["product_id"])
+        quantities[product_id] = quantities.get(product_id, 0) + item["quantity"]
+    return quantities
+
+
+async def create_reservation(
+    db: AsyncIOMotorDatabase, user_id: PyObjectId, items: List[dict], ttl_seconds: Optional[float] = None
+) -> dict:
+    """
+    Reserva `items` (`[{"product_id", "quantity"}]`) durante `ttl_seconds`
+    (por defecto RESERVATION_TTL_SECONDS). Lanza `StockChangeError` con el índice
+    de la línea que no se pudo reservar ("not_found" si el producto no existe,
+    "insufficient_stock" con el stock disponible); en ese caso no queda nada
+    retenido ni se escribe nada en `products` (los cambios de stock no usan upsert).
+    """
+    for index, item in enumerate(items):
+        if not ObjectId.is_valid(item["product_id"]):
+            raise StockChangeError(index, item["product_id"], "not_found")
+    changes = [(ObjectId(item["product_id"]), -item["quantity"]) for item in items]
+    try:
+        await apply_stock_changes(db, changes)
+    except StockChangeError:
+        RESERVATION_EVENTS.labels("rejected").inc()
+        raise
+
+    now = datetime.utcnow()
+    ttl = settings.RESERVATION_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+    reservation = {
+        "_id": ObjectId(),
+        "user_id": user_id,
+        "items": [{"product_id": ObjectId(item["product_id"]), "quantity": item["quantity"]} for item in items],
+        "status": "active",
+        "created_at": now,
+        "expires_at": now + timedelta(seconds=ttl),
+    }
+    try:
+        await db[RESERVATION_COLLECTION].insert_one(reservation)
+    except Exception:
+        # Sin registro de la reserva no debe quedar stock retenido
+        await apply_stock_changes(db, [(product_id, -delta) for product_id, delta in changes])
+        raise
+    RESERVATION_EVENTS.labels("created").inc()
+    return reservation
+
+
+async def _claim(collection, query: dict, fields: dict, limit: int) -> List[dict]:
+    """
+    Pasa a "releasing" hasta `limit` reservas que cumplen `query`, con un token
+    propio y la hora del reclamo, y devuelve las que reclamó este llamado (otro
+    worker puede haberse llevado alguna entre la lectura y el `update_many`).
+    """
+    candidates = await collection.find(query, {"_id": 1}).sort("expires_at", 1).limit(limit).to_list(length=limit)
+    if not candidates:
+        return []
+    token = uuid.uuid4().hex
+    ids = [doc["_id"] for doc in candidates]
+    await collection.update_many(
+        {**query, "_id": {"$in": ids}},
+        {"$set": {**fields, "status": "releasing", "sweep_token": token, "claimed_at": datetime.utcnow()}},
+    )
+    return await collection.find({"_id": {"$in": ids}, "sweep_token": token}).to_list(length=limit)
+
+
+async def _finish_release(db: AsyncIOMotorDatabase, claimed: List[dict]) -> Dict[ObjectId, int]:
+    """
+    Devuelve al `stock` las unidades de las reservas reclamadas y las deja en su
+    estado final (`release_as`). Devuelve las unidades por producto, para `_after_restock`.
+
+    Cada devolución es idempotente: el `$inc` anota la reserva en
+    `released_holds` del producto y no se aplica si ya estaba anotada, así que
+    retomar una liberación que cayó a mitad (ver `sweep_expired`) nunca devuelve
+    dos veces las mismas unidades. Las anotaciones se quitan al final.
+    """
+    ops = []
+    quantities: Dict[ObjectId, int] = {}
+    for reservation in claimed:
+        for product_id, quantity in _quantities(reservation["items"]).items():
+            ops.append(UpdateOne(
+                {"_id": product_id, RELEASED_HOLDS_FIELD: {"$ne": reservation["_id"]}},
+                {**_stock_update(quantity), "$push": {RELEASED_HOLDS_FIELD: reservation["_id"]}},
+            ))
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+    if ops:
+        await db[PRODUCT_COLLECTION].bulk_write(ops, ordered=False)
+    now = datetime.utcnow()
+    for status in ("expired", "released"):
+        ids = [reservation["_id"] for reservation in claimed if reservation.get("release_as", "expired") == status]
+        if ids:
+            await db[RESERVATION_COLLECTION].update_many(
+                {"_id": {"$in": ids}, "status": "releasing"},
+                {"$set": {"status": status, "finished_at": now}, "$unset": {"sweep_token": "", "claimed_at": ""}},
+            )
+    if quantities:
+        await db[PRODUCT_COLLECTION].update_many(
+            {"_id": {"$in": list(quantities)}},
+            {"$pull": {RELEASED_HOLDS_FIELD: {"$in": [reservation["_id"] for reservation in claimed]}}},
+        )
+    for reservation in claimed:
+        reservation.update(status=reservation.get("release_as", "expired"), finished_at=now)
+    return quantities
+
+
+async def _after_restock(db: AsyncIOMotorDatabase, quantities: Dict[ObjectId, int]) -> None:
+    """Cachés y facetas de los productos que recuperaron stock."""
+    for product_id in quantities:
+        invalidate_products(str(product_id))
+    if quantities:
+        await sync_in_stock(db, list(quantities.items()))
+
+
+async def release_reservation(db: AsyncIOMotorDatabase, reservation_id: str, user_id: PyObjectId) -> dict:
+    """Cancela una reserva activa del usuario y devuelve su stock. Lanza `ReservationError`."""
+    if not ObjectId.is_valid(reservation_id):
+        raise ReservationError("not_found")
+    query = {"_id": ObjectId(reservation_id), "user_id": user_id, "status": "active"}
+    claimed = await _claim(db[RESERVATION_COLLECTION], query, {"release_as": "released"}, 1)
+    if not claimed:
+        raise await _why_unavailable(db, reservation_id, user_id)
+    await _after_restock(db, await _finish_release(db, claimed))
+    RESERVATION_EVENTS.labels("released").inc()
+    return claimed[0]
+
+
+async def consume_reservation(db: AsyncIOMotorDatabase, reservation_id: str, user_id: PyObjectId) -> dict:
+    """
+    Marca la reserva como vendida (solo si sigue activa y no ha vencido) y la
+    devuelve; su stock ya está descontado. Lanza `ReservationError`.
+    """
+    if not ObjectId.is_valid(reservation_id):
+        raise ReservationError("not_found")
+    reservation = await db[RESERVATION_COLLECTION].find_one_and_update(
+        {"_id": ObjectId(reservation_id), "user_id": user_id, "status": "active",
+         "expires_at": {"$gt": datetime.utcnow()}},
+        {"$set": {"status": "consumed", "finished_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if reservation is None:
+        raise await _why_unavailable(db, reservation_id, user_id)
+    return reservation
+
+
+async def reactivate_reservation(db: AsyncIOMotorDatabase, reservation_id: ObjectId) -> None:
+    """Deshace `consume_reservation` cuando el pedido no se pudo registrar."""
+    await db[RESERVATION_COLLECTION].update_one(
+        {"_id": reservation_id, "status": "consumed"},
+        {"$set": {"status": "active"}, "$unset": {"finished_at": ""}},
+    )
+
+
+async def _why_unavailable(db: AsyncIOMotorDatabase, reservation_id: str, user_id: PyObjectId) -> ReservationError:
+    reservation = await db[RESERVATION_COLLECTION].find_one(
+        {"_id": ObjectId(reservation_id), "user_id": user_id}, {"status": 1, "expires_at": 1}
+    )
+    if reservation is None:
+        return ReservationError("not_found")
+    if reservation["status"] == "expired" or (
+        reservation["status"] == "active" and reservation["expires_at"] <= datetime.utcnow()
+    ):
+        return ReservationError("expired")
+    return ReservationError("not_active")
+
+
+async def sweep_expired(db: AsyncIOMotorDatabase, batch_size: Optional[int] = None) -> int:
+    """
+    Libera un lote de reservas vencidas y devuelve cuántas liberó.
+
+    Las reclama con un token propio (así varios workers pueden barrer a la vez
+    sin liberar dos veces la misma), devuelve su stock en un solo `bulk_write` y
+    las marca como "expired". Antes retoma las liberaciones que llevan más de
+    RESERVATION_RELEASE_TIMEOUT_SECONDS en "releasing": su proceso cayó después
+    de reclamarlas (aquí o en `release_reservation`) y su stock, o parte de él,
+    no se devolvió.
+    """
+    batch_size = batch_size or settings.RESERVATION_SWEEP_BATCH_SIZE
+    collection = db[RESERVATION_COLLECTION]
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=settings.RESERVATION_RELEASE_TIMEOUT_SECONDS)
+    claimed = await _claim(collection, {"status": "releasing", "claimed_at": {"$not": {"$gt": stale}}}, {}, batch_size)
+    if len(claimed) < batch_size:
+        claimed += await _claim(
+            collection, {"status": "active", "expires_at": {"$lte": now}}, {"release_as": "expired"},
+            batch_size - len(claimed),
+        )
+    if not claimed:
+        return 0
+    await _after_restock(db, await _finish_release(db, claimed))
+    for reservation in claimed:
+        RESERVATION_EVENTS.labels(reservation["status"]).inc()
+    return len(claimed)
+
+
+async def _sweep_loop(db: AsyncIOMotorDatabase) -> None:
+    while True:
+        try:
+            # Lotes seguidos mientras haya atraso; luego se espera al siguiente intervalo
+            while await sweep_expired(db) >= settings.RESERVATION_SWEEP_BATCH_SIZE:
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Error liberando reservas vencidas: {e}")
+        await asyncio.sleep(settings.RESERVATION_SWEEP_INTERVAL_SECONDS)
+
+
+_sweeper: Optional[asyncio.Task] = None
+
+
+def start_sweeper(db: AsyncIOMotorDatabase) -> None:
+    global _sweeper
+    if settings.RESERVATION_SWEEP_INTERVAL_SECONDS > 0 and _sweeper is None:
+        _sweeper = asyncio.create_task(_sweep_loop(db))
+
+
+async def stop_sweeper() -> None:
+    global _sweeper
+    if _sweeper is not None:
+        _sweeper.cancel()
+        await asyncio.gather(_sweeper, return_exceptions=True)
+        _sweeper = None
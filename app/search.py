@@ -0,0 +1,97 @@
+# products_service/app/search.py
+"""
+Búsqueda de productos sobre un índice de palabras clave.
+
+Al crear o editar un producto se guardan dos arreglos indexados:
+- `search_keywords`: prefijos de las palabras de `name` y `tags` y las palabras
+  completas de `description`.
+- `name_keywords`: prefijos de las palabras de `name` (sirven para la relevancia),
+  más los de la primera palabra marcados con `^` (`"^pi"`), para premiar los
+  nombres que empiezan por el término sin mirar el `name` original.
+
+Una búsqueda se traduce en `{"search_keywords": {"$all": [...]}}`, que usa el
+índice multikey en vez de recorrer la colección con `$regex`. Los términos de
+menos de MIN_PREFIX_LENGTH caracteres no están en el arreglo: se filtran con un
+`$regex` anclado sobre él (también usa el índice) y no cuentan para la
+relevancia, porque una sola letra coincide con buena parte del catálogo y
+habría que ordenar todo eso en memoria.
+"""
+import re
+import unicodedata
+from typing import Iterable, List, Optional
+
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_LENGTH = 15
+SEARCH_FIELDS = ("name", "description", "tags")
+# Marca de los prefijos de la primera palabra del nombre en `name_keywords`
+NAME_START_MARK = "^"
+KEYWORD_FIELDS = ("search_keywords", "name_keywords")
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    """Minúsculas y sin tildes, para que 'Piña' y 'pina' coincidan."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return _TOKEN_RE.findall(normalize(text))
+
+
+def _prefixes(token: str) -> List[str]:
+    return [token[:i] for i in range(MIN_PREFIX_LENGTH, min(len(token), MAX_PREFIX_LENGTH) + 1)]
+
+
+def build_search_keywords(name: Optional[str], description: Optional[str], tags: Optional[Iterable[str]]) -> dict:
+    """Calcula los campos de búsqueda que se guardan junto al producto."""
+    name_tokens = tokenize(name)
+    name_keywords = {p for token in name_tokens for p in _prefixes(token)}
+    name_start = {NAME_START_MARK + p for p in _prefixes(name_tokens[0])} if name_tokens else set()
+    tag_keywords = {p for tag in (tags or []) for token in tokenize(tag) for p in _prefixes(token)}
+    description_words = {
+        token[:MAX_PREFIX_LENGTH] for token in tokenize(description) if len(token) >= MIN_PREFIX_LENGTH
+    }
+    return {
+        "search_keywords": sorted(name_keywords | tag_keywords | description_words),
+        "name_keywords": sorted(name_keywords | name_start),
+    }
+
+
+def parse_search(search: Optional[str]) -> List[str]:
+    """Términos de búsqueda normalizados; cada uno se interpreta como prefijo."""
+    terms = []
+    for token in tokenize(search):
+        token = token[:MAX_PREFIX_LENGTH]
+        if token not in terms:
+            terms.append(token)
+    return terms
+
+
+def ranked_terms(terms: List[str]) -> List[str]:
+    """Los términos que cuentan para la relevancia (los de al menos MIN_PREFIX_LENGTH)."""
+    return [term for term in terms if len(term) >= MIN_PREFIX_LENGTH]
+
+
+def search_filter(terms: List[str]) -> dict:
+    """Todos los términos deben coincidir; los cortos, como prefijo de alguna palabra clave."""
+    conditions = []
+    if ranked_terms(terms):
+        conditions.append({"search_keywords": {"$all": ranked_terms(terms)}})
+    conditions += [{"search_keywords": {"$regex": "^" + term}} for term in terms if len(term) < MIN_PREFIX_LENGTH]
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def relevance_stage(terms: List[str]) -> dict:
+    """
+    Etapa `$addFields` que puntúa cada resultado: cuántos términos aparecen en
+    el nombre, más un punto extra si el nombre empieza por el primer término.
+    Solo se evalúa sobre los documentos que ya devolvió el índice.
+    """
+    return {"$addFields": {"_score": {"$add": [
+        {"$size": {"$setIntersection": [{"$ifNull": ["$name_keywords", []]}, terms]}},
+        {"$cond": [{"$in": [NAME_START_MARK + terms[0], {"$ifNull": ["$name_keywords", []]}]}, 1, 0]},
+    ]}}}
@@ -0,0 +1,96 @@
+# products_service/app/server.py
+"""
+Piezas del modo producción con gunicorn (ver gunicorn.conf.py).
+
+- `UvicornWorker`: el worker ASGI de uvicorn-worker con un apagado acotado.
+  Al recibir SIGTERM (apagado o recarga con HUP) deja de aceptar conexiones,
+  espera a las peticiones en curso hasta WEB_GRACEFUL_TIMEOUT_SECONDS menos un
+  margen y corre el cierre del lifespan (barrido de reservas, bus, cliente de
+  MongoDB) antes de que gunicorn lo mate.
+- `prepare_metrics_dir`: directorio de PROMETHEUS_MULTIPROC_DIR, donde cada
+  worker escribe sus métricas y de donde `/metrics` las suma. Se vacía al
+  arrancar el master para no arrastrar contadores de una ejecución anterior.
+- `mark_worker_dead`: hook `child_exit` de gunicorn para los workers que terminan.
+- `sync_indexes_once`: hook `on_starting`; los índices se sincronizan una sola
+  vez en el master en lugar de en cada worker a la vez.
+- `require_invalidation_bus`: con varios workers, usa el bus "capped" si no se
+  eligió otro y no arranca con un bus que no cruza procesos.
+
+Cada worker abre su propio cliente de MongoDB en el lifespan (después del
+fork): el proceso master con `preload_app` solo importa la app.
+"""
+import glob
+import os
+import subprocess
+import sys
+import tempfile
+
+from uvicorn_worker import UvicornWorker as _BaseUvicornWorker
+
+from .config import settings
+
+# Buses de invalidación que no llegan a los demás workers (ver app/invalidation_bus.py)
+LOCAL_BUS_BACKENDS = ("none", "memory")
+# Tiempo que se reserva para el cierre del lifespan dentro del plazo de gunicorn
+SHUTDOWN_MARGIN_SECONDS = 5
+DEFAULT_METRICS_DIR = os.path.join(tempfile.gettempdir(), "products_service_metrics")
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class UvicornWorker(_BaseUvicornWorker):
+    CONFIG_KWARGS = {
+        **_BaseUvicornWorker.CONFIG_KWARGS,
+        "lifespan": "on",
+        "timeout_graceful_shutdown": max(settings.WEB_GRACEFUL_TIMEOUT_SECONDS - SHUTDOWN_MARGIN_SECONDS, 1),
+    }
+
+
+def prepare_metrics_dir() -> str:
+    """
+    Fija PROMETHEUS_MULTIPROC_DIR (si no viene del entorno), crea el directorio y
+    borra los archivos de métricas que hubiera. Debe llamarse antes de importar
+    `prometheus_client`, que decide al importarse si escribe a disco.
+    """
+    path = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", DEFAULT_METRICS_DIR)
+    os.makedirs(path, exist_ok=True)
+    for stale in glob.glob(os.path.join(path, "*.db")):
+        os.remove(stale)
+    return path
+
+
+def mark_worker_dead(server, worker) -> None:
+    """Hook `child_exit`: descarta los gauges del worker; sus contadores siguen sumando."""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def sync_indexes_once(server) -> None:
+    """
+    Hook `on_starting`: con SYNC_INDEXES_ON_STARTUP, ejecuta `manage.py indexes sync`
+    en un proceso aparte (el master no abre clientes de MongoDB antes del fork) y
+    lo desactiva para el lifespan de los workers, que si no reconstruirían a la
+    vez los mismos índices.
+    """
+    if not settings.SYNC_INDEXES_ON_STARTUP:
+        return
+    if subprocess.run([sys.executable, "manage.py", "indexes", "sync"], cwd=SERVICE_DIR).returncode:
+        print("⚠️ No se pudieron sincronizar todos los índices (ver `python manage.py indexes sync`)")
+    settings.SYNC_INDEXES_ON_STARTUP = False
+
+
+def require_invalidation_bus(workers: int) -> None:
+    """
+    Con más de un worker, cada uno tiene sus cachés locales y solo un bus entre
+    procesos las invalida en todos. Si INVALIDATION_BUS_BACKEND no se fijó, usa
+    "capped"; si se fijó a un bus local ("none" o "memory"), no arranca.
+    """
+    if workers <= 1 or settings.INVALIDATION_BUS_BACKEND not in LOCAL_BUS_BACKENDS:
+        return
+    if "INVALIDATION_BUS_BACKEND" in settings.model_fields_set:
+        raise SystemExit(
+            f"INVALIDATION_BUS_BACKEND={settings.INVALIDATION_BUS_BACKEND} no invalida las cachés de los "
+            f"demás workers ({workers}): usa capped o changestream, o WEB_WORKERS=1"
+        )
+    print(f"⚠️ {workers} workers: se usa INVALIDATION_BUS_BACKEND=capped para invalidar las cachés de todos")
+    settings.INVALIDATION_BUS_BACKEND = "capped"
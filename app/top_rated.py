@@ -0,0 +1,99 @@
+# products_service/app/top_rated.py
+"""
+Listas "mejor calificados en <categoría>" ya calculadas.
+
+Cada categoría tiene un documento en `category_top` con sus TOP_RATED_SIZE
+productos calificados de mayor `rating_score` (el orden "best"), con los campos
+que muestra un carrusel. Cuando cambia la calificación o los datos de un
+producto, `merge` decide si la lista se ve afectada y la actualiza en memoria;
+solo si un producto sale de una lista llena hace falta volver a consultar la
+categoría (por el índice `category_rating_score__id`) para saber quién entra.
+
+Las escrituras de la lista comparan `version`, así que dos workers que la
+modifican a la vez no se pisan: el que pierde la recalcula desde la colección.
+"""
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import create_model
+from pymongo.errors import DuplicateKeyError
+
+from .fieldsets import parse_fields, partial_model
+
+TOP_COLLECTION = "category_top"
+# Campos de cada producto de la lista (orden de ProductRead)
+TOP_FIELDS = parse_fields("name,price,currency,image_url,category,average_rating,total_ratings")
+# Campos cuyo cambio puede alterar una lista
+TOP_PROJECTION = {**{field: 1 for field in TOP_FIELDS}, "rating_score": 1}
+
+TopRatedPage = create_model("TopRatedPage", category=(str, ...), products=(List[partial_model(TOP_FIELDS)], ...))
+
+
+def qualifies(doc: dict) -> bool:
+    """Solo entran productos con al menos una calificación."""
+    return (doc.get("total_ratings") or 0) > 0
+
+
+def entry(doc: dict) -> dict:
+    return {field: doc.get(field) for field in TOP_PROJECTION}
+
+
+def _rank(item: dict) -> tuple:
+    return item.get("rating_score") or 0.0, item["_id"]
+
+
+def merge(entries: List[dict], product_id, new_entry: Optional[dict], size: int) -> Tuple[Optional[List[dict]], bool]:
+    """
+    Aplica a la lista el nuevo estado de un producto (`new_entry` None: ya no
+    pertenece a ella). Devuelve `(lista, completa)`: lista None si no cambia, y
+    `completa` False si hay que recalcularla porque pudo entrar otro producto.
+    """
+    in_list = any(item["_id"] == product_id for item in entries)
+    if not in_list and new_entry is None:
+        return None, True
+    was_full = len(entries) >= size
+    merged = [item for item in entries if item["_id"] != product_id]
+    if new_entry is not None:
+        merged.append(new_entry)
+    merged.sort(key=_rank, reverse=True)
+    if len(merged) > size:
+        merged = merged[:size]
+    kept = new_entry is not None and any(item["_id"] == product_id for item in merged)
+    if not in_list and not kept:
+        return None, True
+    # Si el producto salió o quedó último en una lista llena, fuera de ella puede
+    # haber otro con mejor puntaje que no conocemos
+    if in_list and was_full and (not kept or merged[-1]["_id"] == product_id):
+        return merged, False
+    return merged, True
+
+
+async def read(db: AsyncIOMotorDatabase, category: str) -> Optional[dict]:
+    return await db[TOP_COLLECTION].find_one({"_id": category})
+
+
+async def store(db: AsyncIOMotorDatabase, category: str, entries: List[dict], expected_version: Optional[int]) -> bool:
+    """
+    Guarda la lista si nadie la cambió desde que se leyó (`expected_version`;
+    None = no existía). Devuelve False si otra escritura se adelantó.
+    """
+    condition = {"_id": category, "version": expected_version if expected_version is not None else {"$exists": False}}
+    try:
+        await db[TOP_COLLECTION].update_one(
+            condition,
+            {"$set": {"products": entries, "updated_at": datetime.utcnow()}, "$inc": {"version": 1}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+async def replace(db: AsyncIOMotorDatabase, category: str, entries: List[dict]) -> None:
+    """Guarda la lista sin comparar versión (recálculo completo desde la colección)."""
+    await db[TOP_COLLECTION].update_one(
+        {"_id": category},
+        {"$set": {"products": entries, "updated_at": datetime.utcnow()}, "$inc": {"version": 1}},
+        upsert=True,
+    )
@@ -0,0 +1,74 @@
+# products_service/benchmarks/bench_cart_stock.py
+"""
+Actualización de stock desde el carrito: bucle legado (lectura + `$set` por
+línea, 2N viajes) contra `product_service.update_stock_levels` (una lectura
+`$in` y un `bulk_write` ordenado, todo o nada).
+
+Uso (requiere un MongoDB accesible en BENCH_MONGO_URI o MONGO_URI):
+
+    python -m benchmarks.bench_cart_stock --lines 1 5 10 25 50 100 --repeat 200
+
+Para cada tamaño de carrito se informa la latencia media y p95 por petición.
+Con `--transactions` el camino nuevo usa transacciones (requiere replica set).
+"""
+import argparse
+import asyncio
+import random
+
+from bson import ObjectId
+
+from app import product_service
+from app.config import settings
+from benchmarks.common import Timer, get_client, make_product, summarize
+
+DB_NAME = "bench_cart_stock"
+
+
+async def legacy_update(db, lines) -> None:
+    """Reproduce el bucle anterior de `/cart/update-stock`."""
+    for product_id, _, new_stock in lines:
+        product = await db.products.find_one({"_id": ObjectId(product_id)})
+        if product is None:
+            raise product_service.StockChangeError(0, product_id, "not_found")
+        await db.products.update_one({"_id": ObjectId(product_id)}, {"$set": {"stock": new_stock}})
+
+
+async def new_update(db, lines) -> None:
+    await product_service.update_stock_levels(db, lines)
+
+
+async def run(db, update, n_lines: int, repeat: int) -> dict:
+    rng = random.Random(11)
+    await db.products.drop()
+    products = [make_product(rng, ObjectId()) for _ in range(n_lines)]
+    await db.products.insert_many(products)
+    samples = []
+    for i in range(repeat):
+        # Valores absolutos en ambos caminos (el legado no admite deltas)
+        lines = [(str(p["_id"]), None, 1000 + i) for p in products]
+        with Timer() as t:
+            await update(db, lines)
+        samples.append(t.elapsed)
+    return summarize(samples)
+
+
+async def main(args) -> None:
+    client = get_client()
+    db = client[DB_NAME]
+    settings.USE_TRANSACTIONS = "always" if args.transactions else "never"
+    try:
+        for n_lines in args.lines:
+            for label, update in (("legado", legacy_update), ("bulk_write", new_update)):
+                stats = await run(db, update, n_lines, args.repeat)
+                print(f"{n_lines:>4} líneas {label:>10}: {stats}")
+    finally:
+        await client.drop_database(DB_NAME)
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, nargs="+", default=[1, 5, 10, 25, 50, 100])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--transactions", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,102 @@
+# products_service/benchmarks/bench_checkout.py
+"""
+Checkout concurrente: bucle legado (leer, validar, `$set` absoluto) contra
+`order_service.place_order` (`$inc` condicionados en el filtro, todo o nada).
+
+Uso (requiere un MongoDB accesible en BENCH_MONGO_URI o MONGO_URI):
+
+    python -m benchmarks.bench_checkout --buyers 500 --stock 200 --items 3
+
+Cada comprador pide una unidad de `--items` productos, todos con `--stock`
+unidades. Se informa cuántos pedidos se aceptaron, cuántas unidades se
+vendieron de más (sobreventa) y el rendimiento en pedidos por segundo.
+"""
+import argparse
+import asyncio
+import random
+
+from bson import ObjectId
+
+from app import order_service
+from app.product_service import StockChangeError
+from benchmarks.common import Timer, get_client, make_product
+from common.models import OrderItem
+
+DB_NAME = "bench_checkout"
+
+
+async def legacy_place_order(db, items) -> None:
+    """Reproduce el bucle anterior de `create_order` (3N viajes, sin condición)."""
+    for item in items:
+        product = await db.products.find_one({"_id": ObjectId(item.product_id)})
+        if product is None or product["stock"] < item.quantity:
+            raise StockChangeError(0, item.product_id, "insufficient_stock")
+    for item in items:
+        product = await db.products.find_one({"_id": ObjectId(item.product_id)})
+        await db.products.update_one(
+            {"_id": ObjectId(item.product_id)}, {"$set": {"stock": product["stock"] - item.quantity}}
+        )
+
+
+async def new_place_order(db, items) -> None:
+    await order_service.place_order(db, user_id=ObjectId(), items=items)
+
+
+async def run(db, place, buyers: int, stock: int, n_items: int, concurrency: int) -> dict:
+    rng = random.Random(7)
+    await db.products.drop()
+    products = [make_product(rng, ObjectId()) for _ in range(n_items)]
+    for product in products:
+        product["stock"] = stock
+    await db.products.insert_many(products)
+    items = [
+        OrderItem(product_id=str(p["_id"]), quantity=1, price=p["price"], product_name=p["name"]) for p in products
+    ]
+
+    accepted = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def buyer():
+        nonlocal accepted
+        async with semaphore:
+            try:
+                await place(db, items)
+                accepted += 1
+            except StockChangeError:
+                pass
+
+    with Timer() as t:
+        await asyncio.gather(*(buyer() for _ in range(buyers)))
+
+    final_stocks = [doc["stock"] async for doc in db.products.find({}, {"stock": 1})]
+    sold = [stock - s for s in final_stocks]
+    return {
+        "accepted": accepted,
+        # Unidades vendidas por encima del stock inicial
+        "oversold_units": max(0, accepted - stock) * n_items,
+        # Pedidos aceptados cuyo descuento de stock se perdió por escrituras concurrentes
+        "lost_updates": sum(accepted - s for s in sold),
+        "negative_stock": any(s < 0 for s in final_stocks),
+        "orders_per_s": round(buyers / t.elapsed, 1),
+    }
+
+
+async def main(args) -> None:
+    client = get_client()
+    db = client[DB_NAME]
+    try:
+        for label, place in (("legado", legacy_place_order), ("bulk_write", new_place_order)):
+            stats = await run(db, place, args.buyers, args.stock, args.items, args.concurrency)
+            print(f"{label:>10}: {stats}")
+    finally:
+        await client.drop_database(DB_NAME)
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buyers", type=int, default=500)
+    parser.add_argument("--stock", type=int, default=200)
+    parser.add_argument("--items", type=int, default=3, help="productos por pedido")
+    parser.add_argument("--concurrency", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
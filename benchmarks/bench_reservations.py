@@ -0,0 +1,140 @@
+# products_service/benchmarks/bench_reservations.py
+"""
+Venta relámpago sobre un solo producto: checkout sin reservas (validar el
+stock, pensar, pedir) contra reservas temporales (reservar, pensar, pedir con
+`reservation_id`), con cientos de compradores concurrentes.
+
+Uso (requiere un MongoDB accesible en BENCH_MONGO_URI o MONGO_URI):
+
+    python -m benchmarks.bench_reservations --buyers 500 --stock 100 --abandon 0.3 --ttl 2
+
+Los compradores llegan repartidos en `--spread` segundos y tardan hasta
+`--think` segundos entre el carrito y el pedido; una fracción `--abandon` no
+llega a pedir. Con reservas, el barrido devuelve al stock las reservas
+abandonadas cuando vencen (`--ttl`), y otros compradores las aprovechan.
+
+Se informa cuántos compradores pasaron la validación o consiguieron reserva y
+luego fallaron al pagar (lo que las reservas eliminan), los pedidos aceptados,
+la sobreventa y si stock + vendido + retenido sigue cuadrando con el inicial.
+"""
+import argparse
+import asyncio
+import random
+
+from bson import ObjectId
+
+from app import order_service, reservation_service
+from app.config import settings
+from app.product_service import StockChangeError
+from benchmarks.common import Timer, get_client, make_product, summarize
+from common.models import OrderItem
+
+DB_NAME = "bench_reservations"
+
+
+async def without_reservation(db, item: OrderItem, think: float, abandon: bool, stats: dict) -> None:
+    product = await db.products.find_one({"_id": ObjectId(item.product_id)}, {"stock": 1})
+    if product["stock"] < item.quantity:
+        stats["rejected_early"] += 1
+        return
+    stats["passed"] += 1
+    await asyncio.sleep(think)
+    if abandon:
+        return
+    with Timer() as t:
+        try:
+            await order_service.place_order(db, user_id=ObjectId(), items=[item])
+            stats["orders"] += 1
+        except StockChangeError:
+            stats["failed_at_checkout"] += 1
+    stats["order_latency"].append(t.elapsed)
+
+
+async def with_reservation(db, item: OrderItem, think: float, abandon: bool, stats: dict) -> None:
+    user_id = ObjectId()
+    try:
+        reservation = await reservation_service.create_reservation(
+            db, user_id, [{"product_id": item.product_id, "quantity": item.quantity}]
+        )
+    except StockChangeError:
+        stats["rejected_early"] += 1
+        return
+    stats["passed"] += 1
+    await asyncio.sleep(think)
+    if abandon:
+        return
+    with Timer() as t:
+        try:
+            await order_service.place_order(db, user_id=user_id, items=[item], reservation_id=str(reservation["_id"]))
+            stats["orders"] += 1
+        except (StockChangeError, reservation_service.ReservationError):
+            stats["failed_at_checkout"] += 1
+    stats["order_latency"].append(t.elapsed)
+
+
+async def run(db, buy, args) -> dict:
+    rng = random.Random(3)
+    await db.drop_collection("products")
+    await db.drop_collection(reservation_service.RESERVATION_COLLECTION)
+    await db.drop_collection(order_service.ORDER_COLLECTION)
+    await db[reservation_service.RESERVATION_COLLECTION].create_index([("status", 1), ("expires_at", 1)])
+    product = make_product(rng, ObjectId())
+    product["stock"] = args.stock
+    await db.products.insert_one(product)
+    item = OrderItem(product_id=str(product["_id"]), quantity=1, price=product["price"], product_name=product["name"])
+
+    stats = {"passed": 0, "rejected_early": 0, "orders": 0, "failed_at_checkout": 0, "order_latency": []}
+
+    async def buyer():
+        await asyncio.sleep(rng.uniform(0, args.spread))
+        await buy(db, item, rng.uniform(0, args.think), rng.random() < args.abandon, stats)
+
+    sweeper = asyncio.create_task(reservation_service._sweep_loop(db))
+    try:
+        with Timer() as t:
+            await asyncio.gather(*(buyer() for _ in range(args.buyers)))
+    finally:
+        sweeper.cancel()
+        await asyncio.gather(sweeper, return_exceptions=True)
+
+    final_stock = (await db.products.find_one({"_id": product["_id"]}, {"stock": 1}))["stock"]
+    held = 0
+    async for reservation in db[reservation_service.RESERVATION_COLLECTION].find({"status": "active"}):
+        held += sum(line["quantity"] for line in reservation["items"])
+    sold = await db[order_service.ORDER_COLLECTION].count_documents({})
+    return {
+        "passed": stats["passed"],
+        "rejected_early": stats["rejected_early"],
+        "orders": stats["orders"],
+        "failed_at_checkout": stats["failed_at_checkout"],
+        "oversold_units": max(0, sold - args.stock),
+        "balanced": final_stock + sold + held == args.stock,
+        "held_at_end": held,
+        "order_p95_ms": summarize(stats["order_latency"])["p95_ms"],
+        "elapsed_s": round(t.elapsed, 2),
+    }
+
+
+async def main(args) -> None:
+    settings.RESERVATION_TTL_SECONDS = args.ttl
+    settings.RESERVATION_SWEEP_INTERVAL_SECONDS = 0.2
+    settings.USE_TRANSACTIONS = "never"
+    client = get_client()
+    db = client[DB_NAME]
+    try:
+        for label, buy in (("sin reserva", without_reservation), ("con reserva", with_reservation)):
+            print(f"{label:>12}: {await run(db, buy, args)}")
+    finally:
+        await client.drop_database(DB_NAME)
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buyers", type=int, default=500)
+    parser.add_argument("--stock", type=int, default=100)
+    parser.add_argument("--abandon", type=float, default=0.3, help="fracción de compradores que no llega a pedir")
+    parser.add_argument("--think", type=float, default=1.0, help="segundos máximos entre carrito y pedido")
+    parser.add_argument("--spread", type=float, default=5.0, help="segundos en los que llegan los compradores")
+    parser.add_argument("--ttl", type=float, default=2.0, help="vencimiento de las reservas en segundos")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,66 @@
+# products_service/benchmarks/bench_search.py
+"""
+Compara la búsqueda `$regex` (legado) contra el índice de palabras clave.
+
+Uso (requiere un MongoDB accesible en BENCH_MONGO_URI o MONGO_URI):
+
+    python -m benchmarks.bench_search --sizes 10000 100000 1000000
+
+Cada tamaño se siembra en su propia base `bench_search_<n>`, que se elimina al
+terminar salvo que se use `--keep`.
+"""
+import argparse
+import asyncio
+
+from app import product_service
+from app.indexes import sync_indexes
+from app.config import settings
+from benchmarks.common import Timer, get_client, iter_product_batches, summarize
+
+# Secuencias típicas de la caja de búsqueda (una consulta por tecla)
+QUERIES = ["m", "ma", "man", "manz", "manza", "papa", "papa cri", "org", "fresco mango", "albahaca"]
+
+
+async def seed(db, n: int) -> None:
+    await db.products.drop()
+    for batch in iter_product_batches(n):
+        await db.products.insert_many(batch, ordered=False)
+    await sync_indexes(db, collections=["products"])
+
+
+async def run_queries(db, backend: str, repeat: int) -> dict:
+    settings.SEARCH_BACKEND = backend
+    samples = []
+    for _ in range(repeat):
+        for query in QUERIES:
+            with Timer() as t:
+                await product_service.get_all_products(db, search=query, limit=20)
+            samples.append(t.elapsed)
+    return summarize(samples)
+
+
+async def main(sizes, repeat: int, keep: bool) -> None:
+    client = get_client()
+    original_backend = settings.SEARCH_BACKEND
+    try:
+        print(f"{'productos':>10} {'backend':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for n in sizes:
+            db = client[f"bench_search_{n}"]
+            await seed(db, n)
+            for backend in ("regex", "keywords"):
+                stats = await run_queries(db, backend, repeat)
+                print(f"{n:>10} {backend:>9} {stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}")
+            if not keep:
+                await client.drop_database(db.name)
+    finally:
+        settings.SEARCH_BACKEND = original_backend
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=5, help="repeticiones de la secuencia de consultas")
+    parser.add_argument("--keep", action="store_true", help="no eliminar las bases sembradas")
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.repeat, args.keep))
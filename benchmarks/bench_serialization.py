@@ -0,0 +1,73 @@
+# products_service/benchmarks/bench_serialization.py
+"""
+Serialización de una página del listado: camino Pydantic (`ProductInDB` +
+`ProductPage.model_dump_json`, como en el router) contra `fast_json`
+(documentos de Motor directo a orjson).
+
+No necesita MongoDB; los documentos se generan en memoria con la misma forma
+que devuelve `get_all_products` (tras `PRODUCT_PROJECTION`).
+
+    python -m benchmarks.bench_serialization --page-sizes 10 25 50 100 --repeat 2000
+
+Antes de medir se comprueba que ambos caminos producen exactamente los mismos bytes.
+"""
+import argparse
+import random
+from datetime import datetime
+
+from bson import ObjectId
+
+from app import fast_json
+from app.product_service import INTERNAL_FIELDS
+from benchmarks.common import Timer, make_product
+from common.models import ProductInDB, ProductPage
+
+
+def make_docs(n: int, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    docs = []
+    for _ in range(n):
+        doc = make_product(rng, ObjectId())
+        for field in INTERNAL_FIELDS:
+            doc.pop(field, None)
+        doc["version"] = rng.randint(1, 20)
+        doc["updated_at"] = datetime(2025, 1, 1, 12, 30, rng.randint(0, 59), rng.randint(0, 999) * 1000)
+        docs.append(doc)
+    return docs
+
+
+def pydantic_page(docs: list) -> bytes:
+    products = [ProductInDB(**doc) for doc in docs]
+    return ProductPage(
+        total=1000, products=[p.model_dump(by_alias=True) for p in products], next_cursor="abc"
+    ).model_dump_json(by_alias=True).encode()
+
+
+def fast_page(docs: list) -> bytes:
+    return fast_json.dumps_product_page(1000, docs, "abc")
+
+
+def run(page_size: int, repeat: int) -> dict:
+    docs = make_docs(page_size)
+    if pydantic_page(docs) != fast_page(docs):
+        raise SystemExit(f"Las salidas difieren para páginas de {page_size}")
+    stats = {"page_size": page_size}
+    for label, serialize in (("pydantic", pydantic_page), ("fast_json", fast_page)):
+        with Timer() as t:
+            for _ in range(repeat):
+                serialize(docs)
+        stats[f"{label}_us"] = round(t.elapsed / repeat * 1e6, 1)
+    stats["speedup"] = round(stats["pydantic_us"] / stats["fast_json_us"], 1)
+    return stats
+
+
+def main(args) -> None:
+    for page_size in args.page_sizes:
+        print(run(page_size, args.repeat))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[10, 25, 50, 100])
+    parser.add_argument("--repeat", type=int, default=2000)
+    main(parser.parse_args())
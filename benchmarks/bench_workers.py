@@ -0,0 +1,124 @@
+# products_service/benchmarks/bench_workers.py
+"""
+Rendimiento según el número de workers de gunicorn (ver gunicorn.conf.py).
+
+Siembra una vez la base de `loadtest`, levanta el servicio con cada número de
+workers de `--workers`, lanza la misma mezcla de peticiones contra él y lo
+apaga con SIGTERM (drenando). Informa peticiones por segundo, p95 y la
+eficiencia del escalado respecto al primer número (1.0 = lineal).
+
+    python -m benchmarks.bench_workers --workers 1,2,4,8 --concurrency 64 --duration 20
+
+Requiere MongoDB (BENCH_MONGO_URI o MONGO_URI), gunicorn y uvicorn-worker.
+El cliente de carga corre en un solo proceso: con muchos workers puede ser él
+el cuello de botella (mirar su CPU); en ese caso, lanzarlo desde otra máquina
+con `loadtest --base-url`.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks import loadtest
+from benchmarks.common import BENCH_MONGO_URI, Timer, get_client
+
+DB_NAME = "bench_workers"
+
+
+async def _wait_ready(base_url: str, process: subprocess.Popen, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url, timeout=2) as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"gunicorn terminó con código {process.returncode}")
+            try:
+                if (await client.get("/")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"el servicio no respondió en {timeout:.0f}s")
+
+
+def _start(workers: int, port: int) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "MONGO_URI": BENCH_MONGO_URI,
+        "MONGO_DB_NAME": DB_NAME,
+        "WEB_WORKERS": str(workers),
+        "WEB_BIND": f"127.0.0.1:{port}",
+        "SYNC_INDEXES_ON_STARTUP": "false",
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL,
+    )
+
+
+def _stop(process: subprocess.Popen) -> None:
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def run(workers: int, catalog: loadtest.Catalog, args) -> dict:
+    base_url = f"http://127.0.0.1:{args.port}"
+    process = _start(workers, args.port)
+    try:
+        await _wait_ready(base_url, process, args.startup_timeout)
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+            # Calentamiento: pools de conexiones y cachés de cada worker
+            await loadtest.drive(client, loadtest.build_scenarios(catalog), loadtest.MIXES[args.mix],
+                                 args.concurrency, args.warmup, None, args.seed + 1)
+            result = await loadtest.drive(client, loadtest.build_scenarios(catalog), loadtest.MIXES[args.mix],
+                                          args.concurrency, args.duration, None, args.seed)
+    finally:
+        _stop(process)
+    return result["overall"]
+
+
+async def main(args) -> None:
+    counts = [int(value) for value in args.workers.split(",")]
+    mongo = get_client()
+    db = mongo[DB_NAME]
+    try:
+        with Timer() as t:
+            catalog = await loadtest.seed(db, args.products, args.users, args.ratings, seed=args.seed)
+        print(f"Sembrado en {t.elapsed:.1f}s ({BENCH_MONGO_URI}/{DB_NAME})")
+        print(f"{'workers':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'err':>6} {'escalado':>9}")
+        base_rps = None
+        for workers in counts:
+            stats = await run(workers, catalog, args)
+            if base_rps is None:
+                base_rps = stats["rps"] / counts[0]
+            efficiency = stats["rps"] / (base_rps * workers) if base_rps else 0.0
+            print(f"{workers:>7} {stats['rps']:>9} {stats['p50_ms']:>9} {stats['p95_ms']:>9} "
+                  f"{stats['errors']:>6} {efficiency:>9.2f}")
+    finally:
+        await mongo.drop_database(DB_NAME)
+        mongo.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4", help="números de workers separados por coma")
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--ratings", type=int, default=20_000)
+    parser.add_argument("--mix", choices=sorted(loadtest.MIXES), default="browse")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=20, help="segundos de carga por configuración")
+    parser.add_argument("--warmup", type=float, default=3, help="segundos de calentamiento")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--port", type=int, default=8091)
+    parser.add_argument("--startup-timeout", type=float, default=30)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,91 @@
+# products_service/benchmarks/common.py
+"""Utilidades compartidas por los benchmarks: conexión y datos sintéticos."""
+import os
+import random
+import statistics
+import time
+from typing import Iterator, List
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.search import build_search_keywords
+
+BENCH_MONGO_URI = os.getenv("BENCH_MONGO_URI", os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+
+CATEGORIES = ["Frutas", "Verduras", "Hortalizas", "Tubérculos", "Hierbas", "Granos"]
+WORDS = [
+    "manzana", "mango", "mandarina", "maracuyá", "mora", "melón", "papaya", "piña", "pera",
+    "plátano", "banano", "guayaba", "lulo", "fresa", "uva", "limón", "naranja", "tomate",
+    "cebolla", "zanahoria", "papa", "yuca", "ahuyama", "lechuga", "espinaca", "cilantro",
+    "perejil", "albahaca", "frijol", "lenteja", "maíz", "arveja", "orgánico", "fresco",
+    "criollo", "dulce", "maduro", "verde", "rojo", "amarillo", "campesino", "selecto",
+]
+
+
+def get_client() -> AsyncIOMotorClient:
+    return AsyncIOMotorClient(BENCH_MONGO_URI)
+
+
+def make_product(rng: random.Random, owner_id: ObjectId) -> dict:
+    name = " ".join(rng.sample(WORDS, 2)).capitalize()
+    description = " ".join(rng.choices(WORDS, k=rng.randint(5, 25)))
+    tags = rng.sample(WORDS, rng.randint(0, 3))
+    doc = {
+        "_id": ObjectId(),
+        "name": name,
+        "whatsapp_number": "573001234567",
+        "description": description,
+        "price": float(rng.randint(5, 500) * 100),
+        "currency": "COP",
+        "stock": rng.randint(0, 200),
+        "category": rng.choice(CATEGORIES),
+        "image_url": None,
+        "tags": tags,
+        "owner_id": owner_id,
+        "average_rating": 0.0,
+        "total_ratings": 0,
+    }
+    doc.update(build_search_keywords(name, description, tags))
+    return doc
+
+
+def iter_product_batches(n: int, batch_size: int = 10_000, seed: int = 42) -> Iterator[List[dict]]:
+    rng = random.Random(seed)
+    owners = [ObjectId() for _ in range(max(1, n // 100))]
+    batch = []
+    for _ in range(n):
+        batch.append(make_product(rng, rng.choice(owners)))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def percentile(samples: List[float], p: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def summarize(samples: List[float]) -> dict:
+    """Resumen en milisegundos de una lista de duraciones en segundos."""
+    return {
+        "n": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3) if samples else 0.0,
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
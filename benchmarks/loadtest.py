@@ -0,0 +1,282 @@
+# products_service/benchmarks/loadtest.py
+"""
+Prueba de carga reproducible de la API completa.
+
+Siembra una base de pruebas (productos, usuarios y calificaciones) y lanza
+clientes concurrentes contra la app ASGI de `app/main.py` (en el mismo proceso,
+vía httpx) o contra un servidor ya levantado (`--base-url`). Cada cliente elige
+la ruta según la mezcla (`--mix`) con una semilla fija, así que dos ejecuciones
+con los mismos parámetros hacen las mismas peticiones.
+
+    python -m benchmarks.loadtest --products 20000 --users 200 --ratings 50000 \\
+        --concurrency 50 --duration 30 --mix browse --save-baseline baseline.json
+    python -m benchmarks.loadtest ... --baseline baseline.json --threshold 0.2
+
+Informa por ruta p50/p95/p99 y peticiones por segundo. Con `--baseline` marca
+como regresión una ruta cuyo p95 empeore o cuyo rendimiento baje más de
+`--threshold` (20 % por defecto) y termina con código 1.
+
+La base se toma de BENCH_MONGO_URI (o MONGO_URI); hace falta un MongoDB real.
+Dependencias extra: `pip install -r benchmarks/requirements.txt`.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+import httpx
+from bson import ObjectId
+
+from benchmarks.common import BENCH_MONGO_URI, WORDS, Timer, get_client, iter_product_batches, summarize
+
+DB_NAME = "bench_loadtest"
+
+# Peso relativo de cada escenario en la mezcla
+MIXES: Dict[str, Dict[str, int]] = {
+    "browse": {
+        "list": 30, "list_search_sort": 20, "list_category": 10, "detail": 25,
+        "batch": 5, "ratings": 8, "rate": 1, "order": 1, "facets": 10, "top": 5,
+    },
+    "checkout": {
+        "list": 10, "detail": 30, "batch": 20, "order": 30, "rate": 10,
+    },
+    "writes": {
+        "detail": 20, "rate": 40, "order": 40,
+    },
+}
+
+
+class Catalog:
+    """Lo sembrado que necesitan los escenarios para armar peticiones."""
+
+    def __init__(self, product_ids: List[str], categories: List[str], tokens: List[str]):
+        self.product_ids = product_ids
+        self.categories = categories
+        self.tokens = tokens
+
+
+async def seed(db, products: int, users: int, ratings: int, seed: int = 42) -> Catalog:
+    from app.indexes import sync_indexes
+    from app.product_service import rebuild_facets, rebuild_top_rated
+    from app.security import create_access_token
+
+    rng = random.Random(seed)
+    for name in ("products", "users", "ratings", "orders"):
+        await db[name].drop()
+
+    product_ids, categories = [], set()
+    for batch in iter_product_batches(products, seed=seed):
+        for doc in batch:
+            doc.update(stock=1_000_000, rating_sum=0.0, version=1)
+            product_ids.append(doc["_id"])
+            categories.add(doc["category"])
+        await db.products.insert_many(batch, ordered=False)
+
+    user_ids = [ObjectId() for _ in range(users)]
+    await db.users.insert_many([
+        {"_id": uid, "email": f"bench{i}@example.com", "full_name": f"Bench {i}",
+         "hashed_password": "x", "is_active": True, "is_superuser": False}
+        for i, uid in enumerate(user_ids)
+    ])
+
+    # Una calificación por (producto, usuario), con los agregados ya calculados
+    pairs = set()
+    while len(pairs) < min(ratings, products * users):
+        pairs.add((rng.randrange(products), rng.randrange(users)))
+    aggregates = defaultdict(lambda: [0, 0])
+    rating_docs = []
+    for product_index, user_index in pairs:
+        value = rng.randint(1, 5)
+        rating_docs.append({"_id": ObjectId(), "product_id": product_ids[product_index],
+                            "user_id": user_ids[user_index], "rating": value, "comment": None})
+        aggregates[product_index][0] += value
+        aggregates[product_index][1] += 1
+        if len(rating_docs) >= 10_000:
+            await db.ratings.insert_many(rating_docs, ordered=False)
+            rating_docs = []
+    if rating_docs:
+        await db.ratings.insert_many(rating_docs, ordered=False)
+    for product_index, (total, count) in aggregates.items():
+        await db.products.update_one({"_id": product_ids[product_index]}, {"$set": {
+            "rating_sum": float(total), "total_ratings": count, "average_rating": round(total / count, 2)}})
+
+    await sync_indexes(db)
+    await rebuild_facets(db)
+    await rebuild_top_rated(db, rescore=True)
+    tokens = [create_access_token({"sub": str(uid)}) for uid in user_ids]
+    return Catalog([str(pid) for pid in product_ids], sorted(categories), tokens)
+
+
+def build_scenarios(catalog: Catalog) -> Dict[str, Callable[[random.Random], dict]]:
+    """Cada escenario devuelve los argumentos de `httpx.AsyncClient.request`."""
+    base = "/api/v1/products"
+
+    def auth(rng):
+        return {"Authorization": f"Bearer {rng.choice(catalog.tokens)}"}
+
+    return {
+        "list": lambda rng: {"method": "GET", "url": f"{base}/", "params": {"limit": 20}},
+        "list_search_sort": lambda rng: {"method": "GET", "url": f"{base}/", "params": {
+            "search": rng.choice(WORDS)[:rng.randint(2, 5)], "sort_by": rng.choice(["price_asc", "price_desc"]),
+            "limit": 20}},
+        "list_category": lambda rng: {"method": "GET", "url": f"{base}/", "params": {
+            "category": rng.choice(catalog.categories), "limit": 20, "fields": "name,price,image_url,average_rating"}},
+        "detail": lambda rng: {"method": "GET", "url": f"{base}/{rng.choice(catalog.product_ids)}"},
+        "facets": lambda rng: {"method": "GET", "url": f"{base}/facets"},
+        "top": lambda rng: {"method": "GET", "url": f"{base}/top", "params": {"category": rng.choice(catalog.categories)}},
+        "batch": lambda rng: {"method": "GET", "url": f"{base}/batch", "params": {
+            "ids": ",".join(rng.sample(catalog.product_ids, min(10, len(catalog.product_ids))))}},
+        "ratings": lambda rng: {"method": "GET", "url": f"{base}/{rng.choice(catalog.product_ids)}/ratings",
+                                "params": {"limit": 20}},
+        "rate": lambda rng: {"method": "POST", "url": f"{base}/{rng.choice(catalog.product_ids)}/ratings",
+                             "json": {"rating": rng.randint(1, 5)}, "headers": auth(rng)},
+        "order": lambda rng: {"method": "POST", "url": "/api/v1/orders/create", "headers": auth(rng), "json": {
+            "items": [{"product_id": pid, "quantity": 1, "price": 1000.0, "product_name": "bench"}
+                      for pid in rng.sample(catalog.product_ids, min(2, len(catalog.product_ids)))]}},
+    }
+
+
+async def drive(
+    client: httpx.AsyncClient,
+    scenarios: Dict[str, Callable[[random.Random], dict]],
+    mix: Dict[str, int],
+    concurrency: int,
+    duration: float,
+    max_requests: Optional[int],
+    seed: int,
+) -> dict:
+    names = [name for name in mix if name in scenarios]
+    weights = [mix[name] for name in names]
+    samples: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    sent = 0
+    deadline = time.monotonic() + duration
+
+    async def worker(index: int) -> None:
+        nonlocal sent
+        rng = random.Random(seed * 1000 + index)
+        while time.monotonic() < deadline and (max_requests is None or sent < max_requests):
+            sent += 1
+            name = rng.choices(names, weights)[0]
+            request = scenarios[name](rng)
+            with Timer() as t:
+                try:
+                    response = await client.request(**request)
+                    failed = response.status_code >= 400
+                except httpx.HTTPError:
+                    failed = True
+            samples[name].append(t.elapsed)
+            errors[name] += failed
+
+    with Timer() as total:
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+
+    routes = {}
+    for name in names:
+        if samples[name]:
+            routes[name] = {**summarize(samples[name]), "errors": errors[name],
+                            "rps": round(len(samples[name]) / total.elapsed, 1)}
+    all_samples = [s for values in samples.values() for s in values]
+    overall = {**summarize(all_samples), "errors": sum(errors.values()),
+               "rps": round(len(all_samples) / total.elapsed, 1)}
+    return {"routes": routes, "overall": overall}
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> List[str]:
+    """Rutas cuyo p95 subió o cuyo rendimiento bajó más de `threshold` respecto a la base."""
+    regressions = []
+    for name, stats in {**current["routes"], "overall": current["overall"]}.items():
+        before = baseline["routes"].get(name) if name != "overall" else baseline.get("overall")
+        if not before:
+            continue
+        if before["p95_ms"] and stats["p95_ms"] > before["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {before['p95_ms']} -> {stats['p95_ms']} ms")
+        if before["rps"] and stats["rps"] < before["rps"] * (1 - threshold):
+            regressions.append(f"{name}: rps {before['rps']} -> {stats['rps']}")
+    return regressions
+
+
+def print_report(result: dict) -> None:
+    print(f"{'ruta':<18} {'n':>7} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9}")
+    for name, stats in {**result["routes"], "TOTAL": result["overall"]}.items():
+        print(f"{name:<18} {stats['n']:>7} {stats['errors']:>5} {stats['p50_ms']:>9} "
+              f"{stats['p95_ms']:>9} {stats['p99_ms']:>9} {stats['rps']:>9}")
+
+
+def _make_client(args) -> httpx.AsyncClient:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    if args.base_url:
+        return httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=30)
+    from app.main import app
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest", timeout=30)
+
+
+async def main(args) -> int:
+    from app import cache, dependencies
+
+    mongo = get_client()
+    db = mongo[args.db_name]
+    try:
+        with Timer() as t:
+            catalog = await seed(db, args.products, args.users, args.ratings, seed=args.seed)
+        print(f"Sembrado en {t.elapsed:.1f}s: {args.products} productos, {args.users} usuarios, "
+              f"{args.ratings} calificaciones ({BENCH_MONGO_URI}/{args.db_name})")
+
+        # La app en proceso usa la base sembrada (sin pasar por el lifespan)
+        dependencies.mongo_client = mongo
+        dependencies.database_instance = db
+        if args.no_response_cache:
+            cache.response_cache.maxsize = 0
+
+        async with _make_client(args) as client:
+            result = await drive(client, build_scenarios(catalog), MIXES[args.mix], args.concurrency,
+                                 args.duration, args.requests, args.seed)
+        result["params"] = {k: v for k, v in vars(args).items() if k not in ("baseline", "save_baseline")}
+        print_report(result)
+
+        if args.save_baseline:
+            with open(args.save_baseline, "w", encoding="utf-8") as f:
+                json.dump(result, f, indent=2)
+            print(f"Línea base guardada en {args.save_baseline}")
+        if args.baseline:
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+            changed = [k for k in ("products", "users", "ratings", "mix", "concurrency")
+                       if baseline.get("params", {}).get(k) != result["params"][k]]
+            if changed:
+                print(f"⚠️ La línea base se tomó con otros parámetros ({', '.join(changed)}); la comparación es orientativa")
+            regressions = compare(result, baseline, args.threshold)
+            for line in regressions:
+                print(f"⚠️ Regresión: {line}")
+            if regressions:
+                return 1
+            print("Sin regresiones respecto a la línea base")
+        return 0
+    finally:
+        if not args.keep:
+            await mongo.drop_database(args.db_name)
+        mongo.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--ratings", type=int, default=20_000)
+    parser.add_argument("--mix", choices=sorted(MIXES), default="browse")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=20, help="segundos de carga")
+    parser.add_argument("--requests", type=int, default=None, help="detenerse tras N peticiones")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--base-url", default=None, help="servidor ya levantado (debe usar --db-name)")
+    parser.add_argument("--db-name", default=DB_NAME)
+    parser.add_argument("--no-response-cache", action="store_true", help="desactiva la caché de respuestas")
+    parser.add_argument("--baseline", default=None, help="JSON de una ejecución anterior para comparar")
+    parser.add_argument("--save-baseline", default=None, help="guarda el resultado como línea base")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--keep", action="store_true", help="no eliminar la base sembrada")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -1,8 +1,9 @@
 from bson import ObjectId
 from pydantic import BaseModel, Field, EmailStr, ConfigDict
-from typing import Optional, List
+from typing import Dict, Optional, List
 from pydantic_core import core_schema
 from typing import List
+from datetime import datetime
 
 class PyObjectId(ObjectId):
     @classmethod
@@ -54,6 +55,7 @@ class ProductBase(BaseModel):
     stock: int = Field(..., ge=0)
     category: str
     image_url: Optional[str] = None
+    image_variants: Optional[Dict[str, str]] = None  # p. ej. {"thumb": "/static/images/..._thumb.webp"}
     tags: Optional[List[str]] = None
     owner_id: Optional[PyObjectId] = None
     average_rating: Optional[float] = Field(default=0.0, ge=0, le=5)
@@ -70,13 +72,18 @@ class ProductUpdate(BaseModel):
     stock: Optional[int] = Field(None, ge=0)
     category: Optional[str] = None
     image_url: Optional[str] = None
+    image_variants: Optional[Dict[str, str]] = None
     tags: Optional[List[str]] = None
 
 class ProductInDB(DBModelMixin, ProductBase):
     owner_id: PyObjectId
+    version: int = 0  # Se incrementa con cada escritura; base del ETag
+    updated_at: Optional[datetime] = None
 
 class ProductRead(ProductBase):
     id: PyObjectId = Field(alias="_id")
+    version: int = 0
+    updated_at: Optional[datetime] = None
     model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True, json_encoders={ObjectId: str})
 
 class Token(BaseModel):
@@ -111,4 +118,69 @@ class RatingRead(RatingBase):
 
 class ProductPage(BaseModel):
     total: int
-    products: List[ProductRead]
\ No newline at end of file
+    products: List[ProductRead]
+    next_cursor: Optional[str] = None
+
+class ProductBatchRequest(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=100)
+    fields: Optional[str] = None
+
+class ProductBatch(BaseModel):
+    products: List[ProductRead]
+    missing: List[str] = []
+
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+class PriceRangeCount(BaseModel):
+    min: float
+    max: Optional[float] = None  # None = sin límite superior
+    count: int
+
+class AvailabilityCounts(BaseModel):
+    in_stock: int
+    out_of_stock: int
+
+class ProductFacets(BaseModel):
+    total: int
+    categories: List[FacetCount]
+    price_ranges: List[PriceRangeCount]
+    availability: AvailabilityCounts
+
+# Modelos para pedidos
+class OrderItem(BaseModel):
+    product_id: str
+    quantity: int = Field(..., gt=0)
+    price: float
+    product_name: str
+
+class OrderCreate(BaseModel):
+    items: List[OrderItem] = Field(..., min_length=1)
+    reservation_id: Optional[str] = None
+
+# Reservas temporales de stock para el checkout
+class ReservationItem(BaseModel):
+    product_id: str
+    quantity: int = Field(..., gt=0)
+
+class ReservationCreate(BaseModel):
+    items: List[ReservationItem] = Field(..., min_length=1, max_length=100)
+
+class ReservationRead(BaseModel):
+    id: str
+    items: List[ReservationItem]
+    status: str
+    expires_at: datetime
+
+class OrderSummary(BaseModel):
+    id: PyObjectId = Field(alias="_id")
+    total_amount: float
+    status: str
+    created_at: datetime
+    items_count: int = 0
+    model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True, json_encoders={ObjectId: str})
+
+class OrderPage(BaseModel):
+    orders: List[OrderSummary]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,41 @@
+# products_service/gunicorn.conf.py
+"""
+Modo producción: varios workers de uvicorn bajo gunicorn (Linux/macOS).
+
+    gunicorn -c gunicorn.conf.py
+    WEB_WORKERS=8 WEB_BIND=0.0.0.0:8001 gunicorn -c gunicorn.conf.py
+
+Los parámetros salen de app/config.py (WEB_*), así que también se pueden fijar
+en el .env. La app se precarga en el master y se hace fork de los workers;
+cada uno abre su cliente de MongoDB en el lifespan. Los índices se
+sincronizan una vez en el master, antes del fork. Con más de un worker el bus
+de invalidación es "capped" salvo que se elija "changestream"; un bus local
+("none", "memory") no arranca. Recargar sin cortar
+peticiones: `kill -HUP <pid del master>`; apagar drenando: `kill -TERM`.
+
+`/metrics` suma las métricas de todos los workers (modo multiproceso de
+prometheus_client, ver app/server.py).
+"""
+import multiprocessing
+
+from app import server
+
+server.prepare_metrics_dir()
+
+from app.config import settings  # noqa: E402
+
+wsgi_app = "app.main:app"
+bind = settings.WEB_BIND
+workers = settings.WEB_WORKERS or multiprocessing.cpu_count()
+worker_class = "app.server.UvicornWorker"
+preload_app = True
+graceful_timeout = settings.WEB_GRACEFUL_TIMEOUT_SECONDS
+timeout = settings.WEB_TIMEOUT_SECONDS
+keepalive = settings.WEB_KEEPALIVE_SECONDS
+max_requests = settings.WEB_MAX_REQUESTS
+max_requests_jitter = settings.WEB_MAX_REQUESTS_JITTER
+
+on_starting = server.sync_indexes_once
+child_exit = server.mark_worker_dead
+
+server.require_invalidation_bus(workers)
@@ -0,0 +1,116 @@
+"""
+Tareas de mantenimiento del servicio de productos.
+
+    python manage.py indexes sync [--drop-unknown]   # crea/reconstruye los índices declarados
+    python manage.py indexes report                  # explain() de las consultas; marca COLLSCAN
+    python manage.py ratings reconcile               # recalcula los agregados de calificación
+    python manage.py facets rebuild                  # recalcula los conteos de /products/facets
+    python manage.py top rebuild [--rescore]         # recalcula las listas "mejor calificados"
+    python manage.py migrate run [--dry-run] [--batch-size N] [--rate DOCS_S] [--target V]
+    python manage.py migrate status                  # estado de las migraciones de datos
+
+Usa MONGO_URI y MONGO_DB_NAME de la configuración del servicio (.env).
+"""
+import argparse
+import asyncio
+import sys
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.config import settings
+from app.indexes import explain_query_shapes, sync_indexes
+from app.migrations import MIGRATIONS, get_status, run_pending
+from app.product_service import rebuild_facets, rebuild_top_rated, reconcile_rating_aggregates
+
+
+async def indexes_sync(db, args) -> int:
+    failed = 0
+    for row in await sync_indexes(db, drop_unknown=args.drop_unknown):
+        print(f"{row['collection']:>10}.{row['index']:<28} {row['state']}")
+        failed += row["state"].startswith("error")
+    return 1 if failed else 0
+
+
+async def indexes_report(db, args) -> int:
+    collscans = 0
+    for row in await explain_query_shapes(db):
+        flag = "⚠️ COLLSCAN" if row["collscan"] else "ok"
+        print(f"{row['label']:<34} {' > '.join(row['stages']):<40} {flag}")
+        collscans += row["collscan"]
+    return 1 if collscans else 0
+
+
+async def ratings_reconcile(db, args) -> int:
+    repaired = await reconcile_rating_aggregates(db)
+    print(f"Productos con agregados de calificación corregidos: {repaired}")
+    return 0
+
+
+async def facets_rebuild(db, args) -> int:
+    counts = await rebuild_facets(db)
+    print(f"Facetas reconstruidas: {counts.get('total', 0)} productos, {len(counts)} valores")
+    return 0
+
+
+async def top_rebuild(db, args) -> int:
+    lists = await rebuild_top_rated(db, rescore=args.rescore)
+    print(f"Listas de mejor calificados reconstruidas: {lists}")
+    return 0
+
+
+async def migrate_run(db, args) -> int:
+    await run_pending(
+        db, MIGRATIONS, target=args.target, batch_size=args.batch_size, max_rate=args.rate, dry_run=args.dry_run
+    )
+    return 0
+
+
+async def migrate_status(db, args) -> int:
+    for row in await get_status(db, MIGRATIONS):
+        state = row.get("state", "pendiente")
+        detail = f"leídos={row['scanned']:,} modificados={row['modified']:,}" if "scanned" in row else ""
+        print(f"{row['version']:04d} {row['name']:<20} {state:<10} {detail}")
+    return 0
+
+
+async def main(args) -> int:
+    client = AsyncIOMotorClient(settings.MONGO_URI)
+    try:
+        return await args.handler(client[settings.MONGO_DB_NAME], args)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    groups = parser.add_subparsers(dest="group", required=True)
+
+    indexes = groups.add_parser("indexes").add_subparsers(dest="command", required=True)
+    sync = indexes.add_parser("sync", help="sincroniza los índices declarados en app/indexes.py")
+    sync.add_argument("--drop-unknown", action="store_true", help="elimina índices no declarados")
+    sync.set_defaults(handler=indexes_sync)
+    indexes.add_parser("report", help="informa qué consultas hacen COLLSCAN").set_defaults(handler=indexes_report)
+
+    ratings = groups.add_parser("ratings").add_subparsers(dest="command", required=True)
+    ratings.add_parser("reconcile", help="recalcula rating_sum/total_ratings/average_rating") \
+        .set_defaults(handler=ratings_reconcile)
+
+    facets = groups.add_parser("facets").add_subparsers(dest="command", required=True)
+    facets.add_parser("rebuild", help="recalcula product_facets desde la colección de productos") \
+        .set_defaults(handler=facets_rebuild)
+
+    top = groups.add_parser("top").add_subparsers(dest="command", required=True)
+    rebuild = top.add_parser("rebuild", help="recalcula las listas de mejor calificados por categoría")
+    rebuild.add_argument("--rescore", action="store_true", help="recalcula antes rating_score en todos los productos")
+    rebuild.set_defaults(handler=top_rebuild)
+
+    migrate = groups.add_parser("migrate").add_subparsers(dest="command", required=True)
+    run = migrate.add_parser("run", help="aplica (o reanuda) las migraciones pendientes")
+    run.add_argument("--dry-run", action="store_true", help="recorre y cuenta sin escribir")
+    run.add_argument("--batch-size", type=int, default=500)
+    run.add_argument("--rate", type=float, default=0, help="máximo de documentos por segundo (0 = sin límite)")
+    run.add_argument("--target", type=int, default=None, help="aplica solo hasta esta versión")
+    run.set_defaults(handler=migrate_run)
+    migrate.add_parser("status", help="muestra qué migraciones se aplicaron").set_defaults(handler=migrate_status)
+
+    sys.exit(asyncio.run(main(parser.parse_args())))
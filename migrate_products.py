@@ -1,60 +1,33 @@
 """
-Script para migrar productos existentes y agregar campos de calificación
-Ejecutar una sola vez después de implementar el sistema de calificaciones
+Script heredado para migrar los productos existentes.
+
+Se mantiene para quien lo tenga en sus procedimientos de despliegue: aplica
+las migraciones de datos pendientes (app/migrations/) y sincroniza los índices
+declarados. Equivale a `python manage.py migrate run` más
+`python manage.py indexes sync`, que son la forma recomendada.
 """
 import asyncio
+
 from motor.motor_asyncio import AsyncIOMotorClient
-import os
 
-# Configuración de la base de datos
-MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
-MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "products_db")
+from app.config import settings
+from app.indexes import sync_indexes
+from app.migrations import MIGRATIONS, run_pending
+
 
 async def migrate_products():
-    """Migra todos los productos existentes para agregar campos de calificación"""
-    
-    client = AsyncIOMotorClient(MONGO_URI)
-    db = client[MONGO_DB_NAME]
-    
+    client = AsyncIOMotorClient(settings.MONGO_URI)
+    db = client[settings.MONGO_DB_NAME]
     try:
-        # Actualizar todos los productos que no tienen los campos de calificación
-        result = await db.products.update_many(
-            {
-                "$or": [
-                    {"average_rating": {"$exists": False}},
-                    {"total_ratings": {"$exists": False}}
-                ]
-            },
-            {
-                "$set": {
-                    "average_rating": 0.0,
-                    "total_ratings": 0
-                }
-            }
-        )
-        
-        print(f"Productos actualizados: {result.modified_count}")
-        
-        # Verificar el resultado
-        products_count = await db.products.count_documents({})
-        products_with_rating = await db.products.count_documents({
-            "average_rating": {"$exists": True},
-            "total_ratings": {"$exists": True}
-        })
-        
-        print(f"Total de productos: {products_count}")
-        print(f"Productos con campos de calificación: {products_with_rating}")
-        
-        if products_count == products_with_rating:
-            print("✅ Migración completada exitosamente")
-        else:
-            print("⚠️ Algunos productos podrían no haberse migrado correctamente")
-            
-    except Exception as e:
-        print(f"❌ Error durante la migración: {e}")
+        await run_pending(db, MIGRATIONS)
+        failed = [row for row in await sync_indexes(db) if row["state"].startswith("error")]
+        for row in failed:
+            print(f"⚠️ Índice {row['collection']}.{row['index']}: {row['state']}")
+        print("✅ Migración completada exitosamente" if not failed else "⚠️ Migración completada con errores en los índices")
     finally:
         client.close()
 
+
 if __name__ == "__main__":
     print("Iniciando migración de productos...")
     asyncio.run(migrate_products())
@@ -0,0 +1,47 @@
+# products_service/tests/conftest.py
+"""
+Configuración común de las pruebas: `python -m pytest` desde la raíz del servicio.
+
+Las pruebas que usan `db` necesitan un MongoDB real (TEST_MONGO_URI, por
+defecto localhost) y se omiten si no responde; las de transacciones, además,
+un replica set. Cada prueba usa una base propia que se borra al terminar.
+"""
+import os
+import sys
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+
+TEST_MONGO_URI = os.getenv("TEST_MONGO_URI", "mongodb://localhost:27017")
+# Motivo por el que MongoDB no respondió, para no esperar el timeout en cada prueba
+_unavailable = None
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def db():
+    global _unavailable
+    if _unavailable:
+        pytest.skip(_unavailable)
+    client = AsyncIOMotorClient(TEST_MONGO_URI, serverSelectionTimeoutMS=1000)
+    try:
+        await client.admin.command("ping")
+    except Exception as e:
+        client.close()
+        _unavailable = f"MongoDB no disponible en {TEST_MONGO_URI}: {e}"
+        pytest.skip(_unavailable)
+    name = f"test_{uuid.uuid4().hex[:12]}"
+    try:
+        yield client[name]
+    finally:
+        await client.drop_database(name)
+        client.close()
+
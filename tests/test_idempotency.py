@@ -0,0 +1,46 @@
+# products_service/tests/test_idempotency.py
+"""Claves de idempotencia: reintentos, conflictos y reservas "pending" abandonadas."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import idempotency
+from app.idempotency import IDEMPOTENCY_COLLECTION, IdempotencyConflictError
+
+pytestmark = pytest.mark.anyio
+
+SCOPE = "user:cart-stock"
+
+
+async def test_retry_replays_the_stored_response(db):
+    assert await idempotency.begin(db, SCOPE, "k1", [{"delta": 1}]) is None
+    await idempotency.complete(db, SCOPE, "k1", 200, {"ok": True})
+    assert await idempotency.begin(db, SCOPE, "k1", [{"delta": 1}]) == {"status_code": 200, "body": {"ok": True}}
+
+
+async def test_same_key_with_another_payload_is_rejected(db):
+    await idempotency.begin(db, SCOPE, "k2", [{"delta": 1}])
+    with pytest.raises(IdempotencyConflictError) as raised:
+        await idempotency.begin(db, SCOPE, "k2", [{"delta": 2}])
+    assert raised.value.reason == "payload_mismatch"
+
+
+async def test_request_in_progress_blocks_retries_until_its_lease_expires(db):
+    await idempotency.begin(db, SCOPE, "k3", [{"delta": 1}])
+    with pytest.raises(IdempotencyConflictError) as raised:
+        await idempotency.begin(db, SCOPE, "k3", [{"delta": 1}])
+    assert raised.value.reason == "in_progress"
+
+    # La petición original cayó: su plazo vence y el siguiente reintento toma la clave
+    await db[IDEMPOTENCY_COLLECTION].update_one(
+        {"_id": f"{SCOPE}:k3"}, {"$set": {"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)}}
+    )
+    assert await idempotency.begin(db, SCOPE, "k3", [{"delta": 1}]) is None
+    with pytest.raises(IdempotencyConflictError):
+        await idempotency.begin(db, SCOPE, "k3", [{"delta": 1}])
+
+
+async def test_released_key_can_be_reused(db):
+    await idempotency.begin(db, SCOPE, "k4", [{"delta": 1}])
+    await idempotency.release(db, SCOPE, "k4")
+    assert await idempotency.begin(db, SCOPE, "k4", [{"delta": 1}]) is None
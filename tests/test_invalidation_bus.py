@@ -0,0 +1,141 @@
+# products_service/tests/test_invalidation_bus.py
+"""Lectura del bus "capped": posición por ancla, vuelta de la colección y errores del cursor."""
+import asyncio
+
+import pytest
+from bson import ObjectId
+
+from app import invalidation_bus
+from app.invalidation_bus import CappedCollectionBus
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeCursor:
+    """Cursor tailable: recorre la colección en orden de inserción y espera lo que llegue después."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.position = 0
+        self.alive = True
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.collection.fail:
+            self.collection.fail = False
+            raise RuntimeError("cursor invalidado")
+        if self.collection.kill:
+            self.collection.kill = False
+            self.alive = False
+            raise StopAsyncIteration
+        if self.position < len(self.collection.docs):
+            self.position += 1
+            return self.collection.docs[self.position - 1]
+        await asyncio.sleep(0.005)
+        raise StopAsyncIteration
+
+    async def close(self):
+        pass
+
+
+class FakeCappedCollection:
+    def __init__(self):
+        self.docs = []
+        self.kill = False
+        self.fail = False
+
+    def find(self, query, cursor_type=None):
+        return FakeCursor(self)
+
+    async def find_one(self, query, projection=None, sort=None):
+        if sort:
+            return self.docs[-1] if self.docs else None
+        return next((doc for doc in self.docs if doc["_id"] == query["_id"]), None)
+
+    def publish(self, name: str, oid: str) -> None:
+        self.docs.append({"_id": ObjectId(oid * 24), "kind": "product", "id": name})
+
+
+@pytest.fixture
+def bus(monkeypatch):
+    """Un `CappedCollectionBus` sobre la colección falsa que anota lo que entrega y cada resincronización."""
+    monkeypatch.setattr(invalidation_bus, "RETRY_DELAY_SECONDS", 0.01)
+    bus = CappedCollectionBus.__new__(CappedCollectionBus)
+    invalidation_bus.InvalidationBus.__init__(bus)
+    bus.collection = FakeCappedCollection()
+    bus.delivered, bus.resyncs = [], []
+    bus.deliver = lambda message: bus.delivered.append(message["id"])
+    bus.resync = bus.resyncs.append
+    return bus
+
+
+async def _until(condition) -> None:
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.005)
+    raise AssertionError("no se cumplió a tiempo")
+
+
+async def _tail(bus):
+    task = asyncio.create_task(bus._tail_loop())
+    await asyncio.sleep(0.02)
+    return task
+
+
+async def _stop(task) -> None:
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+async def test_reads_in_insertion_order_and_resumes_after_the_anchor(bus):
+    collection = bus.collection
+    collection.publish("before_start", "f")
+    task = await _tail(bus)
+    # Los `_id` no siguen el orden de inserción: "b" tiene un `_id` menor que "a"
+    collection.publish("a", "e")
+    collection.publish("b", "1")
+    await _until(lambda: bus.delivered == ["a", "b"])
+
+    # El cursor muere (p. ej. tiempo de espera agotado): se retoma desde "b" sin repetir nada
+    collection.kill = True
+    collection.publish("c", "0")
+    await _until(lambda: bus.delivered == ["a", "b", "c"])
+    await asyncio.sleep(0.05)
+    await _stop(task)
+    assert bus.delivered == ["a", "b", "c"]
+    assert bus.resyncs == []
+
+
+async def test_missing_anchor_resyncs_and_reads_only_new_messages(bus):
+    collection = bus.collection
+    task = await _tail(bus)
+    collection.publish("a", "a")
+    await _until(lambda: bus.delivered == ["a"])
+
+    # La colección da la vuelta: el ancla ("a") ya no está y "b" se perdió
+    collection.docs = [{"_id": ObjectId("b" * 24), "kind": "product", "id": "b"}]
+    collection.kill = True
+    await _until(lambda: bus.resyncs == ["capped_wrapped"])
+    collection.publish("c", "c")
+    await _until(lambda: bus.delivered == ["a", "c"])
+    await _stop(task)
+
+
+async def test_cursor_error_takes_a_new_anchor_and_resyncs(bus):
+    collection = bus.collection
+    task = await _tail(bus)
+    collection.publish("a", "a")
+    await _until(lambda: bus.delivered == ["a"])
+
+    collection.fail = True
+    collection.publish("b", "b")
+    await _until(lambda: bus.resyncs == ["stream_error"])
+    collection.publish("c", "c")
+    await _until(lambda: bus.delivered[-1:] == ["c"])
+    await asyncio.sleep(0.05)
+    await _stop(task)
+    # "b" pudo llegar antes del error o cubrirla la resincronización, pero nunca se repite nada
+    assert bus.delivered in (["a", "c"], ["a", "b", "c"])
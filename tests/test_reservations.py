@@ -0,0 +1,107 @@
+# products_service/tests/test_reservations.py
+"""Reservas de stock: cancelación, barrido de vencidas y liberaciones que quedaron a medias."""
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app import reservation_service
+from app.config import settings
+from app.product_service import PRODUCT_COLLECTION, RELEASED_HOLDS_FIELD
+from app.reservation_service import RESERVATION_COLLECTION
+
+pytestmark = pytest.mark.anyio
+
+USER_ID = ObjectId()
+
+
+async def _product(db, stock: int) -> ObjectId:
+    product_id = ObjectId()
+    await db[PRODUCT_COLLECTION].insert_one(
+        {"_id": product_id, "name": "p", "price": 1.0, "stock": stock, "in_stock": stock > 0, "version": 1}
+    )
+    return product_id
+
+
+async def _stock(db, product_id: ObjectId) -> int:
+    return (await db[PRODUCT_COLLECTION].find_one({"_id": product_id}))["stock"]
+
+
+async def _reserve(db, product_id: ObjectId, quantity: int, ttl_seconds: float = 600) -> dict:
+    return await reservation_service.create_reservation(
+        db, USER_ID, [{"product_id": str(product_id), "quantity": quantity}], ttl_seconds=ttl_seconds
+    )
+
+
+async def _abandon(db, reservation: dict, claimed_seconds_ago: float, release_as: str = "expired") -> None:
+    """Deja la reserva como si su proceso hubiera caído justo después de reclamarla."""
+    await db[RESERVATION_COLLECTION].update_one({"_id": reservation["_id"]}, {"$set": {
+        "status": "releasing", "release_as": release_as, "sweep_token": "crashed",
+        "claimed_at": datetime.utcnow() - timedelta(seconds=claimed_seconds_ago),
+    }})
+
+
+async def _status(db, reservation: dict) -> str:
+    return (await db[RESERVATION_COLLECTION].find_one({"_id": reservation["_id"]}))["status"]
+
+
+async def test_release_returns_the_stock(db):
+    product_id = await _product(db, 5)
+    reservation = await _reserve(db, product_id, 3)
+    assert await _stock(db, product_id) == 2
+
+    released = await reservation_service.release_reservation(db, str(reservation["_id"]), USER_ID)
+    assert released["status"] == "released"
+    assert await _stock(db, product_id) == 5
+    with pytest.raises(reservation_service.ReservationError):
+        await reservation_service.release_reservation(db, str(reservation["_id"]), USER_ID)
+    assert await _stock(db, product_id) == 5
+
+
+async def test_sweep_releases_only_expired_reservations(db):
+    product_id = await _product(db, 5)
+    expired = await _reserve(db, product_id, 2, ttl_seconds=-1)
+    active = await _reserve(db, product_id, 1)
+    assert await _stock(db, product_id) == 2
+
+    assert await reservation_service.sweep_expired(db) == 1
+    assert await _stock(db, product_id) == 4
+    assert await _status(db, expired) == "expired"
+    assert await _status(db, active) == "active"
+    assert await reservation_service.sweep_expired(db) == 0
+
+
+async def test_sweep_reclaims_a_stale_release(db):
+    product_id = await _product(db, 5)
+    reservation = await _reserve(db, product_id, 3)
+    await _abandon(db, reservation, settings.RESERVATION_RELEASE_TIMEOUT_SECONDS + 1, release_as="released")
+
+    assert await reservation_service.sweep_expired(db) == 1
+    assert await _stock(db, product_id) == 5
+    assert await _status(db, reservation) == "released"
+
+
+async def test_sweep_leaves_a_recent_release_to_its_worker(db):
+    product_id = await _product(db, 5)
+    reservation = await _reserve(db, product_id, 3)
+    await _abandon(db, reservation, 0)
+
+    assert await reservation_service.sweep_expired(db) == 0
+    assert await _stock(db, product_id) == 2
+    assert await _status(db, reservation) == "releasing"
+
+
+async def test_reclaim_does_not_return_the_stock_twice(db):
+    product_id = await _product(db, 5)
+    reservation = await _reserve(db, product_id, 3)
+    await _abandon(db, reservation, settings.RESERVATION_RELEASE_TIMEOUT_SECONDS + 1)
+    # El proceso cayó después de devolver el stock y antes de marcar la reserva
+    await db[PRODUCT_COLLECTION].update_one(
+        {"_id": product_id}, {"$inc": {"stock": 3}, "$push": {RELEASED_HOLDS_FIELD: reservation["_id"]}}
+    )
+
+    assert await reservation_service.sweep_expired(db) == 1
+    product = await db[PRODUCT_COLLECTION].find_one({"_id": product_id})
+    assert product["stock"] == 5
+    assert product[RELEASED_HOLDS_FIELD] == []
+    assert await _status(db, reservation) == "expired"
@@ -0,0 +1,28 @@
+# products_service/tests/test_search.py
+from app.search import MIN_PREFIX_LENGTH, build_search_keywords, parse_search, ranked_terms, relevance_stage, search_filter
+
+
+def test_keywords_are_normalized_prefixes():
+    keywords = build_search_keywords("Piña Golden", "dulce", ["tropical"])
+    assert "pi" in keywords["search_keywords"]
+    assert "pina" in keywords["search_keywords"]
+    assert "dulce" in keywords["search_keywords"]
+    assert "^pi" in keywords["name_keywords"]
+    assert all(len(k.lstrip("^")) >= MIN_PREFIX_LENGTH for k in keywords["name_keywords"])
+
+
+def test_short_terms_still_filter():
+    terms = parse_search("a")
+    assert terms == ["a"]
+    assert search_filter(terms) == {"search_keywords": {"$regex": "^a"}}
+    assert ranked_terms(terms) == []
+
+
+def test_mixed_terms_filter_on_both_and_rank_on_long_ones():
+    terms = parse_search("Piña a")
+    assert search_filter(terms) == {"$and": [
+        {"search_keywords": {"$all": ["pina"]}},
+        {"search_keywords": {"$regex": "^a"}},
+    ]}
+    assert ranked_terms(terms) == ["pina"]
+    assert "^pina" in str(relevance_stage(ranked_terms(terms)))
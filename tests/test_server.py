@@ -0,0 +1,38 @@
+# products_service/tests/test_server.py
+"""Bus de invalidación obligatorio con varios workers de gunicorn."""
+import pytest
+
+from app import server
+from app.config import Settings
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    def make(**values):
+        configured = Settings(**values)
+        monkeypatch.setattr(server, "settings", configured)
+        return configured
+    return make
+
+
+def test_default_bus_becomes_capped_with_several_workers(settings, monkeypatch):
+    monkeypatch.delenv("INVALIDATION_BUS_BACKEND", raising=False)
+    configured = settings()
+    server.require_invalidation_bus(4)
+    assert configured.INVALIDATION_BUS_BACKEND == "capped"
+
+
+@pytest.mark.parametrize("backend", ["none", "memory"])
+def test_explicit_local_bus_refuses_several_workers(settings, backend):
+    settings(INVALIDATION_BUS_BACKEND=backend)
+    with pytest.raises(SystemExit):
+        server.require_invalidation_bus(2)
+
+
+def test_single_worker_and_shared_buses_are_left_alone(settings):
+    configured = settings(INVALIDATION_BUS_BACKEND="none")
+    server.require_invalidation_bus(1)
+    assert configured.INVALIDATION_BUS_BACKEND == "none"
+    configured = settings(INVALIDATION_BUS_BACKEND="changestream")
+    server.require_invalidation_bus(8)
+    assert configured.INVALIDATION_BUS_BACKEND == "changestream"
@@ -0,0 +1,88 @@
+# products_service/tests/test_stock.py
+"""Cambios de stock condicionados (`apply_stock_changes`): sobreventa, conflictos y productos inexistentes."""
+import asyncio
+
+import pytest
+from bson import ObjectId
+
+from app.product_service import PRODUCT_COLLECTION, StockChangeError, apply_stock_changes, supports_transactions
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(params=[pytest.param(False, id="compensated"), pytest.param(True, id="transaction")])
+def mode(request, db):
+    """`(db, use_transaction)`: cada prueba corre con compensación y, si hay replica set, con transacción."""
+    if request.param and not supports_transactions(db):
+        pytest.skip("las transacciones necesitan un replica set")
+    return db, request.param
+
+
+async def _product(db, stock: int) -> ObjectId:
+    product_id = ObjectId()
+    await db[PRODUCT_COLLECTION].insert_one({"_id": product_id, "name": "p", "price": 1.0, "stock": stock, "version": 1})
+    return product_id
+
+
+async def _stock(db, product_id: ObjectId) -> int:
+    return (await db[PRODUCT_COLLECTION].find_one({"_id": product_id}))["stock"]
+
+
+async def test_concurrent_buyers_never_oversell(mode):
+    db, use_transaction = mode
+    product_id = await _product(db, 5)
+
+    async def buy():
+        try:
+            await apply_stock_changes(db, [(product_id, -1)], use_transaction=use_transaction)
+            return True
+        except StockChangeError:
+            return False
+
+    sold = sum(await asyncio.gather(*(buy() for _ in range(20))))
+    assert sold == 5
+    assert await _stock(db, product_id) == 0
+
+
+async def test_insufficient_stock_reverts_the_whole_batch(mode):
+    db, use_transaction = mode
+    first, second = await _product(db, 10), await _product(db, 1)
+    with pytest.raises(StockChangeError) as raised:
+        await apply_stock_changes(db, [(first, -3), (second, -2)], use_transaction=use_transaction)
+    assert (raised.value.index, raised.value.reason, raised.value.available) == (1, "insufficient_stock", 1)
+    assert await _stock(db, first) == 10
+    assert await _stock(db, second) == 1
+
+
+async def test_expected_stock_mismatch_is_a_conflict(mode):
+    db, use_transaction = mode
+    first, second = await _product(db, 4), await _product(db, 7)
+    with pytest.raises(StockChangeError) as raised:
+        await apply_stock_changes(db, [(first, 1), (second, 3, 6)], use_transaction=use_transaction)
+    assert (raised.value.index, raised.value.reason) == (1, "conflict")
+    assert await _stock(db, first) == 4
+    assert await _stock(db, second) == 7
+
+    await apply_stock_changes(db, [(second, 3, 7)], use_transaction=use_transaction)
+    assert await _stock(db, second) == 10
+
+
+async def test_unknown_product_creates_nothing(mode):
+    db, use_transaction = mode
+    known, unknown = await _product(db, 5), ObjectId()
+    with pytest.raises(StockChangeError) as raised:
+        await apply_stock_changes(db, [(known, -2), (unknown, -1)], use_transaction=use_transaction)
+    assert (raised.value.index, raised.value.reason) == (1, "not_found")
+    assert await _stock(db, known) == 5
+    assert await db[PRODUCT_COLLECTION].count_documents({}) == 1
+
+
+async def test_repeated_product_applies_in_order(mode):
+    db, use_transaction = mode
+    product_id = await _product(db, 3)
+    await apply_stock_changes(db, [(product_id, -2), (product_id, 5, 1)], use_transaction=use_transaction)
+    assert await _stock(db, product_id) == 6
+    with pytest.raises(StockChangeError) as raised:
+        await apply_stock_changes(db, [(product_id, -4), (product_id, -4)], use_transaction=use_transaction)
+    assert (raised.value.index, raised.value.reason, raised.value.available) == (1, "insufficient_stock", 2)
+    assert await _stock(db, product_id) == 6